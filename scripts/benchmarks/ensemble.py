@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Compare the training of an ensemble of replicas with the training of separate models.
+
+Reports the training time per epoch of a single model, of the replicas trained
+one after the other, and of the ensemble trained with and without the
+multi-tensor (``foreach``) optimizer.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from swan.dataset import FingerprintsData
+from swan.modeller import EnsembleModeller, TorchModeller
+from swan.modeller.models import FingerprintEnsemble, FingerprintFullyConnected
+
+PATH_DATA = Path(__file__).parents[2] / "tests" / "files" / "thousand.csv"
+
+
+def train(modeller: TorchModeller, epochs: int, batch_size: int, workdir: Path, **kwargs) -> float:
+    """Train the model and return the time per epoch."""
+    modeller.workdir = workdir
+    modeller.set_optimizer("Adam", lr=1e-3, **kwargs)
+    modeller.set_scheduler(None)
+    np.random.seed(42)
+    start = time.perf_counter()
+    modeller.train_model(nepoch=epochs, batch_size=batch_size)
+    return (time.perf_counter() - start) / epochs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-i", "--data", default=PATH_DATA, help="csv file with the smiles and the property")
+    parser.add_argument("-p", "--property", default="Hardness (eta)", help="Property to fit")
+    parser.add_argument("-n", "--replicas", type=int, default=10, help="Number of replicas")
+    parser.add_argument("-e", "--epochs", type=int, default=5, help="Number of epochs")
+    parser.add_argument("-b", "--batch_size", type=int, default=64, help="Size of the minibatches")
+    args = parser.parse_args()
+
+    data = FingerprintsData(args.data, properties=[args.property], sanitize=False)
+    data.scale_labels()
+    with tempfile.TemporaryDirectory() as workdir:
+        single = train(TorchModeller(FingerprintFullyConnected(), data, replace_state=True),
+                       args.epochs, args.batch_size, Path(workdir))
+        print(f"{'single model':<30} {single:>8.3f} s/epoch")
+        print(f"{f'{args.replicas} separate models':<30} {args.replicas * single:>8.3f} s/epoch")
+        for foreach in (False, True):
+            network = FingerprintEnsemble(args.replicas)
+            modeller = EnsembleModeller(network, data, replace_state=True)
+            if "foreach" not in modeller.optimizer.defaults and foreach:
+                print(f"The optimizers of torch {torch.__version__} have no foreach implementation")
+                continue
+            elapsed = train(modeller, args.epochs, args.batch_size, Path(workdir), foreach=foreach)
+            name = f"ensemble ({'foreach' if foreach else 'for-loop'})"
+            print(f"{name:<30} {elapsed:>8.3f} s/epoch")
+
+
+if __name__ == "__main__":
+    main()
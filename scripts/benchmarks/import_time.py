@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""Measure how long it takes to import swan in a fresh interpreter.
+
+Each statement is run several times in a new process, reporting the best and
+median wall time together with the heavy backends that were loaded.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+STATEMENTS = ("import swan", "from swan.dataset import FingerprintsData")
+
+#: Optional backends that only some models need
+BACKENDS = ("dgl", "torch_geometric", "e3nn", "equivariant_attention", "gpytorch", "mendeleev")
+
+REPORT = "import sys; print(' '.join(m for m in {} if m in sys.modules))"
+
+
+def time_statement(statement: str, repeat: int) -> Tuple[List[float], str]:
+    """Run ``statement`` in ``repeat`` new interpreters and return the times and loaded backends."""
+    command = [sys.executable, "-c", f"{statement}; {REPORT.format(BACKENDS)}"]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        times.append(time.perf_counter() - start)
+
+    return times, out.stdout.decode().strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="Number of runs for each statement")
+    parser.add_argument("statements", nargs="*", default=STATEMENTS, help="Statements to time")
+    args = parser.parse_args()
+
+    print(f"{'statement':<45} {'best (s)':>9} {'median (s)':>11}  backends")
+    for statement in args.statements:
+        times, backends = time_statement(statement, args.repeat)
+        print(f"{statement:<45} {min(times):>9.3f} {statistics.median(times):>11.3f}  {backends or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""Compare the training in full precision and with bfloat16 autocast.
+
+Each model is trained with the same seed in ``float32`` and in mixed precision,
+reporting the training time per epoch, the inference throughput and the mean
+absolute error of the validation set, in the units of the property.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import torch
+
+from swan.dataset import FingerprintsData, TorchGeometricGraphData
+from swan.modeller import TorchModeller
+from swan.modeller.models import MPNN, FingerprintFullyConnected, InvariantPolynomial
+
+PATH_DATA = Path(__file__).parents[2] / "tests" / "files" / "thousand.csv"
+
+#: Data and network of each model
+MODELS = {
+    "FingerprintFullyConnected": (FingerprintsData, FingerprintFullyConnected),
+    "MPNN": (TorchGeometricGraphData, MPNN),
+    "InvariantPolynomial": (TorchGeometricGraphData, InvariantPolynomial),
+}  # type: Dict[str, Any]
+
+
+def run_model(data: Any, network: Callable[[], torch.nn.Module], dtype: Optional[torch.dtype],
+              epochs: int, batch_size: int, workdir: Path) -> Dict[str, float]:
+    """Train and evaluate a model with the mixed precision ``dtype``."""
+    torch.manual_seed(42)
+    np.random.seed(42)
+    modeller = TorchModeller(network(), data, replace_state=True)
+    modeller.workdir = workdir
+    modeller.set_optimizer("Adam", lr=1e-3)
+    modeller.set_mixed_precision(dtype)
+
+    start = time.perf_counter()
+    modeller.train_model(nepoch=epochs, batch_size=batch_size)
+    train_time = (time.perf_counter() - start) / epochs
+
+    predicted, expected = modeller.validate_model()
+
+    loader = data.create_prediction_loader(batch_size=batch_size)
+    start = time.perf_counter()
+    modeller.predict(loader)
+    throughput = len(data.dataset) / (time.perf_counter() - start)
+
+    return {"epoch (s)": train_time, "predict (mol/s)": throughput,
+            "MAE": float(np.abs(predicted - expected).mean())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-i", "--data", default=PATH_DATA, help="csv file with the smiles and the property")
+    parser.add_argument("-p", "--property", default="Hardness (eta)", help="Property to fit")
+    parser.add_argument("-e", "--epochs", type=int, default=5, help="Number of epochs")
+    parser.add_argument("-b", "--batch_size", type=int, default=64, help="Size of the minibatches")
+    parser.add_argument("models", nargs="*", default=list(MODELS), help="Models to compare")
+    args = parser.parse_args()
+
+    print(f"{'model':<27} {'precision':<10} {'epoch (s)':>10} {'predict (mol/s)':>16} {'MAE':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.models:
+            data_type, network = MODELS[name]
+            data = data_type(args.data, properties=[args.property])
+            data.scale_labels()
+            for dtype in (None, torch.bfloat16):
+                result = run_model(data, network, dtype, args.epochs, args.batch_size, Path(workdir))
+                precision = "float32" if dtype is None else "bfloat16"
+                print(f"{name:<27} {precision:<10} {result['epoch (s)']:>10.3f} "
+                      f"{result['predict (mol/s)']:>16.0f} {result['MAE']:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
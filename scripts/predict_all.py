@@ -129,15 +129,17 @@ def main():
     group.add_argument("-f", "--fingerprint", action="store_true")
     group.add_argument("-m", "--mpnn", action="store_true")
     group.add_argument("-s", "--se3transformer", action="store_true")
+    parser.add_argument("--store", type=Path, default=None,
+                        help="Folder where the features are shared between processes")
     args = parser.parse_args()
     if args.fingerprint:
-        data = FingerprintsData(PATH_DATA, sanitize=True)
+        data = FingerprintsData(PATH_DATA, sanitize=True, fingerprint_store=args.store)
         predictor = predict_fingerprints
     elif args.mpnn:
-        data = TorchGeometricGraphData(PATH_DATA, sanitize=True)
+        data = TorchGeometricGraphData(PATH_DATA, sanitize=True, graph_store=args.store)
         predictor = predict_MPNN
     else:
-        data = DGLGraphData(PATH_DATA, sanitize=True)
+        data = DGLGraphData(PATH_DATA, sanitize=True, graph_store=args.store)
         predictor = predict_SE3Transformer
 
     compute_statistics(args.workdir, args.output, predictor, data)
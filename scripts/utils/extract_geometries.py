@@ -9,10 +9,12 @@ import pandas as pd
 from dataCAT import PDBContainer
 from rdkit import Chem
 
+from swan.dataset.geometry import convert_json_geometries, write_geometries
+
 XYZ = List[Tuple[str, float, float, float]]
 
 
-def extract_data(files: List[str], csv_file: str):
+def extract_data(files: List[str], csv_file: str, output: str = "geometries"):
     """Extract geometries from the HDF5"""
     df = pd.read_csv(csv_file, index_col=0)
     data = {}
@@ -23,7 +25,10 @@ def extract_data(files: List[str], csv_file: str):
     # Search for the corresponding geometries
     smiles = df.smiles.to_list()
     geometries = [data[s] for s in smiles]
-    store_as_json_array(geometries)
+    if output.endswith(".json"):
+        store_as_json_array(geometries, output)
+    else:
+        write_geometries(output, geometries)
 
 
 def get_geometries(handler: h5py.File) -> Dict[str, List[Any]]:
@@ -49,8 +54,14 @@ def main():
     # configure logger
     parser.add_argument("-f", "--files", help="HDF5 files", nargs="+")
     parser.add_argument("-c", "--csv", help="CSV file with the smiles")
+    parser.add_argument("-o", "--output", default="geometries",
+                        help="Folder to store the geometries in binary format, or a JSON file")
+    parser.add_argument("-j", "--json", help="Convert an existing JSON file to the binary format")
     args = parser.parse_args()
-    extract_data(args.files, args.csv)
+    if args.json is not None:
+        convert_json_geometries(args.json, args.output)
+    else:
+        extract_data(args.files, args.csv, args.output)
 
 
 if __name__ == "__main__":
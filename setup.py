@@ -24,6 +24,7 @@ setup(
 
     package_dir={'swan': 'swan'},
     include_package_data=True,
+    package_data={'swan': ['dataset/features/elements.csv']},
     license="Apache Software License 2.0",
     zip_safe=False,
     classifiers=[
@@ -39,7 +40,7 @@ setup(
         'requests',
         'e3nn@git+https://github.com/e3nn/e3nn@main',
         'equivariant_attention@git+https://github.com/nlesc-nano/se3-transformer-public@dev',
-        'gpytorch', 'h5py', 'mendeleev', 'numpy', 'pandas', 'pyyaml', 'scikit-learn',
+        'gpytorch', 'h5py', 'numpy', 'pandas', 'pyyaml', 'scikit-learn',
         'scipy', 'seaborn', 'schema',
         'torch-geometric'
         ],
@@ -47,6 +48,7 @@ setup(
     extras_require={
         'test': ['coverage', 'mypy', 'pycodestyle', 'pytest>=3.9', 'pytest-cov',
                  'pytest-mock'],
+        'elements': ['mendeleev'],
         'doc': ['sphinx', 'sphinx-autodoc-typehints', 'sphinx_rtd_theme',
                 'nbsphinx']
     }
@@ -1,11 +1,26 @@
-"""Swan API."""
+"""Swan API.
+
+The data and model classes are imported when they are first used,
+so only the backends that are needed are loaded.
+"""
+from typing import TYPE_CHECKING
+
 from .__version__ import __version__
-from .dataset import DGLGraphData, FingerprintsData, TorchGeometricGraphData
-from .modeller import SKModeller, TorchModeller
-from .modeller.models import (MPNN, FingerprintFullyConnected, GaussianProcess,
-                              SE3Transformer)
+from .utils.lazy_imports import lazy_imports
+
+if TYPE_CHECKING:
+    from .dataset import DGLGraphData, FingerprintsData, TorchGeometricGraphData
+    from .modeller import SKModeller, TorchModeller
+    from .modeller.models import (MPNN, FingerprintFullyConnected, GaussianProcess,
+                                  SE3Transformer)
 
 __all__ = [
     "__version__", "TorchModeller", "SKModeller",
     "TorchGeometricGraphData", "FingerprintsData", "DGLGraphData",
     "FingerprintFullyConnected", "MPNN", "SE3Transformer", "GaussianProcess"]
+
+__getattr__, __dir__ = lazy_imports(__name__, {
+    "DGLGraphData": ".dataset", "FingerprintsData": ".dataset", "TorchGeometricGraphData": ".dataset",
+    "SKModeller": ".modeller", "TorchModeller": ".modeller",
+    "MPNN": ".modeller.models", "FingerprintFullyConnected": ".modeller.models",
+    "GaussianProcess": ".modeller.models", "SE3Transformer": ".modeller.models"})
@@ -1,6 +1,19 @@
-from .dgl_graph_data import DGLGraphData
-from .fingerprints_data import FingerprintsData
-from .splitter import split_dataset, load_split_dataset
-from .torch_geometric_graph_data import TorchGeometricGraphData
+from typing import TYPE_CHECKING
 
-__all__ = ["DGLGraphData", "FingerprintsData", "TorchGeometricGraphData", "load_split_dataset", "split_dataset"]
+from ..utils.lazy_imports import lazy_imports
+
+if TYPE_CHECKING:
+    from .dgl_graph_data import DGLGraphData
+    from .fingerprints_data import FingerprintsData
+    from .sharded_data import ShardedFingerprintsData, write_fingerprint_shards
+    from .splitter import split_dataset, load_split_dataset
+    from .torch_geometric_graph_data import TorchGeometricGraphData
+
+__all__ = ["DGLGraphData", "FingerprintsData", "ShardedFingerprintsData", "TorchGeometricGraphData",
+           "load_split_dataset", "split_dataset", "write_fingerprint_shards"]
+
+__getattr__, __dir__ = lazy_imports(__name__, {
+    "DGLGraphData": ".dgl_graph_data", "FingerprintsData": ".fingerprints_data",
+    "ShardedFingerprintsData": ".sharded_data", "write_fingerprint_shards": ".sharded_data",
+    "TorchGeometricGraphData": ".torch_geometric_graph_data",
+    "load_split_dataset": ".splitter", "split_dataset": ".splitter"})
@@ -0,0 +1,158 @@
+"""On-disk cache of the molecular features.
+
+The features are keyed by the canonical smiles of the molecules and by the
+configuration of the featurizer, so only the molecules that are new or whose
+configuration has changed must be computed. The molecules that could not be
+featurized are also recorded, so they are not tried again. Several processes
+can update the same cache, each of them adding its own segments.
+
+API
+---
+.. autoclass:: FeaturesCache
+
+"""
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+from rdkit import Chem
+
+from ..type_hints import PathLike
+from .storage import PackedArrays, store_lock, write_packed_arrays
+
+__all__ = ["FeaturesCache"]
+
+
+#: File listing the segments of a cache
+SEGMENTS = "segments.json"
+
+
+class FeaturesCache:
+    """Cache of the features computed for each molecule.
+
+    The features computed with a given configuration are stored in their own folder,
+    named after the hash of the configuration. Each update is appended to the folder
+    as a new segment, a :class:`~swan.dataset.storage.PackedArrays` store.
+    """
+
+    def __init__(self, path: PathLike, config: Dict[str, Any]) -> None:
+        """Open the cache.
+
+        Parameters
+        ----------
+        path
+            Folder where the cache is stored
+        config
+            JSON serializable configuration of the featurizer
+        """
+        self.config = config
+        key = json.dumps(config, sort_keys=True)
+        self.path = Path(path) / hashlib.sha1(key.encode()).hexdigest()
+        self.load()
+
+    def load(self) -> None:
+        """Map the stored segments and index their features by smiles."""
+        segments, failed = self.read_segments()
+        self.segments = []  # type: List[str]
+        self.stores = []  # type: List[PackedArrays]
+        self.offsets = [0]
+        self.index = {}  # type: Dict[str, int]
+        self.failed = set(failed)
+        for name in segments:
+            self.add_segment(name)
+
+    def read_segments(self) -> Tuple[List[str], List[str]]:
+        """Read the list of segments and of failed molecules."""
+        path_segments = self.path / SEGMENTS
+        if not path_segments.exists():
+            return [], []
+        with open(path_segments, 'r') as handler:
+            manifest = json.load(handler)
+        return manifest["segments"], manifest.get("failed", [])
+
+    def add_segment(self, name: str) -> None:
+        """Map the ``name`` segment and index its smiles after those of the previous segments."""
+        store = PackedArrays(self.path / name, mmap_mode='c')
+        start = self.offsets[-1]
+        self.index.update((smiles, start + i) for i, smiles in enumerate(store.data["smiles"]))
+        self.segments.append(name)
+        self.stores.append(store)
+        self.offsets.append(start + len(store))
+
+    def lookup(self, smiles: Sequence[str]) -> np.ndarray:
+        """Return the position of each smiles in the cache or -1 if it is not cached."""
+        return np.fromiter((self.index.get(s, -1) for s in smiles), dtype=np.int64, count=len(smiles))
+
+    def is_failed(self, smiles: Sequence[str]) -> np.ndarray:
+        """Check whether each smiles is known to fail the featurization."""
+        return np.fromiter((s in self.failed for s in smiles), dtype=bool, count=len(smiles))
+
+    def get(self, name: str, indices: Sequence[int]) -> List[np.ndarray]:
+        """Return the ``name`` features stored at ``indices``."""
+        segments = np.searchsorted(self.offsets, indices, side="right") - 1
+        return [self.stores[k].get(name, i - self.offsets[k]) for k, i in zip(segments, indices)]
+
+    @property
+    def fields(self) -> List[str]:
+        """Name of the cached features."""
+        return [] if not self.stores else [x for x in self.stores[0].fields if x != "smiles"]
+
+    def update(self, smiles: Sequence[str], features: Mapping[str, Sequence[np.ndarray]],
+               failed: Sequence[str] = ()) -> None:
+        """Add the features of new molecules to the cache.
+
+        Parameters
+        ----------
+        smiles
+            Canonical smiles of the molecules
+        features
+            Dictionary from the feature names to the features of each molecule
+        failed
+            Canonical smiles of the molecules that could not be featurized
+        """
+        new_failures = set(failed).difference(self.failed)
+        if len(smiles) == 0 and not new_failures:
+            return
+
+        new_segment = None
+        if len(smiles) > 0:
+            entries = {"smiles": [np.array([s]) for s in smiles]}
+            entries.update({name: list(values) for name, values in features.items()})
+            # Unique name, so the segments written by other processes are not replaced
+            new_segment = f"segment-{uuid.uuid4().hex}"
+            write_packed_arrays(self.path / new_segment, entries, metadata=self.config)
+
+        with store_lock(self.path / SEGMENTS):
+            # Merge the segments and failures added by other processes since the cache was loaded
+            segments, failed = self.read_segments()
+            known = set(self.segments)
+            for name in segments:
+                if name not in known:
+                    self.add_segment(name)
+            if new_segment is not None:
+                self.add_segment(new_segment)
+            self.failed.update(failed)
+            self.failed.update(new_failures)
+            self.write_segments()
+
+    def write_segments(self) -> None:
+        """Write the list of segments and of failed molecules, replacing the previous one at once."""
+        tmp = self.path / f"{SEGMENTS}.tmp-{os.getpid()}"
+        with open(tmp, 'w') as handler:
+            json.dump({"segments": self.segments, "failed": sorted(self.failed)}, handler)
+        os.replace(tmp, self.path / SEGMENTS)
+
+
+def canonical_smiles(mol: Chem.rdchem.Mol) -> str:
+    """Return the key of ``mol`` in the cache."""
+    return Chem.MolToSmiles(mol)
+
+
+def describe_file(path: PathLike) -> Dict[str, Any]:
+    """Identify a file by its path and modification time."""
+    path = Path(path).absolute()
+    return {"file": path.as_posix(), "mtime": os.stat(path).st_mtime_ns}
@@ -1,16 +1,34 @@
 """Base class for the Graph data representation."""
 
-from typing import List, Optional, Union
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Union
 
+import numpy as np
+import pandas as pd
+from torch.utils.data import DataLoader, Dataset, Subset
 
+from .cache import FeaturesCache, describe_file
+from .features.featurizer import GRAPH_FEATURES_VERSION
 from .geometry import guess_positions
-from .swan_data_base import SwanDataBase
+from .graph.molecular_graph import GRAPH_FEATURES, generate_graph_features_batch
+from .graph.lazy_graphs import LazyGraphs
+from .graph.packed_graphs import PackedGraphs
+from .samplers import BudgetBatchSampler
+from .storage import PackedArrays, store_lock
+from .swan_data_base import SwanDataBase, batch_data_loader
 from ..type_hints import PathLike
 
 
 __all__ = ["SwanGraphData"]
 
 
+class BatchBudget(NamedTuple):
+    """Options to group the graphs into minibatches by size."""
+    max_size: int                 # Maximum number of atoms or edges in a minibatch
+    by: str                       # Either ``atoms`` or ``edges``
+    bucket_size: Optional[int]    # Number of graphs sorted by size together
+    shuffle: bool                 # Shuffle the training graphs in each epoch
+
+
 class SwanGraphData(SwanDataBase):
     """Base class for the Data represented as graphs."""
 
@@ -19,7 +37,14 @@ class SwanGraphData(SwanDataBase):
                  properties: Optional[Union[str, List[str]]] = None,
                  sanitize: bool = True,
                  file_geometries: Optional[PathLike] = None,
-                 optimize_molecule: bool = False) -> None:
+                 optimize_molecule: bool = False,
+                 cache_dir: Optional[PathLike] = None,
+                 chunksize: Optional[int] = None,
+                 nworkers: int = 1,
+                 sanitize_options: Optional[Dict[str, Any]] = None,
+                 graph_store: Optional[PathLike] = None,
+                 lazy: bool = False,
+                 graph_cache_size: int = 4096) -> None:
         """Generate a dataset using graphs
 
         Parameters
@@ -34,20 +59,56 @@ class SwanGraphData(SwanDataBase):
             Path to a file with the geometries in PDB format
         optimize_molecule
             Perform a molecular optimization using a force field.
+        cache_dir
+            Folder used to cache the graph features between runs
+        chunksize
+            Read, sanitize and featurize the data in chunks of ``chunksize`` rows,
+            keeping only the graph features of each chunk. By default the whole
+            file is processed at once
+        nworkers
+            Number of processes used to generate the conformers
+        sanitize_options
+            Options used to generate the conformers in the sanitization (see :meth:`set_sanitize_options`)
+        graph_store
+            Folder where the graphs are stored as memory-mapped arrays. If it already
+            contains the graphs of the data, they are read from it instead of computing them,
+            so concurrent processes share a single copy of the graphs, whatever their ``properties``
+        lazy
+            Build each graph the first time it is requested instead of computing all of them
+            upfront. The molecules are still sanitized upfront if ``sanitize`` is ``True``
+        graph_cache_size
+            Maximum number of graphs kept in memory when ``lazy`` is ``True``
         """
         super().__init__()
 
-        # create the dataframe
-        self.dataframe = self.process_data(data_path,
-                                           file_geometries=file_geometries)
-
-        # clean the dataframe
-        self.clean_dataframe(sanitize=sanitize)
-
-        # Add positions if they don't exists in Dataframe
-        if "positions" not in self.dataframe:
-            self.dataframe["positions"] = guess_positions(
-                self.dataframe.molecules, optimize_molecule)
+        if lazy and any(x is not None for x in (cache_dir, chunksize, graph_store)):
+            msg = "The lazy graphs cannot be combined with cache_dir, chunksize or graph_store"
+            raise RuntimeError(msg)
+
+        self.nworkers = nworkers
+        self.set_sanitize_options(**(sanitize_options or {}))
+        self.optimize_molecule = optimize_molecule
+        self.batch_budget = None  # type: Optional[BatchBudget]
+        geometries = "rdkit" if file_geometries is None else describe_file(file_geometries)
+        config = {"features": "molecular_graph", "version": GRAPH_FEATURES_VERSION,
+                  "geometries": geometries, "optimize_molecule": optimize_molecule,
+                  "sanitize": sanitize, "sanitize_options": self.sanitize_options}
+        cache = None if cache_dir is None else FeaturesCache(cache_dir, config)
+
+        if lazy:
+            self.dataframe = self.process_data(data_path, file_geometries=file_geometries)
+            self.clean_dataframe(sanitize=sanitize)
+        elif graph_store is None:
+            features = self.process_graph_features(data_path, sanitize, file_geometries, chunksize, cache)
+        else:
+            # The first process computes the graphs, the others wait and read them
+            store_config = dict(config, data=describe_file(data_path))
+            with store_lock(graph_store):
+                if self.is_stored(graph_store, store_config):
+                    self.read_features_store(graph_store)
+                else:
+                    features = self.process_graph_features(data_path, sanitize, file_geometries, chunksize, cache)
+                    self.write_features_store(graph_store, features, store_config)
 
         # extract the labels from the dataframe
         if properties is not None:
@@ -55,16 +116,125 @@ class SwanGraphData(SwanDataBase):
             self.nlabels = self.labels.shape[1]
 
         # create the graphs
-        self.molecular_graphs = self.compute_graph()
+        if lazy:
+            molecules = self.dataframe["molecules"].to_list()
+            positions = self.dataframe["positions"].to_list() if "positions" in self.dataframe else None
+            self.molecular_graphs = LazyGraphs(
+                molecules, self.graph_from_features, self.labels, positions=positions,
+                optimize_molecule=optimize_molecule, cache_size=graph_cache_size)
+            self.graph_sizes = {"atoms": np.array([mol.GetNumAtoms() for mol in molecules], dtype=np.int64),
+                                "edges": np.array([2 * mol.GetNumBonds() for mol in molecules], dtype=np.int64)}
+        elif graph_store is None:
+            self.molecular_graphs = self.compute_graph(features)
+            self.graph_sizes = {"atoms": np.array([len(x) for x in features["positions"]], dtype=np.int64),
+                                "edges": np.array([len(x) for x in features["edges"]], dtype=np.int64)}
+        else:
+            store = PackedArrays(graph_store, mmap_mode='c')
+            self.molecular_graphs = PackedGraphs(store, self.graph_from_features, self.labels)
+            self.graph_sizes = {"atoms": np.diff(store.offsets["positions"]),
+                                "edges": np.diff(store.offsets["edges"])}
+
+    def process_graph_features(
+            self, data_path: PathLike, sanitize: bool, file_geometries: Optional[PathLike],
+            chunksize: Optional[int], cache: Optional[FeaturesCache]) -> Dict[str, List[np.ndarray]]:
+        """Read and clean the data and compute the arrays defining the graphs."""
+        # create the dataframe, either at once or in chunks
+        frames = []
+        features = {name: [] for name in GRAPH_FEATURES}  # type: Dict[str, List[np.ndarray]]
+        for dataframe in self.iter_data(data_path, file_geometries=file_geometries, chunksize=chunksize):
+            self.dataframe = dataframe
+            if cache is None:
+                # clean the dataframe
+                self.clean_dataframe(sanitize=sanitize)
+                chunk_features = self.compute_graph_features(self.dataframe)
+            else:
+                # Only clean and featurize the molecules missing in the cache
+                chunk_features = self.clean_and_featurize(sanitize, self.compute_graph_features, cache)
+
+            for name in GRAPH_FEATURES:
+                features[name].extend(chunk_features[name])
+
+            # Keep only the graph features of each chunk
+            if chunksize is not None:
+                self.dataframe = self.dataframe.drop(columns="molecules")
+            frames.append(self.dataframe)
+
+        self.dataframe = self.join_chunks(frames, data_path)
+
+        return features
+
+    def set_batch_budget(self, max_size: Optional[int], by: str = "atoms",
+                         bucket_size: Optional[int] = None, shuffle: bool = False) -> None:
+        """Group the graphs into minibatches with up to ``max_size`` atoms or edges.
+
+        The budget is used by the loaders created afterwards, instead of their ``batch_size``.
+
+        Parameters
+        ----------
+        max_size
+            Maximum number of atoms or edges in a minibatch, ``None`` batches by number of graphs
+        by
+            Either ``atoms`` or ``edges``
+        bucket_size
+            Number of training graphs sorted by size together (see :class:`~swan.dataset.samplers.BudgetBatchSampler`)
+        shuffle
+            Shuffle the training graphs in each epoch
+        """
+        if by not in self.graph_sizes:
+            msg = f"Unknown size of the graphs: {by}. Use one of: {list(self.graph_sizes)}"
+            raise RuntimeError(msg)
+        self.batch_budget = None if max_size is None else BatchBudget(max_size, by, bucket_size, shuffle)
+
+    def create_loader(self, dataset: Dataset, batch_size: int) -> DataLoader:
+        """Create the loader iterating over ``dataset`` in minibatches, using the budget if set."""
+        budget = self.batch_budget
+        if budget is None:
+            return super().create_loader(dataset, batch_size)
+
+        sizes = self.graph_sizes[budget.by]
+        if isinstance(dataset, Subset):
+            sizes = sizes[dataset.indices]
+        sampler = BudgetBatchSampler(sizes, budget.max_size, shuffle=budget.shuffle, bucket_size=budget.bucket_size)
+        return batch_data_loader(dataset, batch_sampler=sampler, **self.loader_options)
+
+    def create_prediction_loader(self, batch_size: int = 64) -> DataLoader:
+        """Create a loader iterating in order over the whole dataset, to predict it in minibatches."""
+        budget = self.batch_budget
+        if budget is None:
+            return super().create_prediction_loader(batch_size)
+
+        sampler = BudgetBatchSampler(self.graph_sizes[budget.by], budget.max_size)
+        return batch_data_loader(self.dataset, batch_sampler=sampler, **self.loader_options)
+
+    def compute_graph_features(self, dataframe: pd.DataFrame) -> Dict[str, List[np.ndarray]]:
+        """Compute the arrays defining the graph of each molecule in ``dataframe``."""
+        if len(dataframe) == 0:
+            return {name: [] for name in GRAPH_FEATURES}
+
+        # Guess the positions if they are not in the dataframe
+        if "positions" in dataframe:
+            positions = dataframe["positions"].to_list()
+        else:
+            positions = guess_positions(dataframe["molecules"], self.optimize_molecule, nworkers=self.nworkers)
+
+        return generate_graph_features_batch(dataframe["molecules"].to_list(), positions)
+
+    def compute_graph(self, features: Optional[Dict[str, Sequence[np.ndarray]]] = None):
+        """Computhe the graph representing the data.
+
+        Parameters
+        ----------
+        features
+            Precomputed arrays of each graph, by default they are computed from the dataframe
+        """
+        if features is None:
+            features = self.compute_graph_features(self.dataframe)
 
-    def compute_graph(self):
-        """Computhe the graph representing the data."""
         molecular_graphs = []
         for idx in range(len(self.dataframe)):
             labels = None if len(self.labels) == 0 else self.labels[idx]
-            gm = self.graph_creator(
-                self.dataframe["molecules"][idx],
-                self.dataframe["positions"][idx],
+            gm = self.graph_from_features(
+                {name: features[name][idx] for name in GRAPH_FEATURES},
                 labels=labels)
             molecular_graphs.append(gm)
 
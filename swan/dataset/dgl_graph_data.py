@@ -1,11 +1,13 @@
 """Interface to build a Dataset for DGL. see: https://www.dgl.ai/"""
-from typing import List, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import torch
 from torch.utils.data import DataLoader, Dataset
 
 from .data_graph_base import SwanGraphData
-from .graph.molecular_graph import create_molecular_dgl_graph
+from .graph.molecular_graph import dgl_batch_from_features, dgl_graph_from_features
+from .graph.packed_graphs import PackedGraphs
+from .swan_data_base import batch_data_loader, is_batch_index
 from ..type_hints import PathLike
 
 try:
@@ -38,7 +40,14 @@ class DGLGraphData(SwanGraphData):
                  properties: Optional[Union[str, List[str]]] = None,
                  sanitize: bool = True,
                  file_geometries: Optional[PathLike] = None,
-                 optimize_molecule: bool = False) -> None:
+                 optimize_molecule: bool = False,
+                 cache_dir: Optional[PathLike] = None,
+                 chunksize: Optional[int] = None,
+                 nworkers: int = 1,
+                 sanitize_options: Optional[Dict[str, Any]] = None,
+                 graph_store: Optional[PathLike] = None,
+                 lazy: bool = False,
+                 graph_cache_size: int = 4096) -> None:
         """Generate a dataset using graphs
 
         Parameters
@@ -53,18 +62,34 @@ class DGLGraphData(SwanGraphData):
             Path to a file with the geometries in PDB format
         optimize_molecule
             Perform a molecular optimization using a force field.
+        cache_dir
+            Folder used to cache the graph features between runs
+        chunksize
+            Process the data in chunks of ``chunksize`` rows
+        nworkers
+            Number of processes used to generate the conformers
+        sanitize_options
+            Options used to generate the conformers in the sanitization (see :meth:`set_sanitize_options`)
+        graph_store
+            Folder where the graphs are stored as memory-mapped arrays
+        lazy
+            Build each graph the first time it is requested
+        graph_cache_size
+            Maximum number of graphs kept in memory when ``lazy`` is ``True``
         """
-        self.graph_creator = create_molecular_dgl_graph
+        self.graph_from_features = dgl_graph_from_features
 
         super().__init__(
             data_path, properties=properties, sanitize=sanitize,
-            file_geometries=file_geometries, optimize_molecule=optimize_molecule)
+            file_geometries=file_geometries, optimize_molecule=optimize_molecule,
+            cache_dir=cache_dir, chunksize=chunksize, nworkers=nworkers,
+            sanitize_options=sanitize_options, graph_store=graph_store, lazy=lazy, graph_cache_size=graph_cache_size)
 
         # create the dataset
         self.dataset = DGLGraphDataset(self.molecular_graphs, self.labels)
 
-        # define the loader type
-        self.data_loader_fun = dgl_data_loader
+        # define the loader type, retrieving each minibatch as a single batched graph
+        self.data_loader_fun = batch_data_loader
 
     def get_item(self, batch_data: List[torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
         """get the data/ground truth of a minibatch
@@ -83,8 +108,15 @@ class DGLGraphData(SwanGraphData):
 
 
 class DGLGraphDataset(Dataset):
-    def __init__(self, molecular_graphs: List[dgl.DGLGraph], labels: torch.Tensor):
+    def __init__(self, molecular_graphs: Sequence[dgl.DGLGraph], labels: torch.Tensor):
         """Generate a dataset using graphs
+
+        Parameters
+        ----------
+        molecular_graphs
+            Sequence of graphs, either a list or a :class:`~swan.dataset.graph.packed_graphs.PackedGraphs`
+        labels
+            Ground truth of the graphs
         """
         super().__init__()
         self.molecular_graphs = molecular_graphs
@@ -94,8 +126,23 @@ class DGLGraphDataset(Dataset):
         """Return dataset length."""
         return len(self.molecular_graphs)
 
-    def __getitem__(self, idx: int) -> Tuple[dgl.DGLGraph, torch.Tensor]:
-        """Return the idx dataset element."""
+    def __getitem__(self, idx: Any) -> Tuple[dgl.DGLGraph, torch.Tensor]:
+        """Return the idx dataset element, or the minibatch of elements if ``idx`` is a list of indices."""
+        if is_batch_index(idx):
+            return self.get_batch(idx)
+
         label = None if len(self.labels) == 0 else self.labels[idx]
 
         return self.molecular_graphs[idx], label
+
+    def get_batch(self, indices: Sequence[int]) -> Tuple[dgl.DGLGraph, Optional[torch.Tensor]]:
+        """Return the graphs at ``indices`` batched together with their labels, like :func:`collate_fn`."""
+        graphs = self.molecular_graphs
+        if isinstance(graphs, PackedGraphs):
+            # Gather the arrays of all the graphs at once
+            batch = dgl_batch_from_features(*graphs.get_batch_features(indices))
+        else:
+            batch = dgl.batch([graphs[i] for i in indices])
+
+        labels = None if len(self.labels) == 0 else self.labels[indices].reshape(-1, 1)
+        return batch, labels
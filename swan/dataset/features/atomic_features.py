@@ -1,10 +1,25 @@
-"""Module to compute the atomic features."""
+"""Module to compute the atomic features.
+
+The properties of the elements are read from a table shipped with the package,
+which can be regenerated with :func:`write_element_table` if ``mendeleev`` is installed.
+"""
+
+import csv
+from pathlib import Path
+from typing import Dict
 
-import mendeleev
 import numpy as np
 from rdkit.Chem import rdchem
 
-__all__ = ["BONDS", "ELEMENTS", "dict_element_features", "compute_hybridization_index"]
+from ...type_hints import PathLike
+
+__all__ = ["BONDS", "ELEMENTS", "ELEMENT_PROPERTIES", "dict_element_features",
+           "compute_hybridization_index", "write_element_table"]
+
+#: Path to the table with the properties of the elements
+ELEMENT_TABLE = Path(__file__).parent / "elements.csv"
+#: Properties of each element in the table
+ELEMENT_COLUMNS = ("vdw_radius", "covalent_radius", "electronegativity")
 
 ELEMENTS = ["H", "B", "C", "N", "O", "F", "Si", "P", "S", "Cl", "Br", "I"]
 BONDS = [rdchem.BondType.SINGLE, rdchem.BondType.AROMATIC,
@@ -15,6 +30,52 @@ hybridization = {rdchem.HybridizationType.SP: 0,
                  rdchem.HybridizationType.SP3: 2}
 
 
+def read_element_table(path: PathLike = ELEMENT_TABLE) -> Dict[str, np.ndarray]:
+    """Read the properties of the elements.
+
+    Parameters
+    ----------
+    path
+        CSV file created by :func:`write_element_table`
+
+    Returns
+    -------
+    Dictionary from the symbols of the elements to an array with the
+    atomic number followed by the :data:`ELEMENT_COLUMNS`. Unknown properties are ``nan``
+
+    """
+    with open(path, 'r') as handler:
+        return {row["symbol"]: np.array([float(row[name]) if row[name] else np.nan
+                                         for name in ("atomic_number", *ELEMENT_COLUMNS)])
+                for row in csv.DictReader(handler)}
+
+
+def write_element_table(path: PathLike = ELEMENT_TABLE, max_atomic_number: int = 118) -> None:
+    """Compute the properties of the elements with ``mendeleev`` and store them.
+
+    Parameters
+    ----------
+    path
+        CSV file to write
+    max_atomic_number
+        Include the elements up to this atomic number
+
+    """
+    import mendeleev
+
+    with open(path, 'w', newline='') as handler:
+        writer = csv.writer(handler, lineterminator='\n')
+        writer.writerow(("atomic_number", "symbol", *ELEMENT_COLUMNS))
+        for atomic_number in range(1, max_atomic_number + 1):
+            el = mendeleev.element(atomic_number)
+            values = (el.vdw_radius, el.covalent_radius, el.electronegativity())
+            writer.writerow((atomic_number, el.symbol, *("" if x is None else repr(float(x)) for x in values)))
+
+
+#: Atomic number and properties of each element
+ELEMENT_PROPERTIES = read_element_table()
+
+
 def generate_atomic_features(symbol: str) -> np.ndarray:
     """Get the features for a single atom.
 
@@ -30,12 +91,10 @@ def generate_atomic_features(symbol: str) -> np.ndarray:
     """
     len_elements = len(ELEMENTS)
     features = np.zeros(len_elements + 3)
-    el = mendeleev.element(symbol)
     atom_type_index = ELEMENTS.index(symbol)
     features[atom_type_index] = 1  # Bondtype
-    features[len_elements] = el.vdw_radius  # Van der Waals radius
-    features[len_elements + 1] = el.covalent_radius
-    features[len_elements + 2] = el.electronegativity()
+    # Van der Waals radius, covalent radius and electronegativity
+    features[len_elements: len_elements + 3] = ELEMENT_PROPERTIES[symbol][1:]
 
     return features
 
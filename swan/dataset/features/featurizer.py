@@ -4,30 +4,50 @@ API
 ---
 .. autofunction:: compute_molecular_graph_edges
 .. autofunction:: generate_fingerprints
+.. autofunction:: get_fingerprint_generator
 .. autofunction:: generate_molecular_features
+.. autofunction:: generate_molecular_features_batch
+.. autofunction:: unpack_fingerprints
 
 """
 
-from itertools import chain
-from typing import Tuple
+import ctypes
+import multiprocessing
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from rdkit import Chem
-from rdkit.Chem import AllChem
+from rdkit.Chem import rdchem, rdFingerprintGenerator
 
 from .atomic_features import (BONDS, ELEMENTS, compute_hybridization_index,
-                              dict_element_features)
+                              dict_element_features, hybridization)
 
-__all__ = ["compute_molecular_graph_edges", "generate_fingerprints", "generate_molecular_features"]
+__all__ = ["compute_molecular_graph_edges", "generate_fingerprints", "generate_molecular_features",
+           "generate_molecular_features_batch", "get_fingerprint_generator", "unpack_fingerprints"]
 
 
-dictionary_functions = {
-    "morgan": AllChem.GetMorganFingerprintAsBitVect,
-    "atompair": AllChem.GetHashedAtomPairFingerprintAsBitVect,
-    "torsion": AllChem.GetHashedTopologicalTorsionFingerprintAsBitVect
+dictionary_generators = {
+    "morgan": lambda radius, bits, chirality: rdFingerprintGenerator.GetMorganGenerator(
+        radius=radius, fpSize=bits, includeChirality=chirality),
+    "atompair": lambda radius, bits, chirality: rdFingerprintGenerator.GetAtomPairGenerator(
+        fpSize=bits, includeChirality=chirality),
+    "torsion": lambda radius, bits, chirality: rdFingerprintGenerator.GetTopologicalTorsionGenerator(
+        fpSize=bits, includeChirality=chirality)
 }
 
+
+class FingerprintConfig(NamedTuple):
+    """Options used to compute the fingerprints."""
+    names: Tuple[str, ...]    # Fingerprints concatenated in each row
+    bits: int                 # Number of bits of each fingerprint
+    use_chirality: bool       # Whether or not to use chirality
+    count: bool               # Count the features instead of setting bits
+    radius: int               # Radius of the morgan fingerprint
+    packed: bool              # Pack the bits into uint8
+
+
 # atom_type(len_elements) + vdw + covalent_radius + electronegativity + hybridization +
 # is_aromatic
 NUMBER_ATOMIC_GRAPH_FEATURES = len(ELEMENTS) + 8
@@ -35,6 +55,25 @@ NUMBER_ATOMIC_GRAPH_FEATURES = len(ELEMENTS) + 8
 NUMBER_BOND_GRAPH_FEATURES = len(BONDS) + 3
 # Concatenation of both features set
 NUMBER_GRAPH_FEATURES = NUMBER_ATOMIC_GRAPH_FEATURES + NUMBER_BOND_GRAPH_FEATURES
+# Increase the version whenever the graph features change, to invalidate the cached features
+GRAPH_FEATURES_VERSION = 1
+
+
+def _index_table(size: int, indices: Dict[int, int]) -> np.ndarray:
+    """Create an array mapping the keys of ``indices`` to their values and the rest to -1."""
+    table = np.full(size, -1, dtype=np.int64)
+    for key, value in indices.items():
+        table[key] = value
+    return table
+
+
+# Tables used to gather the graph features of several molecules at once
+ELEMENT_INDEX = _index_table(
+    119, {Chem.GetPeriodicTable().GetAtomicNumber(el): i for i, el in enumerate(ELEMENTS)})
+ELEMENT_FEATURES = np.stack([dict_element_features[el] for el in ELEMENTS])
+HYBRIDIZATION_INDEX = _index_table(
+    len(rdchem.HybridizationType.values), {int(key): value for key, value in hybridization.items()})
+BOND_INDEX = _index_table(len(rdchem.BondType.values), {int(bond): i for i, bond in enumerate(BONDS)})
 
 
 def generate_molecular_features(mol: Chem.rdchem.Mol) -> Tuple[np.ndarray, np.ndarray]:
@@ -131,8 +170,89 @@ def compute_molecular_graph_edges(mol: Chem.rdchem.Mol) -> np.ndarray:
     return edges
 
 
-def generate_fingerprints(molecules: pd.Series, fingerprint: str, bits: int,
-                          use_chirality: bool = False) -> np.ndarray:
+def generate_molecular_features_batch(molecules: Sequence[Chem.rdchem.Mol]) -> Dict[str, List[np.ndarray]]:
+    """Generate the atomic features, bond features and edges of several molecules at once.
+
+    The atoms and bonds of all the molecules are read into flat arrays and the features
+    are built with array operations. The result is identical to calling
+    :func:`generate_molecular_features` and :func:`compute_molecular_graph_edges` for
+    each molecule, with the edges stored as a ``[2 x num_bonds, 2]`` array.
+
+    Parameters
+    ----------
+    molecules
+        RDKit molecules with a conformer
+
+    Returns
+    -------
+    Dictionary with the ``atomic_features``, ``bond_features`` and ``edges`` of each molecule
+
+    """
+    if len(molecules) == 0:
+        return {"atomic_features": [], "bond_features": [], "edges": []}
+
+    atom_offsets = np.zeros(len(molecules) + 1, dtype=np.int64)
+    np.cumsum([mol.GetNumAtoms() for mol in molecules], out=atom_offsets[1:])
+    bond_offsets = np.zeros(len(molecules) + 1, dtype=np.int64)
+    np.cumsum([mol.GetNumBonds() for mol in molecules], out=bond_offsets[1:])
+
+    # Read the atoms, bonds and positions of all the molecules
+    atoms = np.array([(atom.GetAtomicNum(), int(atom.GetHybridization()), atom.GetTotalNumHs(),
+                       atom.GetIsAromatic()) for mol in molecules for atom in mol.GetAtoms()],
+                     dtype=np.int64).reshape(-1, 4)
+    bonds = np.array([(bond.GetBeginAtomIdx(), bond.GetEndAtomIdx(), int(bond.GetBondType()),
+                       bond.IsInRing(), bond.GetIsConjugated()) for mol in molecules for bond in mol.GetBonds()],
+                     dtype=np.int64).reshape(-1, 5)
+    positions = np.concatenate(
+        [np.empty((0, 3))] + [mol.GetConformer().GetPositions() for mol in molecules if mol.GetNumAtoms() > 0])
+
+    # Atomic features
+    elements = ELEMENT_INDEX[atoms[:, 0]]
+    if np.any(elements < 0):
+        unknown = {Chem.GetPeriodicTable().GetElementSymbol(int(z)) for z in atoms[elements < 0, 0]}
+        msg = f"There are no features for the elements: {unknown}"
+        raise RuntimeError(msg)
+
+    len_elements = len(ELEMENTS)
+    atomic_features = np.zeros((len(atoms), NUMBER_ATOMIC_GRAPH_FEATURES), dtype=np.float32)
+    atomic_features[:, : len_elements + 3] = ELEMENT_FEATURES[elements]
+    hybrid_index = HYBRIDIZATION_INDEX[atoms[:, 1]]
+    rows = np.flatnonzero(hybrid_index >= 0)
+    atomic_features[rows, len_elements + 3 + hybrid_index[rows]] = 1.0
+    atomic_features[:, len_elements + 6] = atoms[:, 2]
+    atomic_features[:, -1] = atoms[:, 3]
+
+    # Bond features
+    bond_types = BOND_INDEX[bonds[:, 2]]
+    if np.any(bond_types < 0):
+        unknown = {str(rdchem.BondType.values[int(x)]) for x in bonds[bond_types < 0, 2]}
+        msg = f"There are no features for the bonds: {unknown}"
+        raise RuntimeError(msg)
+
+    features = np.zeros((len(bonds), NUMBER_BOND_GRAPH_FEATURES))
+    features[np.arange(len(bonds)), bond_types] = 1.0
+    features[:, 4] = bonds[:, 3]
+    features[:, 5] = bonds[:, 4]
+    shift = np.repeat(atom_offsets[:-1], np.diff(bond_offsets))
+    delta = positions[bonds[:, 0] + shift] - positions[bonds[:, 1] + shift]
+    features[:, 6] = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2 + delta[:, 2] ** 2)
+    # Represent an undirectional graph using two arrows for each bond
+    bond_features = np.repeat(features.astype(np.float32), 2, axis=0)
+
+    edges = np.empty((2 * len(bonds), 2), dtype=np.int64)
+    edges[0::2] = bonds[:, :2]
+    edges[1::2] = bonds[:, 1::-1]
+
+    return {
+        "atomic_features": np.split(atomic_features, atom_offsets[1:-1]),
+        "bond_features": np.split(bond_features, 2 * bond_offsets[1:-1]),
+        "edges": np.split(edges, 2 * bond_offsets[1:-1])}
+
+
+def generate_fingerprints(molecules: pd.Series, fingerprint: Union[str, Sequence[str]], bits: int,
+                          use_chirality: bool = False, nworkers: int = 1,
+                          chunksize: Optional[int] = None, packed: bool = False,
+                          count: bool = False, radius: int = 2) -> np.ndarray:
     """Generate the Extended-Connectivity Fingerprints (ECFP).
 
     Available fingerprints:
@@ -145,30 +265,99 @@ def generate_fingerprints(molecules: pd.Series, fingerprint: str, bits: int,
     molecules
         Pandas Series with the RDKit molecules
     fingerprint
-        Name of the fingerprint to apply
+        Name of the fingerprint to apply or a list of names. For several fingerprints
+        the rows contain the concatenation of the fingerprints in the given order
     bits
-        Number of bits to use
+        Number of bits to use for each fingerprint
     use_chirality
         Whether or not to use chirality
+    nworkers
+        Number of processes used to compute the fingerprints
+    chunksize
+        Number of molecules handed to a worker at once, by default the molecules
+        are split into ``4 * nworkers`` chunks
+    packed
+        Store the bits of each fingerprint packed into ``uint8`` (see :func:`numpy.packbits`)
+    count
+        Compute how many times each feature is found instead of whether it is present
+    radius
+        Radius of the morgan fingerprint
 
     Returns
     -------
     Numpy array containing a molecular fingerprint in a row
 
     """
+    if packed and count:
+        raise RuntimeError("Count-based fingerprints cannot be packed as bits")
+
+    names = (fingerprint,) if isinstance(fingerprint, str) else tuple(fingerprint)
+    config = FingerprintConfig(names, bits, use_chirality, count, radius, packed)
     size = len(molecules)
+    if nworkers > 1 and size > 0:
+        return generate_fingerprints_in_parallel(molecules, config, nworkers, chunksize)
+
+    width = fingerprint_width(len(names) * bits, packed)
+    result = np.empty((size, width), dtype=np.uint8 if packed else np.float32)
+    fill_fingerprints(result, 0, molecules.to_list(), config)
+
+    return result
+
+
+def fingerprint_width(bits: int, packed: bool) -> int:
+    """Return the number of columns used to store a fingerprint of size ``bits``."""
+    return (bits + 7) // 8 if packed else bits
+
+
+def unpack_fingerprints(fingerprints: np.ndarray, bits: int) -> np.ndarray:
+    """Expand fingerprints packed with :func:`numpy.packbits` into ``float32`` rows.
+
+    Parameters
+    ----------
+    fingerprints
+        Packed ``uint8`` fingerprints, either a single row or a matrix
+    bits
+        Number of bits of the original fingerprint
+
+    Returns
+    -------
+    Numpy array with the dense fingerprints
+
+    """
+    return np.unpackbits(fingerprints, axis=-1, count=bits).astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def get_fingerprint_generator(fingerprint: str, bits: int, use_chirality: bool = False,
+                              radius: int = 2) -> Any:
+    """Return the RDKit fingerprint generator for the given configuration.
+
+    The generators are created only once for each configuration and then reused.
 
-    it = (compute_fingerprint(molecules[i], fingerprint, bits, use_chirality) for i in molecules.index)
-    result = np.fromiter(
-        chain.from_iterable(it),
-        np.float32,
-        size * bits
-    )
+    Parameters
+    ----------
+    fingerprint
+        Name of the fingerprint
+    bits
+        Number of bits to use
+    use_chirality
+        Whether or not to use chirality
+    radius
+        Radius of the morgan fingerprint
+
+    Returns
+    -------
+    RDKit ``FingerprintGenerator``
 
-    return result.reshape(size, bits)
+    """
+    if fingerprint not in dictionary_generators:
+        msg = f"Unknown fingerprint: {fingerprint}. Available fingerprints are: {list(dictionary_generators)}"
+        raise RuntimeError(msg)
+    return dictionary_generators[fingerprint](radius, bits, use_chirality)
 
 
-def compute_fingerprint(molecule, fingerprint: str, nbits: int, use_chirality: bool) -> np.ndarray:
+def compute_fingerprint(molecule, fingerprint: str, nbits: int, use_chirality: bool,
+                        count: bool = False, radius: int = 2) -> np.ndarray:
     """Calculate a single fingerprint.
 
     Parameters
@@ -181,16 +370,82 @@ def compute_fingerprint(molecule, fingerprint: str, nbits: int, use_chirality: b
         Number of bits to use
     use_chirality
         Whether or not to use chirality
+    count
+        Compute how many times each feature is found instead of whether it is present
+    radius
+        Radius of the morgan fingerprint
 
     Returns
     -------
     Numpy array containing the molecular fingerprint
 
     """
-    # Select the fingerprint calculator
-    fingerprint_calculator = dictionary_functions[fingerprint]
-    if fingerprint == "morgan":
-        bit_vector = fingerprint_calculator(molecule, 2, nBits=nbits, useChirality=use_chirality)
+    generator = get_fingerprint_generator(fingerprint, nbits, use_chirality, radius)
+    if count:
+        fp = generator.GetCountFingerprintAsNumPy(molecule)
     else:
-        bit_vector = fingerprint_calculator(molecule, nBits=nbits, includeChirality=use_chirality)
-    return np.fromiter(bit_vector.ToBitString(), np.float32, nbits)
+        fp = generator.GetFingerprintAsNumPy(molecule)
+    return fp.astype(np.float32)
+
+
+def fill_fingerprints(out: np.ndarray, start: int, molecules: List[Chem.rdchem.Mol],
+                      config: FingerprintConfig) -> None:
+    """Compute the fingerprints of ``molecules`` and store them in ``out`` starting at row ``start``."""
+    bits, count = config.bits, config.count
+    generators = [get_fingerprint_generator(name, bits, config.use_chirality, config.radius)
+                  for name in config.names]
+    row = np.empty(len(generators) * bits, dtype=np.uint8) if config.packed else None
+    for index, mol in enumerate(molecules, start):
+        target = out[index] if row is None else row
+        for k, generator in enumerate(generators):
+            fp = generator.GetCountFingerprintAsNumPy(mol) if count else generator.GetFingerprintAsNumPy(mol)
+            target[k * bits: (k + 1) * bits] = fp
+        if row is not None:
+            out[index] = np.packbits(row)
+
+
+def generate_fingerprints_in_parallel(
+        molecules: pd.Series, config: FingerprintConfig,
+        nworkers: int, chunksize: Optional[int] = None) -> np.ndarray:
+    """Compute the fingerprints using a pool of ``nworkers`` processes.
+
+    The workers write their rows directly into a matrix allocated in shared
+    memory, therefore only the molecules are sent to the workers.
+
+    Returns
+    -------
+    Numpy array containing a molecular fingerprint in a row
+
+    """
+    size = len(molecules)
+    if chunksize is None:
+        chunksize = -(-size // (4 * nworkers))
+    chunksize = max(1, chunksize)
+
+    width = fingerprint_width(len(config.names) * config.bits, config.packed)
+    ctype, dtype = (ctypes.c_uint8, np.uint8) if config.packed else (ctypes.c_float, np.float32)
+    buffer = multiprocessing.RawArray(ctype, size * width)
+    mols = molecules.to_list()
+    tasks = [(start, mols[start: start + chunksize], config) for start in range(0, size, chunksize)]
+
+    with multiprocessing.Pool(nworkers, initializer=_init_fingerprints_worker,
+                              initargs=(buffer, (size, width), dtype)) as pool:
+        pool.starmap(_fill_shared_fingerprints, tasks, chunksize=1)
+
+    return np.frombuffer(buffer, dtype=dtype).reshape(size, width)
+
+
+# Matrix in shared memory where each worker stores its fingerprints
+_SHARED_FINGERPRINTS = np.empty((0, 0), dtype=np.float32)
+
+
+def _init_fingerprints_worker(buffer: ctypes.Array, shape: Tuple[int, int], dtype: type) -> None:
+    """Attach the worker to the shared fingerprints matrix."""
+    global _SHARED_FINGERPRINTS
+    _SHARED_FINGERPRINTS = np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+
+def _fill_shared_fingerprints(start: int, molecules: List[Chem.rdchem.Mol],
+                              config: FingerprintConfig) -> None:
+    """Compute the fingerprints of a chunk of molecules starting at row ``start``."""
+    fill_fingerprints(_SHARED_FINGERPRINTS, start, molecules, config)
@@ -1,11 +1,15 @@
 """Module to process dataset."""
-from typing import Any, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
+import numpy as np
+import pandas as pd
 import torch
 from torch.utils.data import Dataset
 
-from .features.featurizer import generate_fingerprints
-from .swan_data_base import SwanDataBase
+from .cache import FeaturesCache, describe_file
+from .features.featurizer import generate_fingerprints, unpack_fingerprints
+from .storage import store_lock
+from .swan_data_base import SwanDataBase, batch_data_loader
 from ..type_hints import PathLike
 
 __all__ = ["FingerprintsData"]
@@ -15,9 +19,16 @@ class FingerprintsData(SwanDataBase):
     def __init__(self,
                  path_data: PathLike,
                  properties: Optional[Union[str, List[str]]] = None,
-                 type_fingerprint: str = 'atompair',
+                 type_fingerprint: Union[str, List[str]] = 'atompair',
                  fingerprint_size: int = 2048,
-                 sanitize: bool = True) -> None:
+                 sanitize: bool = True,
+                 nworkers: int = 1,
+                 sanitize_options: Optional[Dict[str, Any]] = None,
+                 packed: bool = False,
+                 count: bool = False,
+                 cache_dir: Optional[PathLike] = None,
+                 chunksize: Optional[int] = None,
+                 fingerprint_store: Optional[PathLike] = None) -> None:
         """generate fingerprint data.
 
         Parameters
@@ -29,37 +40,114 @@ class FingerprintsData(SwanDataBase):
         root
             Path to the root directory for the dataset
         type_fingerprint
-            Either ``atompair``, ``torsion`` or ``morgan``.
+            Either ``atompair``, ``torsion`` or ``morgan``, or a list of them
+            to concatenate several fingerprints.
         fingerprint_size
-            Size of the fingerprint in bits
+            Size of each fingerprint in bits
         sanitize
             Check that molecules have a valid conformer
+        nworkers
+            Number of processes used to generate the conformers and compute the fingerprints
+        sanitize_options
+            Options used to generate the conformers in the sanitization (see :meth:`set_sanitize_options`)
+        packed
+            Keep the fingerprints bit-packed in memory and only expand the
+            rows requested by the data loader
+        count
+            Use count-based fingerprints instead of bit fingerprints
+        cache_dir
+            Folder used to cache the fingerprints between runs
+        chunksize
+            Read, sanitize and featurize the data in chunks of ``chunksize`` rows,
+            keeping only the fingerprints of each chunk. By default the whole
+            file is processed at once
+        fingerprint_store
+            Folder where the fingerprints are published as memory-mapped arrays. If it
+            already contains the fingerprints of the data, they are mapped from it instead
+            of computing them, so concurrent processes share a single copy of the fingerprints,
+            whatever their ``properties``
         """
 
         super().__init__()
-
-        # create the dataframe
-        self.dataframe = self.process_data(path_data)
-
-        # clean the dataframe
-        self.clean_dataframe(sanitize=sanitize)
+        self.nworkers = nworkers
+        self.set_sanitize_options(**(sanitize_options or {}))
+
+        def featurizer(dataframe):
+            return generate_fingerprints(dataframe["molecules"],
+                                         type_fingerprint,
+                                         fingerprint_size,
+                                         nworkers=nworkers,
+                                         packed=packed,
+                                         count=count)
+
+        config = {"features": "fingerprints", "fingerprint": type_fingerprint,
+                  "size": fingerprint_size, "packed": packed, "count": count, "sanitize": sanitize,
+                  "sanitize_options": self.sanitize_options}
+        cache = None if cache_dir is None else FeaturesCache(cache_dir, config)
+
+        if fingerprint_store is None:
+            fingerprints = self.compute_fingerprints(path_data, sanitize, chunksize, featurizer, cache)
+        else:
+            # The first process computes the fingerprints, the others wait and map them
+            store_config = dict(config, data=describe_file(path_data))
+            with store_lock(fingerprint_store):
+                if not self.is_stored(fingerprint_store, store_config):
+                    fingerprints = self.compute_fingerprints(path_data, sanitize, chunksize, featurizer, cache)
+                    self.write_features_store(fingerprint_store, {"fingerprints": fingerprints[:, None]}, store_config)
+                store = self.read_features_store(fingerprint_store)
+            fingerprints = store.data["fingerprints"]
 
         # extract the labels from the dataframe
         if properties is not None:
             self.labels = self.get_labels(properties)
             self.nlabels = self.labels.shape[1]
 
-        # compute fingerprints
-        fingerprints = generate_fingerprints(self.dataframe["molecules"],
-                                             type_fingerprint,
-                                             fingerprint_size)
-        self.fingerprints = torch.from_numpy(fingerprints)
-
         # create the dataset
-        self.dataset = FingerprintsDataset(self.fingerprints, self.labels)
-
-        # data loader type
-        self.data_loader_fun = torch.utils.data.DataLoader
+        ntypes = 1 if isinstance(type_fingerprint, str) else len(type_fingerprint)
+        self.dataset = FingerprintsDataset(
+            torch.from_numpy(fingerprints), self.labels,
+            fingerprint_size=ntypes * fingerprint_size if packed else None)
+
+        # data loader type, retrieving each minibatch as a single slice
+        self.data_loader_fun = batch_data_loader
+
+    def compute_fingerprints(
+            self, path_data: PathLike, sanitize: bool, chunksize: Optional[int],
+            featurizer: Callable[[pd.DataFrame], np.ndarray], cache: Optional[FeaturesCache]) -> np.ndarray:
+        """Read and clean the data and compute the fingerprints of the molecules."""
+        # create the dataframe, either at once or in chunks
+        frames, blocks = [], []
+        for dataframe in self.iter_data(path_data, chunksize=chunksize):
+            self.dataframe = dataframe
+            if cache is None:
+                # clean the dataframe
+                self.clean_dataframe(sanitize=sanitize)
+
+                # compute fingerprints
+                blocks.append(featurizer(self.dataframe))
+            else:
+                # Only clean and compute the fingerprints of the molecules missing in the cache
+                features = self.clean_and_featurize(
+                    sanitize, lambda df: {"fingerprints": featurizer(df)[:, None]}, cache)
+                blocks.append(np.concatenate(features["fingerprints"]))
+
+            # Keep only the compact features of each chunk
+            if chunksize is not None:
+                self.dataframe = self.dataframe.drop(columns="molecules")
+            frames.append(self.dataframe)
+
+        self.dataframe = self.join_chunks(frames, path_data)
+        fingerprints = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+
+        return fingerprints
+
+    @property
+    def fingerprints(self) -> torch.Tensor:
+        """Fingerprints of the whole dataset as a dense ``float32`` tensor.
+
+        If the fingerprints are stored bit-packed, a new dense tensor is created.
+        """
+        return self.dataset.get_fingerprints(slice(None))
 
     def get_item(self, batch_data: List[Any]) -> Tuple[Any, torch.Tensor]:
         """get the data/ground truth of a minibatch
@@ -74,24 +162,36 @@ class FingerprintsData(SwanDataBase):
 
 class FingerprintsDataset(Dataset):
     """Read the smiles, properties and compute the fingerprints."""
-    def __init__(self, fingerprints, labels) -> None:
-        """[summary]
+    def __init__(self, fingerprints: torch.Tensor, labels: torch.Tensor,
+                 fingerprint_size: Optional[int] = None) -> None:
+        """Create a dataset from the precomputed fingerprints.
 
         Parameters
         ----------
-        fingerprints : [type]
-            [description]
-        labels : [type]
-            [description]
+        fingerprints
+            Tensor with a fingerprint per row
+        labels
+            Ground truth of the fingerprints
+        fingerprint_size
+            Number of bits of the fingerprints if they are packed as ``uint8``,
+            by default the fingerprints are dense
         """
 
         self.fingerprints = fingerprints
         self.labels = labels
+        self.fingerprint_size = fingerprint_size
 
     def __len__(self) -> int:
         """Return dataset length."""
         return self.labels.shape[0]
 
-    def __getitem__(self, idx: int) -> Tuple[Any, Any]:
-        """Return the idx dataset element."""
-        return self.fingerprints[idx], self.labels[idx]
+    def __getitem__(self, idx: Any) -> Tuple[Any, Any]:
+        """Return the idx dataset element, or the minibatch of elements if ``idx`` is a list of indices."""
+        return self.get_fingerprints(idx), self.labels[idx]
+
+    def get_fingerprints(self, idx: Any) -> torch.Tensor:
+        """Return the dense fingerprints of the ``idx`` rows."""
+        if self.fingerprint_size is None:
+            return self.fingerprints[idx]
+        rows = self.fingerprints[idx].numpy()
+        return torch.from_numpy(unpack_fingerprints(rows, self.fingerprint_size))
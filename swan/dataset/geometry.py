@@ -1,14 +1,50 @@
-"""Module to help building the geometric representations."""
+"""Module to help building the geometric representations.
+
+The geometries can be read either from a JSON array of PDB blocks or from a
+binary store, containing the RDKit binary representation of each molecule
+and a flat array with the coordinates of all the atoms.
+
+API
+---
+.. autofunction:: read_geometries_from_files
+.. autofunction:: write_geometries
+.. autofunction:: convert_json_geometries
+.. autofunction:: guess_positions
+.. autofunction:: close_geometry_pool
+
+"""
+import atexit
 import json
 import multiprocessing
-from functools import partial
-from typing import Collection, List, Tuple
+import multiprocessing.pool
+import os
+import tempfile
+from typing import Collection, List, Optional, Sequence, Tuple
 
 import numpy as np
 from rdkit import Chem
 from rdkit.Chem import AllChem
+from rdkit.Geometry import Point3D
 
 from ..type_hints import PathLike
+from .storage import PackedArrays, write_packed_arrays
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7
+    shared_memory = None
+
+__all__ = ["close_geometry_pool", "convert_json_geometries", "guess_positions",
+           "read_geometries_from_files", "write_geometries"]
+
+#: Force fields available to optimize the geometries
+OPTIMIZERS = {"uff": AllChem.UFFOptimizeMolecule, "mmff": AllChem.MMFFOptimizeMolecule}
+
+#: Minimum number of molecules to optimize using the pool of workers
+MIN_PARALLEL_SIZE = 64
+
+# Number of workers and pool shared by all the calls to guess_positions
+_GEOMETRY_POOL = None  # type: Optional[Tuple[int, multiprocessing.pool.Pool]]
 
 
 def read_geometries_from_files(file_geometries: PathLike) -> Tuple[List[Chem.rdchem.Mol], List[np.ndarray]]:
@@ -17,13 +53,17 @@ def read_geometries_from_files(file_geometries: PathLike) -> Tuple[List[Chem.rdc
     Parameters
     ----------
     file_geometries
-        Path to the files with the geometries in JSON format
+        Path to the files with the geometries in JSON format or to the
+        folder created by :func:`write_geometries`
 
     Returns
     -------
     Tuple with a list of rdkit geometries and a list of matrices with the molecular geometries.
 
     """
+    if PackedArrays.exists(file_geometries):
+        return read_geometries_from_store(file_geometries)
+
     with open(file_geometries, 'r') as handler:
         strings = json.load(handler)
 
@@ -32,30 +72,198 @@ def read_geometries_from_files(file_geometries: PathLike) -> Tuple[List[Chem.rdc
     return molecules, positions
 
 
-def guess_positions(molecules: Collection[Chem.rdchem.Mol], optimize_molecule: bool) -> List[np.ndarray]:
+def read_geometries_from_store(path: PathLike) -> Tuple[List[Chem.rdchem.Mol], List[np.ndarray]]:
+    """Read the molecules and slice their positions from the binary store in ``path``."""
+    # copy-on-write maps, so the positions can be used as tensors without copying them
+    store = PackedArrays(path, mmap_mode='c')
+    molecules = [Chem.Mol(store.get("molecules", i).tobytes()) for i in range(len(store))]
+    positions = [store.get("positions", i) for i in range(len(store))]
+    return molecules, positions
+
+
+def write_geometries(path: PathLike, molecules: Sequence[Chem.rdchem.Mol]) -> None:
+    """Store the molecules and their coordinates in the binary format.
+
+    Parameters
+    ----------
+    path
+        Folder where the geometries are stored
+    molecules
+        RDKit molecules with a conformer
+
+    """
+    binaries = [np.frombuffer(mol.ToBinary(), dtype=np.uint8) for mol in molecules]
+    positions = [np.asarray(mol.GetConformer().GetPositions(), dtype=np.float32).reshape(-1, 3)
+                 for mol in molecules]
+    write_packed_arrays(path, {"molecules": binaries, "positions": positions},
+                        metadata={"format": "geometries"})
+
+
+def convert_json_geometries(file_json: PathLike, path: PathLike) -> None:
+    """Convert a JSON array of PDB blocks to the binary format.
+
+    Parameters
+    ----------
+    file_json
+        Path to the JSON file with the geometries
+    path
+        Folder where the geometries are stored
+
+    """
+    molecules, _ = read_geometries_from_files(file_json)
+    write_geometries(path, molecules)
+
+
+def guess_positions(molecules: Collection[Chem.rdchem.Mol], optimize_molecule: bool,
+                    force_field: str = "uff", nworkers: Optional[int] = None) -> List[np.ndarray]:
     """Compute a guess for the molecular coordinates.
 
+    Small sets of molecules, or sets that do not need optimization, are processed
+    in the current process. Otherwise the molecules are sent as RDKit binaries to
+    a pool of workers kept alive between calls, exchanging the coordinates through
+    a shared-memory buffer.
+
     Parameters
     ----------
     molecules
         Collection containing the molecules
     optimize_molecule
         Whether or not to perform a molecular optimization
+    force_field
+        Force field used in the optimization, either ``uff`` or ``mmff``
+    nworkers
+        Number of processes used in the optimization, by default all the CPUs
 
     Returns
     -------
-    List of the molecular coordinates
+    List of the molecular coordinates, as views of a single array
+
+    """
+    if force_field not in OPTIMIZERS:
+        msg = f"Unknown force field: {force_field}. Use one of: {list(OPTIMIZERS)}"
+        raise RuntimeError(msg)
+
+    if len(molecules) == 0:
+        return []
+
+    nworkers = multiprocessing.cpu_count() if nworkers is None else nworkers
+    offsets = np.zeros(len(molecules) + 1, dtype=np.int64)
+    np.cumsum([mol.GetNumAtoms() for mol in molecules], out=offsets[1:])
+
+    if not optimize_molecule or nworkers < 2 or len(molecules) < MIN_PARALLEL_SIZE:
+        positions = np.empty((offsets[-1], 3), dtype=np.float32)
+        for start, end, mol in zip(offsets[:-1], offsets[1:], molecules):
+            positions[start: end] = get_coordinates(optimize_molecule, mol, force_field)
+    else:
+        positions = optimize_in_parallel(molecules, offsets, force_field, nworkers)
+
+    return np.split(positions, offsets[1:-1])
+
+
+def optimize_in_parallel(
+        molecules: Collection[Chem.rdchem.Mol], offsets: np.ndarray,
+        force_field: str, nworkers: int) -> np.ndarray:
+    """Optimize the molecules using the geometry pool and return all the coordinates.
+
+    The molecules are sent without conformers as RDKit binaries, while their
+    coordinates are exchanged through a shared-memory buffer.
+    """
+    size = len(molecules)
+    chunksize = max(1, -(-size // (4 * nworkers)))
+    binaries = [mol.ToBinary(Chem.PropertyPickleOptions.NoConformers) for mol in molecules]
+    buffer = SharedCoordinates(int(offsets[-1]))
+    try:
+        for start, end, mol in zip(offsets[:-1], offsets[1:], molecules):
+            buffer.array[start: end] = mol.GetConformer().GetPositions()
+
+        tasks = [(buffer.name, offsets[start: start + chunksize + 1], binaries[start: start + chunksize], force_field)
+                 for start in range(0, size, chunksize)]
+        get_geometry_pool(nworkers).starmap(_optimize_in_buffer, tasks, chunksize=1)
+        positions = buffer.array.astype(np.float32)
+    finally:
+        buffer.close()
+        buffer.unlink()
 
+    return positions
+
+
+class SharedCoordinates:
+    """Coordinates shared with the workers of the geometry pool.
+
+    The coordinates are kept in shared memory or, since :mod:`multiprocessing.shared_memory`
+    requires Python 3.8, in a memory-mapped temporary file.
     """
-    chunksize = 2 * len(molecules) // multiprocessing.cpu_count()
-    function = partial(get_coordinates, optimize_molecule)
-    with multiprocessing.Pool() as p:
-        data = list(p.imap(function, molecules, chunksize=chunksize))
 
-    return data
+    def __init__(self, natoms: int, name: Optional[str] = None) -> None:
+        """Create a buffer for the coordinates of ``natoms`` atoms, or attach to the buffer ``name``."""
+        # An empty buffer can be neither shared nor mapped
+        shape = (max(1, natoms), 3)
+        if shared_memory is not None:
+            self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=shape[0] * 3 * 8)
+            self.name = self.memory.name
+            array = np.ndarray(shape, dtype=np.float64, buffer=self.memory.buf)
+        else:
+            self.memory = None
+            mode = "r+"
+            if name is None:
+                handler, name = tempfile.mkstemp(prefix="swan_geometries_")
+                os.close(handler)
+                mode = "w+"
+            self.name = name
+            array = np.memmap(name, dtype=np.float64, mode=mode, shape=shape)
+        self.array = array[:natoms]  # type: np.ndarray
+
+    def close(self) -> None:
+        """Detach from the buffer."""
+        del self.array
+        if self.memory is not None:
+            self.memory.close()
+
+    def unlink(self) -> None:
+        """Remove the buffer once all the processes are detached."""
+        if self.memory is not None:
+            self.memory.unlink()
+        else:
+            os.remove(self.name)
+
+
+def get_geometry_pool(nworkers: int) -> multiprocessing.pool.Pool:
+    """Return the pool of workers used to compute the geometries, creating it if needed."""
+    global _GEOMETRY_POOL
+    if _GEOMETRY_POOL is not None and _GEOMETRY_POOL[0] != nworkers:
+        close_geometry_pool()
+    if _GEOMETRY_POOL is None:
+        _GEOMETRY_POOL = (nworkers, multiprocessing.Pool(nworkers))
+    return _GEOMETRY_POOL[1]
 
 
-def get_coordinates(optimize_molecule: bool, mol: Chem.rdchem.Mol) -> np.ndarray:
+def close_geometry_pool() -> None:
+    """Stop the workers used to compute the geometries."""
+    global _GEOMETRY_POOL
+    if _GEOMETRY_POOL is not None:
+        pool = _GEOMETRY_POOL[1]
+        _GEOMETRY_POOL = None
+        pool.terminate()
+        pool.join()
+
+
+def _optimize_in_buffer(name: str, offsets: np.ndarray, binaries: List[bytes], force_field: str) -> None:
+    """Optimize the molecules in a worker, reading and writing their coordinates in the shared buffer."""
+    buffer = SharedCoordinates(int(offsets[-1]), name)
+    try:
+        for start, end, binary in zip(offsets[:-1], offsets[1:], binaries):
+            mol = Chem.Mol(binary)
+            conformer = Chem.Conformer(mol.GetNumAtoms())
+            for i, xyz in enumerate(buffer.array[start: end]):
+                conformer.SetAtomPosition(i, Point3D(*xyz))
+            mol.AddConformer(conformer)
+            OPTIMIZERS[force_field](mol)
+            buffer.array[start: end] = mol.GetConformer().GetPositions()
+    finally:
+        buffer.close()
+
+
+def get_coordinates(optimize_molecule: bool, mol: Chem.rdchem.Mol, force_field: str = "uff") -> np.ndarray:
     """Extract the coordinates of a given RDKit molecule.
     Parameters
     ----------
@@ -63,13 +271,19 @@ def get_coordinates(optimize_molecule: bool, mol: Chem.rdchem.Mol) -> np.ndarray
         Whether or not to perform a molecular optimization
     mol
         RDKit molecule
+    force_field
+        Force field used in the optimization, either ``uff`` or ``mmff``
 
     Returns
     -------
     Array with the molecular coordinates
 
     """
-    # AllChem.EmbedMolecule(mol)
     if optimize_molecule:
-        AllChem.UFFOptimizeMolecule(mol)
+        # optimize a copy, to leave the input molecule untouched
+        mol = Chem.Mol(mol)
+        OPTIMIZERS[force_field](mol)
     return np.asarray(mol.GetConformer().GetPositions(), dtype=np.float32)
+
+
+atexit.register(close_geometry_pool)
@@ -0,0 +1,100 @@
+"""Molecular graphs built on first access and kept in a bounded cache.
+
+API
+---
+.. autoclass:: LazyGraphs
+
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence
+
+import numpy as np
+import torch
+from rdkit import Chem
+
+from ..geometry import get_coordinates
+from .molecular_graph import generate_graph_features
+
+__all__ = ["LazyGraphs"]
+
+
+class LazyGraphs(Sequence):
+    """Sequence of graphs that are computed from their molecules when they are requested.
+
+    The most recently used graphs are kept in a least-recently-used cache of
+    ``cache_size`` graphs, so the memory used by the graphs stays bounded.
+    """
+
+    def __init__(self, molecules: Sequence[Chem.rdchem.Mol],
+                 graph_from_features: Callable[[Mapping[str, np.ndarray], Optional[torch.Tensor]], Any],
+                 labels: Optional[torch.Tensor] = None,
+                 positions: Optional[Sequence[np.ndarray]] = None,
+                 optimize_molecule: bool = False,
+                 cache_size: int = 4096) -> None:
+        """Wrap the molecules.
+
+        Parameters
+        ----------
+        molecules
+            RDKit molecules with a conformer
+        graph_from_features
+            Function creating a graph from its arrays and labels
+        labels
+            Ground truth of each graph
+        positions
+            Coordinates of each molecule, by default taken from their conformers
+        optimize_molecule
+            Optimize the geometries of the conformers with a force field
+        cache_size
+            Maximum number of graphs kept in memory
+        """
+        if cache_size < 1:
+            msg = f"The cache must hold at least one graph, got cache_size: {cache_size}"
+            raise RuntimeError(msg)
+        self.molecules = molecules
+        self.graph_from_features = graph_from_features
+        self.labels = labels
+        self.positions = positions
+        self.optimize_molecule = optimize_molecule
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # type: OrderedDict[int, Any]
+
+    def __len__(self) -> int:
+        """Return the number of graphs."""
+        return len(self.molecules)
+
+    def __getitem__(self, idx):
+        """Return the ``idx`` graph, or a list of graphs if ``idx`` is a slice."""
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Graph index out of range: {idx}")
+
+        graph = self.cache.get(idx)
+        if graph is not None:
+            self.cache.move_to_end(idx)
+            return graph
+
+        labels = None if self.labels is None or len(self.labels) == 0 else self.labels[idx]
+        graph = self.graph_from_features(self.get_features(idx), labels)
+        self.cache[idx] = graph
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return graph
+
+    def get_features(self, idx: int) -> Dict[str, np.ndarray]:
+        """Compute the arrays defining the ``idx`` graph."""
+        mol = self.molecules[idx]
+        if self.positions is None:
+            coordinates = get_coordinates(self.optimize_molecule, mol)
+        else:
+            coordinates = self.positions[idx]
+        return generate_graph_features(mol, coordinates)
+
+    def clear_cache(self) -> None:
+        """Remove all the graphs from the cache."""
+        self.cache.clear()
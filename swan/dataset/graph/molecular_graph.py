@@ -5,26 +5,89 @@ Index
 .. currentmodule:: swan.graph.molecular_graph
 .. autosummary::
     create_molecular_torch_geometric_graph
+    create_molecular_dgl_graph
+    dgl_batch_from_features
+    torch_geometric_batch_from_features
+    generate_graph_features
+    generate_graph_features_batch
 
 
 API
 ---
 .. autofunction:: create_molecular_torch_geometric_graph
+.. autofunction:: create_molecular_dgl_graph
+.. autofunction:: dgl_batch_from_features
+.. autofunction:: torch_geometric_batch_from_features
+.. autofunction:: generate_graph_features
+.. autofunction:: generate_graph_features_batch
 
 """
-import dgl
+from typing import TYPE_CHECKING, Dict, List, Mapping, Sequence
+
 import numpy as np
 import torch
-import torch_geometric as tg
 from rdkit import Chem
 from torch import Tensor
 
 from swan.dataset.features.featurizer import (compute_molecular_graph_edges,
-                                              generate_molecular_features)
+                                              generate_molecular_features,
+                                              generate_molecular_features_batch)
+
+if TYPE_CHECKING:
+    import dgl
+    import torch_geometric as tg
+
+#: Arrays used to build a molecular graph
+GRAPH_FEATURES = ("atomic_features", "bond_features", "edges", "positions")
+
+
+def generate_graph_features(mol: Chem.rdchem.Mol, coordinates: np.ndarray) -> Dict[str, np.ndarray]:
+    """Compute the arrays defining the graph of a molecule.
+
+    Parameters
+    ----------
+    mol
+        RDKit molecule
+    coordinates
+        Numpy array with a XYZ coordinate per row
+
+    Returns
+    -------
+    Dictionary with the atomic features, bond features, edges and positions of the graph.
+    The edges are stored as a ``[2 x num_bonds, 2]`` array.
+
+    """
+    atomic_features, bond_features = generate_molecular_features(mol)
+    return {
+        "atomic_features": atomic_features,             # [num_atoms, NUMBER_ATOMIC_GRAPH_FEATURES]
+        "bond_features": bond_features,                 # [2 x num_bonds, NUMBER_BOND_GRAPH_FEATURES]
+        "edges": compute_molecular_graph_edges(mol).T,  # [2 x num_bonds, 2]
+        "positions": coordinates}                       # [num_atoms, 3]
+
+
+def generate_graph_features_batch(
+        molecules: Sequence[Chem.rdchem.Mol], coordinates: Sequence[np.ndarray]) -> Dict[str, List[np.ndarray]]:
+    """Compute the arrays defining the graphs of several molecules at once.
+
+    Parameters
+    ----------
+    molecules
+        RDKit molecules
+    coordinates
+        Numpy arrays with a XYZ coordinate per row for each molecule
+
+    Returns
+    -------
+    Dictionary with the same arrays as :func:`generate_graph_features` for each molecule.
+
+    """
+    features = generate_molecular_features_batch(molecules)
+    features["positions"] = list(coordinates)
+    return features
 
 
 def create_molecular_torch_geometric_graph(
-        mol: Chem.rdchem.Mol, coordinates: np.ndarray, labels: Tensor = None) -> tg.data.Data:
+        mol: Chem.rdchem.Mol, coordinates: np.ndarray, labels: Tensor = None) -> "tg.data.Data":
     """Create a torch-geometry data object representing a graph.
 
     See torch-geometry documentation:
@@ -43,11 +106,19 @@ def create_molecular_torch_geometric_graph(
     A torch-geometric Data class with the molecular features as a graph
 
     """
-    atomic_features, bond_features = [
-        torch.from_numpy(array) for array in generate_molecular_features(mol)]
+    return torch_geometric_graph_from_features(generate_graph_features(mol, coordinates), labels)
+
+
+def torch_geometric_graph_from_features(
+        features: Mapping[str, np.ndarray], labels: Tensor = None) -> "tg.data.Data":
+    """Create a torch-geometry data object from the arrays computed by :func:`generate_graph_features`."""
+    # Import the backend only when it is used
+    import torch_geometric as tg
+
+    atomic_features, bond_features, positions = [
+        torch.from_numpy(features[name]) for name in ("atomic_features", "bond_features", "positions")]
     # Undirectional edges to represent molecular bonds
-    edges = torch.from_numpy(compute_molecular_graph_edges(mol))
-    positions = torch.from_numpy(coordinates)
+    edges = torch.from_numpy(np.ascontiguousarray(features["edges"].T))
 
     return tg.data.Data(
         x=atomic_features,        # [num_atoms, NUMBER_ATOMIC_GRAPH_FEATURES]
@@ -57,8 +128,33 @@ def create_molecular_torch_geometric_graph(
         y=labels)
 
 
+def torch_geometric_batch_from_features(
+        features: Mapping[str, np.ndarray], num_nodes: np.ndarray, labels: Tensor = None) -> "tg.data.Batch":
+    """Create a batch of torch-geometry graphs from the arrays of all the graphs concatenated.
+
+    Parameters
+    ----------
+    features
+        Arrays computed by :func:`generate_graph_features` for all the graphs, concatenated
+        and with the edges referring to the nodes of the concatenated arrays
+    num_nodes
+        Number of nodes of each graph
+    labels
+        Torch Vector containing the ground true of all the graphs
+
+    """
+    import torch_geometric as tg
+
+    data = torch_geometric_graph_from_features(features, labels)
+    counts = torch.from_numpy(np.asarray(num_nodes, dtype=np.int64))
+    ptr = torch.zeros(len(counts) + 1, dtype=torch.long)
+    torch.cumsum(counts, dim=0, out=ptr[1:])
+    batch = torch.repeat_interleave(torch.arange(len(counts)), counts)
+    return tg.data.Batch(batch=batch, ptr=ptr, **data.to_dict())
+
+
 def create_molecular_dgl_graph(
-        mol: Chem.rdchem.Mol, coordinates: np.ndarray, labels: Tensor = None) -> dgl.DGLGraph:
+        mol: Chem.rdchem.Mol, coordinates: np.ndarray, labels: Tensor = None) -> "dgl.DGLGraph":
     """Create a DGL Graph object.
 
     See: https://www.dgl.ai/
@@ -78,15 +174,22 @@ def create_molecular_dgl_graph(
     A DGLGraph with the molecular features as a graph
 
     """
-    atomic_features, bond_features = [
-        torch.from_numpy(array) for array in generate_molecular_features(mol)]
+    return dgl_graph_from_features(generate_graph_features(mol, coordinates), labels)
+
+
+def dgl_graph_from_features(features: Mapping[str, np.ndarray], labels: Tensor = None) -> "dgl.DGLGraph":
+    """Create a DGL Graph object from the arrays computed by :func:`generate_graph_features`."""
+    # Import the backend only when it is used
+    import dgl
+
+    atomic_features, bond_features, positions = [
+        torch.from_numpy(features[name]) for name in ("atomic_features", "bond_features", "positions")]
 
     # Undirectional edges to represent molecular bonds
-    src, dst = torch.from_numpy(compute_molecular_graph_edges(mol))
+    src, dst = torch.from_numpy(np.ascontiguousarray(features["edges"].T))
 
     # Create graph
-    positions = torch.from_numpy(coordinates)
-    graph = dgl.graph((src, dst))
+    graph = dgl.graph((src, dst), num_nodes=len(positions))
 
     # Add node features to graph
     graph.ndata['x'] = positions                      # [num_atoms, 3]
@@ -97,3 +200,24 @@ def create_molecular_dgl_graph(
     graph.edata['w'] = bond_features  # [num_atoms, NUMBER_BOND_GRAPH_FEATURES]
 
     return graph
+
+
+def dgl_batch_from_features(
+        features: Mapping[str, np.ndarray], num_nodes: np.ndarray, num_edges: np.ndarray) -> "dgl.DGLGraph":
+    """Create a batch of DGL graphs from the arrays of all the graphs concatenated.
+
+    Parameters
+    ----------
+    features
+        Arrays computed by :func:`generate_graph_features` for all the graphs, concatenated
+        and with the edges referring to the nodes of the concatenated arrays
+    num_nodes
+        Number of nodes of each graph
+    num_edges
+        Number of edges of each graph
+
+    """
+    graph = dgl_graph_from_features(features)
+    graph.set_batch_num_nodes(torch.from_numpy(np.asarray(num_nodes, dtype=np.int64)))
+    graph.set_batch_num_edges(torch.from_numpy(np.asarray(num_edges, dtype=np.int64)))
+    return graph
@@ -0,0 +1,86 @@
+"""Molecular graphs built on demand from memory-mapped arrays.
+
+API
+---
+.. autoclass:: PackedGraphs
+
+"""
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from ..storage import PackedArrays
+from .molecular_graph import GRAPH_FEATURES
+
+__all__ = ["PackedGraphs"]
+
+
+class PackedGraphs(Sequence):
+    """Sequence of graphs whose arrays are read from a :class:`~swan.dataset.storage.PackedArrays` store.
+
+    The node features and positions of all the graphs are concatenated in single
+    arrays, and so are the edge features and indices, together with the node and
+    edge offsets of each graph. Each graph is created from zero-copy slices of
+    those arrays when it is requested.
+    """
+
+    def __init__(self, store: PackedArrays,
+                 graph_from_features: Callable[[Mapping[str, np.ndarray], Optional[torch.Tensor]], Any],
+                 labels: Optional[torch.Tensor] = None) -> None:
+        """Wrap the store.
+
+        Parameters
+        ----------
+        store
+            Arrays with the :data:`~swan.dataset.graph.molecular_graph.GRAPH_FEATURES` of each graph
+        graph_from_features
+            Function creating a graph from its arrays and labels
+        labels
+            Ground truth of each graph
+        """
+        self.store = store
+        self.graph_from_features = graph_from_features
+        self.labels = labels
+
+    def __len__(self) -> int:
+        """Return the number of graphs."""
+        return len(self.store)
+
+    def __getitem__(self, idx):
+        """Return the ``idx`` graph, or a list of graphs if ``idx`` is a slice."""
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"Graph index out of range: {idx}")
+
+        labels = None if self.labels is None or len(self.labels) == 0 else self.labels[idx]
+        return self.graph_from_features(self.get_features(idx), labels)
+
+    def get_features(self, idx: int) -> Dict[str, np.ndarray]:
+        """Return the arrays defining the ``idx`` graph without copying them."""
+        return {name: self.store.get(name, idx) for name in GRAPH_FEATURES}
+
+    def get_batch_features(self, indices: Sequence[int]) -> Tuple[Dict[str, np.ndarray], np.ndarray, np.ndarray]:
+        """Gather the arrays of the ``indices`` graphs as a single disconnected graph.
+
+        Returns
+        -------
+        Tuple with the concatenated arrays, the number of nodes and the number of edges of each graph
+
+        """
+        features = {}
+        for name in GRAPH_FEATURES:
+            features[name], counts = self.store.gather(name, indices)
+            if name == "positions":
+                num_nodes = counts
+            elif name == "edges":
+                num_edges = counts
+
+        # Shift the node indices of each graph
+        shift = np.repeat(np.cumsum(num_nodes) - num_nodes, num_edges)
+        features["edges"] = features["edges"] + shift[:, None]
+
+        return features, num_nodes, num_edges
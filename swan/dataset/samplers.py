@@ -0,0 +1,96 @@
+"""Samplers grouping the molecules into minibatches.
+
+API
+---
+.. autoclass:: BudgetBatchSampler
+
+"""
+from typing import Iterator, List, Optional
+
+import numpy as np
+from torch.utils.data import Sampler
+
+from ..type_hints import ArrayLike
+
+__all__ = ["BudgetBatchSampler"]
+
+
+class BudgetBatchSampler(Sampler):
+    """Group the samples into minibatches with up to ``max_size`` atoms (or edges) in total.
+
+    The samples are taken in order, or in random order if ``shuffle`` is set, and
+    added to the current minibatch while its total size does not exceed the budget.
+    A sample larger than the budget makes up a minibatch on its own.
+
+    With ``bucket_size`` the samples are split into buckets of that many consecutive
+    samples, each one sorted by size, so the minibatches contain molecules of
+    similar size. The order of the minibatches is then shuffled if ``shuffle`` is set.
+    """
+
+    def __init__(self, sizes: ArrayLike, max_size: int, shuffle: bool = False,
+                 bucket_size: Optional[int] = None, seed: Optional[int] = None) -> None:
+        """Create the sampler.
+
+        Parameters
+        ----------
+        sizes
+            Number of atoms (or edges) of each sample
+        max_size
+            Maximum total size of a minibatch
+        shuffle
+            Whether to shuffle the samples in each epoch
+        bucket_size
+            Number of samples sorted by size together, by default the samples are not sorted
+        seed
+            Seed of the random generator used to shuffle the samples
+        """
+        if max_size < 1:
+            msg = f"The size of the minibatches must be positive, got: {max_size}"
+            raise RuntimeError(msg)
+
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        self.max_size = max_size
+        self.shuffle = shuffle
+        self.bucket_size = bucket_size
+        self.generator = np.random.default_rng(seed)
+        self.batches = None  # type: Optional[List[List[int]]]
+
+    def __iter__(self) -> Iterator[List[int]]:
+        """Iterate over the minibatches of the epoch."""
+        batches = self.plan() if self.batches is None else self.batches
+        # A new plan is created for the next epoch
+        self.batches = None
+        return iter(batches)
+
+    def __len__(self) -> int:
+        """Return the number of minibatches of the next epoch."""
+        if self.batches is None:
+            self.batches = self.plan()
+        return len(self.batches)
+
+    def plan(self) -> List[List[int]]:
+        """Split the samples into minibatches."""
+        order = np.arange(len(self.sizes))
+        if self.shuffle:
+            order = self.generator.permutation(order)
+        if self.bucket_size is not None:
+            buckets = [order[i: i + self.bucket_size] for i in range(0, len(order), self.bucket_size)]
+            order = np.concatenate(
+                [np.empty(0, dtype=np.int64)] + [b[np.argsort(self.sizes[b], kind="stable")] for b in buckets])
+
+        batches = []  # type: List[List[int]]
+        batch = []  # type: List[int]
+        total = 0
+        for idx, size in zip(order.tolist(), self.sizes[order].tolist()):
+            if batch and total + size > self.max_size:
+                batches.append(batch)
+                batch, total = [], 0
+            batch.append(idx)
+            total += size
+        if batch:
+            batches.append(batch)
+
+        if self.shuffle and self.bucket_size is not None:
+            batches = [batches[i] for i in self.generator.permutation(len(batches))]
+
+        return batches
@@ -1,19 +1,32 @@
 import logging
+import multiprocessing
+from collections import Counter
+from typing import Optional, Tuple
 
 import pandas as pd
-from rdkit.Chem import AllChem
+from rdkit import Chem
+from rdkit.Chem import AllChem, rdDistGeom
 
 # Starting logger
 LOGGER = logging.getLogger(__name__)
 
 
-def sanitize_data(data: pd.DataFrame) -> pd.DataFrame:
+def sanitize_data(data: pd.DataFrame, nworkers: int = 1, max_iterations: int = 0,
+                  timeout: int = 0, random_seed: int = 0xf00d) -> pd.DataFrame:
     """Check that the data in the DataFrame is valid.
 
     Parameters
     ----------
     data
         Pandas Dataframe with the RDKit molecules
+    nworkers
+        Number of processes used to generate the conformers
+    max_iterations
+        Maximum number of embedding attempts for each molecule, 0 uses the RDKit default
+    timeout
+        Maximum time in seconds to embed each molecule, 0 means no limit
+    random_seed
+        Seed used to generate the conformers
 
     Returns
     -------
@@ -21,13 +34,61 @@ def sanitize_data(data: pd.DataFrame) -> pd.DataFrame:
 
     """
     # discard nan values
+    size = len(data)
     data.dropna(inplace=True)
+    reasons = Counter({"missing values": size - len(data)})
 
     # Create conformers
-    data['molecules'].apply(lambda mol: AllChem.EmbedMolecule(mol))
+    options = (max_iterations, timeout, random_seed)
+    if nworkers > 1 and len(data) > nworkers:
+        binaries = [mol.ToBinary() for mol in data['molecules']]
+        chunksize = max(1, len(binaries) // (4 * nworkers))
+        with multiprocessing.Pool(nworkers) as pool:
+            results = pool.starmap(
+                embed_molecule, ((binary, options) for binary in binaries), chunksize=chunksize)
+        data['molecules'] = [mol for mol, _ in results]
+    else:
+        results = [embed_molecule(mol, options) for mol in data['molecules']]
+
+    reasons.update(reason for _, reason in results if reason is not None)
 
     # Discard molecules that do not have conformer
     LOGGER.info("Removing molecules that don't have any conformer.")
     data = data[data['molecules'].apply(lambda x: x.GetNumConformers()) >= 1]
 
+    dropped = ", ".join(f"{reason}: {count}" for reason, count in reasons.items() if count > 0)
+    LOGGER.info(f"Discarded {size - len(data)} out of {size} molecules. {dropped}")
+
     return data
+
+
+def embed_molecule(mol, options: Tuple[int, int, int]) -> Tuple[Chem.rdchem.Mol, Optional[str]]:
+    """Generate a conformer for a molecule using ETKDG.
+
+    Parameters
+    ----------
+    mol
+        RDKit molecule or its binary representation
+    options
+        Maximum number of iterations, timeout and random seed of the embedding
+
+    Returns
+    -------
+    Tuple with the molecule and the reason why the embedding failed, if it failed.
+
+    """
+    if isinstance(mol, bytes):
+        mol = Chem.Mol(mol)
+
+    params = AllChem.ETKDGv3()
+    params.maxIterations, params.timeout, params.randomSeed = options
+    params.trackFailures = True
+
+    if AllChem.EmbedMolecule(mol, params) >= 0:
+        return mol, None
+
+    counts = params.GetFailureCounts()
+    if not any(counts):
+        return mol, "embedding failed"
+    cause = max(range(len(counts)), key=counts.__getitem__)
+    return mol, f"embedding failed ({rdDistGeom.EmbedFailureCauses.values[cause].name})"
@@ -0,0 +1,373 @@
+"""Train from fingerprints stored in shards that are read on demand.
+
+The fingerprints, labels and smiles are split into shards, each one a
+:class:`~swan.dataset.storage.PackedArrays` store, so the whole data
+never needs to be in memory.
+
+API
+---
+.. autofunction:: write_fingerprint_shards
+.. autoclass:: ShardedFingerprintsData
+.. autoclass:: ShardedDataset
+.. autoclass:: ShardedColumn
+
+"""
+from pathlib import Path
+from typing import Any, Dict, Generator, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+from ..type_hints import PathLike
+from .features.featurizer import generate_fingerprints, unpack_fingerprints
+from .storage import PackedArrays, write_packed_arrays
+from .swan_data_base import SwanDataBase
+
+__all__ = ["ShardedColumn", "ShardedDataset", "ShardedFingerprintsData", "write_fingerprint_shards"]
+
+SHARD_PREFIX = "shard-"
+
+
+def write_fingerprint_shards(
+        path_data: PathLike, path_shards: PathLike, properties: Union[str, List[str]],
+        type_fingerprint: Union[str, List[str]] = 'atompair', fingerprint_size: int = 2048,
+        shard_size: int = 100_000, sanitize: bool = True, nworkers: int = 1,
+        sanitize_options: Optional[Dict[str, Any]] = None, packed: bool = True) -> List[Path]:
+    """Compute the fingerprints of a csv file in chunks and store each chunk as a shard.
+
+    Parameters
+    ----------
+    path_data
+        path of the csv file
+    path_shards
+        Folder where the shards are written
+    properties
+        Labels names
+    type_fingerprint
+        Either ``atompair``, ``torsion`` or ``morgan``, or a list of them
+    fingerprint_size
+        Size of each fingerprint in bits
+    shard_size
+        Number of rows of the csv file in each shard
+    sanitize
+        Check that molecules have a valid conformer
+    nworkers
+        Number of processes used to generate the conformers and compute the fingerprints
+    sanitize_options
+        Options used to generate the conformers in the sanitization
+        (see :meth:`~swan.dataset.swan_data_base.SwanDataBase.set_sanitize_options`)
+    packed
+        Store the fingerprints bit-packed
+
+    Returns
+    -------
+    List with the paths of the shards
+
+    """
+    properties = properties if isinstance(properties, list) else [properties]
+    ntypes = 1 if isinstance(type_fingerprint, str) else len(type_fingerprint)
+    metadata = {"features": "fingerprints", "fingerprint": type_fingerprint,
+                "size": ntypes * fingerprint_size, "packed": packed, "properties": properties}
+
+    path_shards = Path(path_shards)
+    path_shards.mkdir(parents=True, exist_ok=True)
+    data = SwanDataBase()
+    data.nworkers = nworkers
+    data.set_sanitize_options(**(sanitize_options or {}))
+    shards = []
+    for dataframe in data.iter_data(path_data, chunksize=shard_size):
+        data.dataframe = dataframe
+        data.clean_dataframe(sanitize=sanitize)
+        if len(data.dataframe) == 0:
+            continue
+        fingerprints = generate_fingerprints(
+            data.dataframe["molecules"], type_fingerprint, fingerprint_size, nworkers=nworkers, packed=packed)
+        labels = data.get_labels(properties).numpy()
+        path = path_shards / f"{SHARD_PREFIX}{len(shards):05d}"
+        smiles = data.dataframe["smiles"].to_numpy(str)
+        write_packed_arrays(
+            path, {"fingerprints": fingerprints[:, None], "labels": labels[:, None], "smiles": smiles[:, None]},
+            metadata=metadata)
+        shards.append(path)
+
+    return shards
+
+
+class ShardedDataset(IterableDataset):
+    """Iterate over the minibatches of the fingerprints stored in shards.
+
+    The order of the shards is shuffled in every epoch, and their rows are mixed
+    in a shuffle buffer of at most ``buffer_size`` rows. If the dataset is read by
+    several DataLoader workers, each shard is read by a single worker.
+    """
+
+    def __init__(self, shards: Sequence[PathLike], batch_size: int = 64, shuffle: bool = False,
+                 buffer_size: int = 65536, seed: int = 0) -> None:
+        """Create the dataset.
+
+        Parameters
+        ----------
+        shards
+            Folders with the shards written by :func:`write_fingerprint_shards`
+        batch_size
+            Number of rows in each minibatch
+        shuffle
+            Shuffle the shards and their rows
+        buffer_size
+            Maximum number of rows kept in memory to shuffle them
+        seed
+            Seed of the shuffling, combined with the epoch
+        """
+        super().__init__()
+        self.shards = [Path(x) for x in shards]
+        self.sizes = [len(PackedArrays(x)) for x in self.shards]
+        self.metadata = PackedArrays(self.shards[0]).metadata if self.shards else {}
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.buffer_size = max(buffer_size, 2 * batch_size)
+        self.seed = seed
+        self.epoch = 0
+        self.transformer = None  # type: Any
+
+    def __len__(self) -> int:
+        """Return the number of rows in all the shards."""
+        return sum(self.sizes)
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch used to seed the shuffling, so each epoch has a different order."""
+        self.epoch = epoch
+
+    def worker_shards(self, rng: np.random.Generator) -> List[Path]:
+        """Return the shards read by the current worker, in the order they are read."""
+        order = rng.permutation(len(self.shards)) if self.shuffle else np.arange(len(self.shards))
+        info = get_worker_info()
+        if info is not None:
+            order = order[info.id::info.num_workers]
+        return [self.shards[i] for i in order]
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        """Yield the fingerprints and labels of each minibatch."""
+        rng = np.random.default_rng((self.seed, self.epoch))
+        if not self.shuffle:
+            for shard in self.worker_shards(rng):
+                store = PackedArrays(shard, mmap_mode='c')
+                for start in range(0, len(store), self.batch_size):
+                    rows = slice(start, start + self.batch_size)
+                    yield self.to_tensors(store.data["fingerprints"][rows], store.data["labels"][rows])
+            return
+
+        # Read each shard sequentially and mix its rows with those of the previous ones
+        features, labels = [], []  # type: List[np.ndarray], List[np.ndarray]
+        block = self.buffer_size // 2
+        for shard in self.worker_shards(rng):
+            store = PackedArrays(shard, mmap_mode='c')
+            for start in range(0, len(store), block):
+                features.append(np.asarray(store.data["fingerprints"][start: start + block]))
+                labels.append(np.asarray(store.data["labels"][start: start + block]))
+                stored = sum(len(x) for x in features)
+                if stored >= self.buffer_size:
+                    # Yield half of the buffer, keeping the rest to mix it with the next rows
+                    rest = yield from self.drain_buffer(rng, features, labels, stored - block)
+                    features, labels = [rest[0]], [rest[1]]
+
+        if features:
+            yield from self.drain_buffer(rng, features, labels, sum(len(x) for x in features))
+
+    def drain_buffer(self, rng: np.random.Generator, features: List[np.ndarray], labels: List[np.ndarray],
+                     size: int) -> Generator[Tuple[torch.Tensor, torch.Tensor], None, Tuple[np.ndarray, np.ndarray]]:
+        """Shuffle the rows in the buffer and yield ``size`` of them in minibatches.
+
+        Unless the whole buffer is drained, only complete minibatches are yielded.
+
+        Returns
+        -------
+        Tuple with the fingerprints and labels left in the buffer
+
+        """
+        order = rng.permutation(sum(len(x) for x in features))
+        features, labels = np.concatenate(features)[order], np.concatenate(labels)[order]
+        end = size if size == len(features) else size - size % self.batch_size
+        for start in range(0, end, self.batch_size):
+            stop = min(start + self.batch_size, end)
+            yield self.to_tensors(features[start: stop], labels[start: stop])
+        return features[end:], labels[end:]
+
+    def to_tensors(self, fingerprints: np.ndarray, labels: np.ndarray) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Expand the fingerprints and scale the labels of a minibatch."""
+        if self.metadata.get("packed", False):
+            fingerprints = unpack_fingerprints(np.asarray(fingerprints), self.metadata["size"])
+        if self.transformer is not None:
+            labels = self.transformer.transform(labels)
+        return (torch.from_numpy(np.asarray(fingerprints, dtype=np.float32)),
+                torch.from_numpy(np.asarray(labels, dtype=np.float32)))
+
+
+class ShardedColumn:
+    """Field of all the shards, read from their memory-mapped stores when it is indexed."""
+
+    def __init__(self, shards: Sequence[PathLike], name: str) -> None:
+        """Map the ``name`` field of the ``shards``."""
+        self.name = name
+        self.stores = [PackedArrays(x) for x in shards]
+        self.offsets = np.cumsum([0] + [len(store) for store in self.stores])
+        self.transformer = None  # type: Any
+
+    def __len__(self) -> int:
+        """Return the number of rows in all the shards."""
+        return int(self.offsets[-1])
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """Shape of the whole field."""
+        return (len(self),) + self.stores[0].data[self.name].shape[1:]
+
+    def read(self, rows: Union[slice, Sequence[int]]) -> np.ndarray:
+        """Read the values of the field in ``rows``, in the given order."""
+        rows = np.arange(len(self))[rows] if isinstance(rows, slice) else np.asarray(rows, dtype=np.int64)
+        shards = np.searchsorted(self.offsets, rows, side="right") - 1
+        order = np.argsort(shards, kind="stable")
+        # The width of the strings may differ between shards
+        dtype = np.result_type(*(store.data[self.name].dtype for store in self.stores))
+        values = np.empty((len(rows),) + self.shape[1:], dtype=dtype)
+        for k in np.unique(shards):
+            selected = order[shards[order] == k]
+            values[selected] = self.stores[k].data[self.name][rows[selected] - self.offsets[k]]
+        # Return the strings as objects, like the columns of a DataFrame
+        return values.astype(object) if values.dtype.kind == "U" else values
+
+    def __getitem__(self, rows: Union[slice, Sequence[int]]) -> np.ndarray:
+        """Read the values of the field in ``rows``, scaled by the ``transformer`` if any."""
+        values = self.read(rows)
+        return values if self.transformer is None else self.transformer.transform(values)
+
+
+class ShardedLabels(ShardedColumn):
+    """Labels of all the shards, returned as tensors when they are indexed."""
+
+    def __getitem__(self, rows: Union[slice, Sequence[int]]) -> torch.Tensor:
+        """Read the labels in ``rows``, scaled by the ``transformer`` if any."""
+        return torch.from_numpy(np.asarray(super().__getitem__(rows), dtype=np.float32))
+
+
+class ShardedFingerprintsData(SwanDataBase):
+    """Fingerprints data read from shards instead of being kept in memory."""
+
+    def __init__(self, path_shards: PathLike, buffer_size: int = 65536, seed: int = 0) -> None:
+        """Find the shards in ``path_shards``.
+
+        The smiles and labels are not read in memory, but from the memory-mapped
+        shards when they are indexed, like in ``data.labels[indices]``.
+
+        Parameters
+        ----------
+        path_shards
+            Folder with the shards written by :func:`write_fingerprint_shards`
+        buffer_size
+            Maximum number of rows kept in memory to shuffle the training data
+        seed
+            Seed used to split the shards and to shuffle the training data
+        """
+        super().__init__()
+        self.shards = sorted(x for x in Path(path_shards).iterdir() if PackedArrays.exists(x))
+        if not self.shards:
+            msg = f"There are no shards in: {path_shards}"
+            raise RuntimeError(msg)
+        self.buffer_size = buffer_size
+        self.seed = seed
+
+        self.dataset = ShardedDataset(self.shards, buffer_size=buffer_size, seed=seed)
+        self.labels = ShardedLabels(self.shards, "labels")
+        self.nlabels = self.labels.shape[1]
+
+    @property
+    def smiles(self) -> ShardedColumn:
+        """Smiles of the molecules, read from the shards when indexed."""
+        return ShardedColumn(self.shards, "smiles")
+
+    def create_data_loader(self,
+                           frac: Tuple[float, float] = (0.8, 0.2),
+                           batch_size: int = 64, **kwargs: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """Split the shards into a training and a validation set and create their loaders.
+
+        The training data is shuffled in every epoch.
+
+        Parameters
+        ----------
+        frac
+            fraction of the shards in the training and validation sets
+        batch_size
+            batchsize, by default 64
+        kwargs
+            Options of the loaders, replacing the previous ones (see :meth:`set_loader_options`)
+
+        Returns
+        -------
+        Tuple with the indices of the rows in the training and validation sets
+        """
+        if kwargs:
+            self.set_loader_options(**kwargs)
+
+        if len(self.shards) < 2:
+            msg = ("At least two shards are needed to split them into a training and a validation set, "
+                   "write the shards with a smaller shard_size")
+            raise RuntimeError(msg)
+        ntrain = min(max(int(round(frac[0] * len(self.shards))), 1), len(self.shards) - 1)
+        order = np.random.default_rng(self.seed).permutation(len(self.shards))
+        train, valid = np.sort(order[:ntrain]), np.sort(order[ntrain:])
+
+        self.train_dataset = self.create_dataset(train, batch_size, shuffle=True)
+        self.valid_dataset = self.create_dataset(valid, batch_size)
+        self.train_loader = self.create_loader(self.train_dataset, batch_size)
+        self.valid_loader = self.create_loader(self.valid_dataset, batch_size)
+
+        offsets = np.cumsum([0] + self.dataset.sizes)
+        return tuple(np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in shards] or [[]]).astype(np.int64)
+                     for shards in (train, valid))
+
+    def create_dataset(self, shards: np.ndarray, batch_size: int, shuffle: bool = False) -> ShardedDataset:
+        """Create a dataset reading the ``shards`` in minibatches of ``batch_size``."""
+        dataset = ShardedDataset([self.shards[i] for i in shards], batch_size=batch_size, shuffle=shuffle,
+                                 buffer_size=self.buffer_size, seed=self.seed)
+        dataset.transformer = self.dataset.transformer
+        return dataset
+
+    def create_loader(self, dataset: Any, batch_size: int) -> DataLoader:
+        """Create the loader iterating over the minibatches yielded by ``dataset``."""
+        return DataLoader(dataset, batch_size=None, **self.loader_options)
+
+    def create_prediction_loader(self, batch_size: int = 64) -> DataLoader:
+        """Create a loader iterating in order over all the shards, to predict them in minibatches."""
+        dataset = self.create_dataset(np.arange(len(self.shards)), batch_size)
+        options = dict(self.loader_options, num_workers=0)
+        options.pop("persistent_workers", None)
+        options.pop("prefetch_factor", None)
+        return DataLoader(dataset, batch_size=None, **options)
+
+    def scale_labels(self, sample_size: int = 100_000) -> None:
+        """Fit the scaling of the labels, which the datasets apply to each minibatch.
+
+        Parameters
+        ----------
+        sample_size
+            Maximum number of rows, chosen at random, used to fit the scaling
+        """
+        nrows = len(self.labels)
+        if nrows > sample_size:
+            rows = np.sort(np.random.default_rng(self.seed).choice(nrows, sample_size, replace=False))
+        else:
+            rows = np.arange(nrows)
+        self.transformer.fit(self.labels.read(rows))
+        self.labels.transformer = self.transformer
+        self.dataset.transformer = self.transformer
+        self.dump_scale()
+
+    def get_item(self, batch_data: List[Any]) -> Tuple[Any, torch.Tensor]:
+        """get the data/ground truth of a minibatch
+
+        Parameters
+        ----------
+        batch_data : [type]
+            data of the mini batch
+        """
+        return batch_data[0], batch_data[1]
@@ -0,0 +1,164 @@
+"""Store arrays of variable size in memory-mappable files.
+
+Each named field is saved as a single array with the entries concatenated
+along the first axis, together with the offsets where each entry starts.
+
+API
+---
+.. autoclass:: PackedArrays
+.. autofunction:: write_packed_arrays
+.. autofunction:: store_lock
+
+"""
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..type_hints import PathLike
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+__all__ = ["PackedArrays", "store_lock", "write_packed_arrays"]
+
+MANIFEST = "manifest.json"
+
+
+def write_packed_arrays(
+        path: PathLike, arrays: Mapping[str, Sequence[np.ndarray]],
+        metadata: Optional[Dict[str, Any]] = None) -> None:
+    """Concatenate the entries of each field and store them in the ``path`` folder.
+
+    The folder is written next to ``path`` and then moved into place, so
+    readers never see a partially written store.
+
+    Parameters
+    ----------
+    path
+        Folder where the arrays are stored
+    arrays
+        Dictionary from field names to the entries of that field. All the fields
+        must have the same number of entries
+    metadata
+        JSON serializable data to store in the manifest
+
+    """
+    path = Path(path)
+    sizes = {len(entries) for entries in arrays.values()}
+    if len(sizes) > 1:
+        msg = f"All the fields must have the same number of entries, got: {sizes}"
+        raise RuntimeError(msg)
+
+    tmp = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    for name, entries in arrays.items():
+        offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+        np.cumsum([len(x) for x in entries], out=offsets[1:])
+        np.save(tmp / f"{name}.npy", np.concatenate(entries))
+        np.save(tmp / f"{name}_offsets.npy", offsets)
+
+    manifest = {"fields": list(arrays), "size": sizes.pop() if sizes else 0,
+                "metadata": {} if metadata is None else metadata}
+    with open(tmp / MANIFEST, 'w') as handler:
+        json.dump(manifest, handler)
+
+    # Replace the old store, if any
+    old = path.with_name(f"{path.name}.old-{os.getpid()}")
+    if path.exists():
+        path.rename(old)
+    tmp.rename(path)
+    if old.exists():
+        shutil.rmtree(old)
+
+
+@contextmanager
+def store_lock(path: PathLike) -> Iterator[None]:
+    """Hold an exclusive lock on the store at ``path``.
+
+    Concurrent processes creating the same store wait for the first one to write it,
+    instead of all of them computing it. The lock is a no-op if ``fcntl`` is not available.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(f"{path.name}.lock"), 'w') as handler:
+        if fcntl is not None:
+            fcntl.flock(handler, fcntl.LOCK_EX)
+        yield
+
+
+class PackedArrays:
+    """Read the arrays stored with :func:`write_packed_arrays` using memory maps."""
+
+    def __init__(self, path: PathLike, mmap_mode: Optional[str] = 'r') -> None:
+        """Open the store.
+
+        Parameters
+        ----------
+        path
+            Folder containing the arrays
+        mmap_mode
+            Mode used by :func:`numpy.load` to map the arrays, ``None`` loads them in memory
+        """
+        self.path = Path(path)
+        self.mmap_mode = mmap_mode
+        with open(self.path / MANIFEST, 'r') as handler:
+            manifest = json.load(handler)
+
+        self.fields = manifest["fields"]
+        self.size = manifest["size"]
+        self.metadata = manifest["metadata"]
+        self.data = {name: np.load(self.path / f"{name}.npy", mmap_mode=mmap_mode) for name in self.fields}
+        self.offsets = {name: np.load(self.path / f"{name}_offsets.npy") for name in self.fields}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Pickle the memory-mapped store by its path, so other processes map the same files."""
+        if self.mmap_mode is None:
+            return self.__dict__
+        return {"path": self.path, "mmap_mode": self.mmap_mode}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """Restore the store, mapping its files again if they were mapped."""
+        if "data" in state:
+            self.__dict__.update(state)
+        else:
+            self.__init__(state["path"], mmap_mode=state["mmap_mode"])  # type: ignore
+
+    @staticmethod
+    def exists(path: PathLike) -> bool:
+        """Check whether ``path`` contains a store."""
+        return (Path(path) / MANIFEST).exists()
+
+    def __len__(self) -> int:
+        """Return the number of entries."""
+        return self.size
+
+    def get(self, name: str, idx: int) -> np.ndarray:
+        """Return the ``idx`` entry of the ``name`` field without copying it."""
+        offsets = self.offsets[name]
+        return self.data[name][offsets[idx]: offsets[idx + 1]]
+
+    def gather(self, name: str, indices: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Concatenate the ``indices`` entries of the ``name`` field.
+
+        Returns
+        -------
+        Tuple with the concatenated entries and the length of each entry
+
+        """
+        offsets = self.offsets[name]
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = offsets[indices]
+        counts = offsets[indices + 1] - starts
+        # position of each row in the concatenated entries
+        rows = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return self.data[name][rows], counts
@@ -1,22 +1,64 @@
 """Base class representing the data."""
+import json
 import pickle
 from pathlib import Path
-from typing import Any, List, Optional, Tuple, Union
+from typing import (Any, Callable, Dict, Iterator, List, Mapping, Optional,
+                    Sequence, Tuple, Union)
 
 import numpy as np
 import pandas as pd
 import torch
 from rdkit.Chem import PandasTools
 from sklearn.preprocessing import RobustScaler
-from torch.utils.data import DataLoader, Dataset, Subset
+from torch.utils.data import (BatchSampler, DataLoader, Dataset, RandomSampler,
+                              Sampler, SequentialSampler, Subset)
 
 from ..type_hints import PathLike
+from .cache import FeaturesCache, canonical_smiles
 from .geometry import read_geometries_from_files
 from .sanitize_data import sanitize_data
+from .storage import PackedArrays, write_packed_arrays
 
 __all__ = ["SwanDataBase"]
 
 
+def batch_data_loader(dataset: Dataset, batch_size: int = 64, shuffle: bool = False,
+                      drop_last: bool = False, batch_sampler: Optional[Sampler] = None,
+                      **kwargs: Any) -> DataLoader:
+    """Create a loader that retrieves each minibatch from ``dataset`` with a single call.
+
+    The dataset is indexed with the list of indices of the whole minibatch and must
+    return the collated batch, so no per-sample fetching or collation is performed.
+
+    Parameters
+    ----------
+    dataset
+        Dataset supporting indexing with a list of indices
+    batch_size
+        Number of samples in each minibatch
+    shuffle
+        Whether to shuffle the samples
+    drop_last
+        Whether to drop the last minibatch if it is incomplete
+    batch_sampler
+        Sampler yielding the indices of each minibatch, replacing the other options
+    kwargs
+        Other arguments passed to :class:`torch.utils.data.DataLoader`
+
+    """
+    if batch_sampler is None:
+        sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+        batch_sampler = BatchSampler(sampler, batch_size, drop_last)
+    return DataLoader(dataset, sampler=batch_sampler, batch_size=None, **kwargs)
+
+
+def is_batch_index(idx: Any) -> bool:
+    """Check whether ``idx`` selects several samples instead of a single one."""
+    if isinstance(idx, (int, np.integer)):
+        return False
+    return not (isinstance(idx, (np.ndarray, torch.Tensor)) and idx.ndim == 0)
+
+
 class SwanDataBase:
     """Base class for the data loaders."""
     def __init__(self) -> None:
@@ -32,6 +74,13 @@ class SwanDataBase:
 
         self.labels = torch.tensor([])
 
+        # Number of processes and options used to sanitize the molecules
+        self.nworkers = 1
+        self.set_sanitize_options()
+
+        # Options of the DataLoader used to load the minibatches
+        self.loader_options = {}  # type: Dict[str, Any]
+
         # Set of transformation apply to the dataset
         self.transformer = RobustScaler()
 
@@ -57,26 +106,62 @@ class SwanDataBase:
         pd.DataFrame
             data frame
         """
-        # create data frame
-        dataframe = pd.read_csv(data).reset_index(drop=True)
-        dataframe = dataframe.loc[:, ~dataframe.columns.str.contains('^Unnamed')]
-
-        # read geometries from file
-        if file_geometries is not None:
-            # i would say that if we want to read the geometry
-            # it has to be in the dataframe instead of a separate file
-            molecules, positions = read_geometries_from_files(file_geometries)
-            dataframe["molecules"] = molecules
-            dataframe["positions"] = positions
-
-        # ignore geometries
-        # do not initialize positions as sanitize_data
-        # will then erase all entries
-        else:
-            PandasTools.AddMoleculeColumnToFrame(dataframe,
-                                                 smilesCol='smiles',
-                                                 molCol='molecules')
-        return dataframe
+        return next(self.iter_data(data, file_geometries=file_geometries))
+
+    def iter_data(
+            self,
+            data: PathLike,
+            file_geometries: Optional[PathLike] = None,
+            chunksize: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """Process the data either at once or in chunks.
+
+        The compression of the file (e.g. gzip or zip) is inferred from its extension.
+
+        Parameters
+        ----------
+        data
+            filename of the data
+        file_geometries
+            file containing the geometry of the molecules, by default None
+        chunksize
+            number of rows in each chunk, by default the whole data is processed at once
+
+        Returns
+        -------
+        Iterator over the processed data frames
+
+        """
+        if file_geometries is not None and chunksize is not None:
+            raise RuntimeError("The geometries cannot be read in chunks")
+
+        chunks = [pd.read_csv(data)] if chunksize is None else pd.read_csv(data, chunksize=chunksize)
+        for dataframe in chunks:
+            dataframe = dataframe.drop(columns=dataframe.columns[dataframe.columns.str.contains('^Unnamed')])
+
+            # read geometries from file
+            if file_geometries is not None:
+                # i would say that if we want to read the geometry
+                # it has to be in the dataframe instead of a separate file
+                molecules, positions = read_geometries_from_files(file_geometries)
+                dataframe["molecules"] = molecules
+                dataframe["positions"] = positions
+
+            # ignore geometries
+            # do not initialize positions as sanitize_data
+            # will then erase all entries
+            else:
+                PandasTools.AddMoleculeColumnToFrame(dataframe,
+                                                     smilesCol='smiles',
+                                                     molCol='molecules')
+            yield dataframe
+
+    @staticmethod
+    def join_chunks(frames: List[pd.DataFrame], data: PathLike) -> pd.DataFrame:
+        """Join the data frames of the chunks of ``data``, checking that some molecules are left."""
+        if sum(len(dataframe) for dataframe in frames) == 0:
+            msg = f"There are no valid molecules in: {data}"
+            raise RuntimeError(msg)
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
 
     def get_labels(self, properties: Union[str, List[str]]) -> torch.Tensor:
         """extract the labels from the dataframe
@@ -108,12 +193,102 @@ class SwanDataBase:
             Remove molecules without conformer
         """
         if sanitize:
-            self.dataframe = sanitize_data(self.dataframe)
+            self.dataframe = sanitize_data(self.dataframe, nworkers=self.nworkers, **self.sanitize_options)
         self.dataframe.reset_index(drop=True, inplace=True)
 
+    def clean_and_featurize(
+            self, sanitize: bool,
+            featurizer: Callable[[pd.DataFrame], Mapping[str, Sequence[np.ndarray]]],
+            cache: FeaturesCache) -> Dict[str, List[np.ndarray]]:
+        """Sanitize the data and compute the features that are not in ``cache``.
+
+        Only the molecules that are not found in the cache are sanitized and featurized,
+        the features of the other molecules are read from the cache.
+
+        Parameters
+        ----------
+        sanitize
+            Remove molecules without conformer
+        featurizer
+            Function returning the features of each molecule in a dataframe
+        cache
+            Cache where the features are stored
+
+        Returns
+        -------
+        Dictionary from the feature names to the features of each molecule in the dataframe
+
+        """
+        if sanitize:
+            self.dataframe.dropna(inplace=True)
+        smiles = self.dataframe["molecules"].apply(canonical_smiles)
+
+        missing = self.dataframe[cache.lookup(smiles) < 0]
+        features = {}  # type: Mapping[str, Sequence[np.ndarray]]
+        failed = []  # type: List[str]
+        if sanitize:
+            # Skip the molecules that are known to fail the sanitization
+            missing = missing[~cache.is_failed(smiles[missing.index])]
+            sanitized = sanitize_data(missing.copy(), nworkers=self.nworkers, **self.sanitize_options)
+            failed = smiles[missing.index.difference(sanitized.index)].to_list()
+            missing = sanitized
+        if len(missing) > 0:
+            features = featurizer(missing.reset_index(drop=True))
+        cache.update(smiles[missing.index].to_list(), features, failed=failed)
+
+        indices = cache.lookup(smiles)
+        self.dataframe = self.dataframe[indices >= 0].reset_index(drop=True)
+        indices = indices[indices >= 0]
+
+        return {name: cache.get(name, indices) for name in cache.fields}
+
+    def set_sanitize_options(self, max_iterations: int = 0, timeout: int = 0, random_seed: int = 0xf00d) -> None:
+        """Set how the conformers of the molecules are generated when they are sanitized.
+
+        Parameters
+        ----------
+        max_iterations
+            Maximum number of embedding attempts for each molecule, 0 uses the RDKit default
+        timeout
+            Maximum time in seconds to embed each molecule, 0 means no limit
+        random_seed
+            Seed used to generate the conformers
+        """
+        self.sanitize_options = {"max_iterations": max_iterations, "timeout": timeout, "random_seed": random_seed}
+
+    def set_loader_options(self, num_workers: int = 0, pin_memory: bool = False,
+                           prefetch_factor: Optional[int] = None,
+                           persistent_workers: bool = False) -> None:
+        """Set how the loaders created afterwards retrieve the minibatches.
+
+        The worker processes share the featurized data with the main process: they
+        inherit it when forked, and the memory-mapped graph store is reopened, not
+        copied, when they are spawned.
+
+        Parameters
+        ----------
+        num_workers
+            Number of processes loading the minibatches, 0 loads them in the main process
+        pin_memory
+            Copy the minibatches into page-locked memory, speeding up their transfer to the GPU
+        prefetch_factor
+            Number of minibatches loaded in advance by each worker
+        persistent_workers
+            Keep the workers alive between epochs
+        """
+        if num_workers == 0 and (prefetch_factor is not None or persistent_workers):
+            msg = "prefetch_factor and persistent_workers require num_workers > 0"
+            raise RuntimeError(msg)
+
+        self.loader_options = {"num_workers": num_workers, "pin_memory": pin_memory}
+        if num_workers > 0:
+            self.loader_options["persistent_workers"] = persistent_workers
+        if prefetch_factor is not None:
+            self.loader_options["prefetch_factor"] = prefetch_factor
+
     def create_data_loader(self,
                            frac: Tuple[float, float] = (0.8, 0.2),
-                           batch_size: int = 64) -> Tuple[np.ndarray, np.ndarray]:
+                           batch_size: int = 64, **kwargs: Any) -> Tuple[np.ndarray, np.ndarray]:
         """create the train/valid data loaders using non-overlapping datasets.
 
         Parameters
@@ -122,7 +297,12 @@ class SwanDataBase:
             fraction to divide the dataset, by default [0.8, 0.2]
         batch_size
             batchsize, by default 64
+        kwargs
+            Options of the loaders, replacing the previous ones (see :meth:`set_loader_options`)
         """
+        if kwargs:
+            self.set_loader_options(**kwargs)
+
         ntotal = len(self.dataset)
         ntrain = int(frac[0] * ntotal)
 
@@ -132,14 +312,48 @@ class SwanDataBase:
         self.train_dataset = Subset(self.dataset, indices[:ntrain])
         self.valid_dataset = Subset(self.dataset, indices[ntrain:])
 
-        self.train_loader = self.data_loader_fun(dataset=self.train_dataset,
-                                                 batch_size=batch_size)
+        self.train_loader = self.create_loader(self.train_dataset, batch_size)
 
-        self.valid_loader = self.data_loader_fun(dataset=self.valid_dataset,
-                                                 batch_size=batch_size)
+        self.valid_loader = self.create_loader(self.valid_dataset, batch_size)
 
         return indices[:ntrain], indices[ntrain:]
 
+    def create_loader(self, dataset: Dataset, batch_size: int) -> DataLoader:
+        """Create the loader iterating over ``dataset`` in minibatches of ``batch_size``."""
+        return self.data_loader_fun(dataset=dataset, batch_size=batch_size, **self.loader_options)
+
+    def create_prediction_loader(self, batch_size: int = 64) -> DataLoader:
+        """Create a loader iterating in order over the whole dataset, to predict it in minibatches."""
+        return self.create_loader(self.dataset, batch_size)
+
+    @staticmethod
+    def is_stored(path: PathLike, config: Dict[str, Any]) -> bool:
+        """Check whether ``path`` contains the features computed with ``config``."""
+        return PackedArrays.exists(path) and PackedArrays(path).metadata.get("config") == json.loads(json.dumps(config))
+
+    def write_features_store(
+            self, path: PathLike, features: Mapping[str, Sequence[np.ndarray]], config: Dict[str, Any]) -> None:
+        """Publish the features of each molecule, together with the smiles and numeric columns of the dataframe.
+
+        Any property of the data can then be read from the store, without the csv file.
+        """
+        columns = self.dataframe.select_dtypes("number")
+        arrays = dict(features, smiles=self.dataframe["smiles"].to_numpy(str)[:, None],
+                      columns=columns.to_numpy(np.float64)[:, None])
+        write_packed_arrays(path, arrays, metadata={"config": config, "columns": list(columns)})
+
+    def read_features_store(self, path: PathLike) -> PackedArrays:
+        """Map the store at ``path`` and recreate the dataframe with the smiles and numeric columns."""
+        store = PackedArrays(path, mmap_mode='c')
+        self.dataframe = pd.DataFrame(np.asarray(store.data["columns"]), columns=store.metadata["columns"])
+        self.dataframe.insert(0, "smiles", np.asarray(store.data["smiles"]))
+        return store
+
+    @property
+    def smiles(self) -> np.ndarray:
+        """Smiles of the molecules, indexable by the rows of the data."""
+        return self.dataframe["smiles"].to_numpy()
+
     def scale_labels(self) -> None:
         """Create a new column with the transformed target."""
         self.labels = self.transformer.fit_transform(self.labels)
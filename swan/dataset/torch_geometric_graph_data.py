@@ -5,7 +5,7 @@ API
 .. autoclass:: TorchGeometricGraphData
 
 """
-from typing import Any, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import torch
 import torch_geometric as tg
@@ -13,7 +13,10 @@ from torch_geometric.data import Data
 
 from ..type_hints import PathLike
 from .data_graph_base import SwanGraphData
-from .graph.molecular_graph import create_molecular_torch_geometric_graph
+from .graph.molecular_graph import (torch_geometric_batch_from_features,
+                                    torch_geometric_graph_from_features)
+from .graph.packed_graphs import PackedGraphs
+from .swan_data_base import batch_data_loader, is_batch_index
 
 
 class TorchGeometricGraphData(SwanGraphData):
@@ -23,7 +26,14 @@ class TorchGeometricGraphData(SwanGraphData):
                  properties: Optional[Union[str, List[str]]] = None,
                  sanitize: bool = True,
                  file_geometries: Optional[PathLike] = None,
-                 optimize_molecule: bool = False
+                 optimize_molecule: bool = False,
+                 cache_dir: Optional[PathLike] = None,
+                 chunksize: Optional[int] = None,
+                 nworkers: int = 1,
+                 sanitize_options: Optional[Dict[str, Any]] = None,
+                 graph_store: Optional[PathLike] = None,
+                 lazy: bool = False,
+                 graph_cache_size: int = 4096
                  ) -> None:
         """Generate a dataset using graphs
 
@@ -39,19 +49,52 @@ class TorchGeometricGraphData(SwanGraphData):
             Path to a file with the geometries in PDB format
         optimize_molecule
             Optimize the geometry if the ``file_geometries`` is not provided
+        cache_dir
+            Folder used to cache the graph features between runs
+        chunksize
+            Process the data in chunks of ``chunksize`` rows
+        nworkers
+            Number of processes used to generate the conformers
+        sanitize_options
+            Options used to generate the conformers in the sanitization (see :meth:`set_sanitize_options`)
+        graph_store
+            Folder where the graphs are stored as memory-mapped arrays
+        lazy
+            Build each graph the first time it is requested
+        graph_cache_size
+            Maximum number of graphs kept in memory when ``lazy`` is ``True``
 
         """
-        self.graph_creator = create_molecular_torch_geometric_graph
+        self.graph_from_features = torch_geometric_graph_from_features
 
         super().__init__(
             data_path, properties=properties, sanitize=sanitize,
-            file_geometries=file_geometries, optimize_molecule=optimize_molecule)
+            file_geometries=file_geometries, optimize_molecule=optimize_molecule,
+            cache_dir=cache_dir, chunksize=chunksize, nworkers=nworkers,
+            sanitize_options=sanitize_options, graph_store=graph_store, lazy=lazy, graph_cache_size=graph_cache_size)
 
         # create the dataset
         self.dataset = TorchGeometricGraphDataset(self.molecular_graphs)
 
-        # define the loader type
-        self.data_loader_fun = tg.data.DataLoader
+        # define the loader type, retrieving each minibatch as a single batched graph
+        self.data_loader_fun = batch_data_loader
+
+    def apply_transform(self, transform: Callable[[Data], Data]) -> None:
+        """Transform each graph once, storing the result in place of the graph.
+
+        Use it to precompute quantities that do not change between epochs,
+        e.g. with :class:`~swan.modeller.models.equivariant_models.EdgeEmbedding`.
+
+        Parameters
+        ----------
+        transform
+            Function taking a graph and returning the transformed graph
+        """
+        graphs = self.molecular_graphs
+        if not isinstance(graphs, list):
+            msg = f"Only the graphs held in memory can be transformed, got: {type(graphs).__name__}"
+            raise RuntimeError(msg)
+        graphs[:] = [transform(graph) for graph in graphs]
 
     def get_item(self, batch_data: Any) -> Tuple[Any, torch.Tensor]:
         """get the data/ground truth of a minibatch
@@ -74,8 +117,13 @@ class TorchGeometricGraphData(SwanGraphData):
 
 class TorchGeometricGraphDataset(tg.data.Dataset):
     """Dataset for molecular graphs."""
-    def __init__(self, molecular_graphs: List[tg.data.Data]):
+    def __init__(self, molecular_graphs: Sequence[tg.data.Data]):
         """Generate a dataset using graphs
+
+        Parameters
+        ----------
+        molecular_graphs
+            Sequence of graphs, either a list or a :class:`~swan.dataset.graph.packed_graphs.PackedGraphs`
         """
         super().__init__()
         self.molecular_graphs = molecular_graphs
@@ -86,24 +134,43 @@ class TorchGeometricGraphDataset(tg.data.Dataset):
         """Return dataset length."""
         return len(self.molecular_graphs)
 
-    def __getitem__(self, idx: int) -> Data:
+    def len(self) -> int:
+        """Return dataset length."""
+        return len(self)
+
+    def get(self, idx: int) -> Data:
+        """Return the idx dataset element."""
+        return self[idx]
+
+    def __getitem__(self, idx: Any) -> Data:
         """Return the idx dataset element.
 
         Parameters
         ----------
         idx
-            Index of the graph to retrieve
+            Index of the graph to retrieve, or list of indices of a minibatch
 
         Returns
         -------
-        ``Data`` representing the graph
+        ``Data`` representing the graph, or ``Batch`` with the graphs of the minibatch
 
         """
         # get elements
-        out = self.molecular_graphs[idx]
+        out = self.get_batch(idx) if is_batch_index(idx) else self.molecular_graphs[idx]
 
         # normalize if necessary
         if self.normalize_feature:
             out = self.norm(out)
 
         return out
+
+    def get_batch(self, indices: Sequence[int]) -> tg.data.Batch:
+        """Return the graphs at ``indices`` collated in a single ``Batch``."""
+        graphs = self.molecular_graphs
+        if not isinstance(graphs, PackedGraphs):
+            return tg.data.Batch.from_data_list([graphs[i] for i in indices])
+
+        # Gather the arrays of all the graphs at once
+        features, num_nodes, _ = graphs.get_batch_features(indices)
+        labels = None if graphs.labels is None or len(graphs.labels) == 0 else graphs.labels[indices].reshape(-1)
+        return torch_geometric_batch_from_features(features, num_nodes, labels)
@@ -1,5 +1,15 @@
-from .gp_modeller import GPModeller
-from .scikit_modeller import SKModeller
-from .torch_modeller import TorchModeller
+from typing import TYPE_CHECKING
 
-__all__ = ["GPModeller", "SKModeller", "TorchModeller"]
+from ..utils.lazy_imports import lazy_imports
+
+if TYPE_CHECKING:
+    from .ensemble_modeller import EnsembleModeller
+    from .gp_modeller import GPModeller
+    from .scikit_modeller import SKModeller
+    from .torch_modeller import TorchModeller
+
+__all__ = ["EnsembleModeller", "GPModeller", "SKModeller", "TorchModeller"]
+
+__getattr__, __dir__ = lazy_imports(__name__, {
+    "EnsembleModeller": ".ensemble_modeller",
+    "GPModeller": ".gp_modeller", "SKModeller": ".scikit_modeller", "TorchModeller": ".torch_modeller"})
@@ -19,7 +19,7 @@ class BaseModeller(Generic[T_co]):
     def __init__(self, data: SwanDataBase, replace_state: bool) -> None:
         self.data = data
         self.state = StateH5(replace_state=replace_state)
-        self.smiles = data.dataframe.smiles.to_numpy()
+        self.smiles = data.smiles
 
     @abc.abstractmethod
     def train_model(self, nepoch: int, frac: Tuple[float, float] = (0.8, 0.2), **kwargs):
@@ -0,0 +1,156 @@
+"""Train several replicas of a model at once.
+
+API
+---
+.. autoclass:: EnsembleModeller
+
+"""
+import inspect
+import logging
+from functools import partial
+from typing import Any, List, Tuple
+
+import numpy as np
+import torch
+from torch import Tensor
+
+from ..dataset.swan_data_base import SwanDataBase
+from ..utils.early_stopping import EarlyStopping
+from .models.fingerprint_models import FingerprintEnsemble
+from .torch_modeller import TorchModeller
+
+__all__ = ["EnsembleModeller"]
+
+# Starting logger
+LOGGER = logging.getLogger(__name__)
+
+
+class EnsembleModeller(TorchModeller):
+    """Train the replicas of a :class:`~swan.modeller.models.fingerprint_models.FingerprintEnsemble` together.
+
+    The loss of the ensemble is the sum of the losses of the replicas, so each replica
+    gets the same gradients as if it was trained on its own. The optimizer must update
+    each weight independently (e.g. ``SGD``, ``Adam`` or ``RMSprop``), so every replica
+    keeps its own optimizer state. Each replica has its own early stopping and
+    checkpoint, and neither its weights nor its optimizer state are updated once it
+    stops early.
+    """
+
+    def __init__(self,
+                 network: FingerprintEnsemble,
+                 data: SwanDataBase,
+                 replace_state: bool = False,
+                 use_cuda: bool = False):
+        """Create the modeller.
+
+        Parameters
+        ----------
+        network
+            Ensemble of replicas
+        data
+            Torch Dataset
+        replace_state
+            Remove previous state file
+        use_cuda
+            Train the model using Cuda
+        """
+        super().__init__(network, data, replace_state=replace_state, use_cuda=use_cuda)
+        self.nreplicas = network.nreplicas
+        self.early_stopping = [EarlyStopping() for _ in range(self.nreplicas)]
+        self.stopped = torch.zeros(self.nreplicas, dtype=torch.bool, device=self.device)
+
+    def set_optimizer(self, name: str, *args, **kwargs) -> None:
+        """Set the optimizer, updating all the stacked weights at once if the optimizer supports it.
+
+        The fused implementation is used on the GPU and the multi-tensor (``foreach``)
+        one on the CPU, unless one of them is chosen in ``kwargs``.
+
+        Parameters
+        ----------
+        name
+            optimizer name
+
+        """
+        # Neither is the default on the CPU, and older versions of torch lack them
+        parameters = inspect.signature(getattr(torch.optim, name)).parameters
+        if "fused" not in kwargs and "foreach" not in kwargs:
+            if "fused" in parameters and self.device.type == "cuda":
+                kwargs["fused"] = True
+            elif "foreach" in parameters:
+                kwargs["foreach"] = True
+        super().set_optimizer(name, *args, **kwargs)
+
+    def replica_losses(self, prediction: Tensor, ground_truth: Tensor) -> Tensor:
+        """Compute the loss of each replica."""
+        return torch.stack([self.loss_func(prediction[:, i], ground_truth) for i in range(self.nreplicas)])
+
+    def train_batch(self, inp_data: Tensor, ground_truth: Tensor) -> Tuple[np.ndarray, Tensor]:
+        """Train all the replicas on a single mini batch
+
+        Returns
+        -------
+        Tuple with the loss of each replica and the predictions
+        """
+        prediction = self.forward(inp_data)
+        losses = self.replica_losses(prediction, ground_truth)
+        losses[~self.stopped].sum().backward()
+
+        # Leave the replicas that stopped early untouched, the optimizer
+        # would still update them with the moments of the previous steps
+        stopped = self.stopped.any()
+        if stopped:
+            frozen = [(tensor, tensor[self.stopped].clone()) for tensor in self.replica_tensors()]
+        self.optimizer.step()
+        if stopped:
+            with torch.no_grad():
+                for tensor, old in frozen:
+                    tensor[self.stopped] = old
+        self.optimizer.zero_grad()
+
+        return losses.detach().cpu().numpy(), prediction
+
+    def replica_tensors(self) -> List[Tensor]:
+        """Return the weights and optimizer state of the replicas, which are stacked along their first dimension."""
+        tensors = []
+        for weight in self.network.parameters():
+            tensors.append(weight.detach())
+            tensors.extend(value for value in self.optimizer.state[weight].values()
+                           if isinstance(value, Tensor) and value.ndim > 0)
+        return tensors
+
+    def evaluate_loss(self, predicted: Tensor, expected: Tensor) -> Any:
+        """Compute the loss of each replica on a validation minibatch."""
+        return self.replica_losses(predicted, expected).cpu().numpy()
+
+    def update_early_stopping(self, epoch: int) -> bool:
+        """Update the early stopping of each replica and check whether all of them stopped."""
+        for i, stopping in enumerate(self.early_stopping):
+            if not stopping.early_stop:
+                stopping(partial(self.save_replica, i), epoch, self.validation_loss[i])
+                if stopping.early_stop:
+                    LOGGER.info(f"EARLY STOPPING of replica {i}")
+                    self.stopped[i] = True
+
+        return all(stopping.early_stop for stopping in self.early_stopping)
+
+    def save_replica(self, idx: int, epoch: int, loss: float) -> None:
+        """Save the ``idx`` replica as a checkpoint of a single model."""
+        optimizer_state = self.optimizer.state_dict()
+        state = {key: {name: value[idx] if isinstance(value, Tensor) and value.ndim > 0 else value
+                       for name, value in param_state.items()}
+                 for key, param_state in optimizer_state["state"].items()}
+        replica_state = {
+            'epoch': epoch,
+            'model_state_dict': self.network.replica_state_dict(idx),
+            'optimizer_state_dict': {"state": state, "param_groups": optimizer_state["param_groups"]},
+            'loss': loss
+        }
+        self.checkpoints.save(self.workdir / f"swan_chk_{idx}.pt", replica_state, epoch, loss)
+
+    def inverse_transform(self, arr: Tensor) -> np.ndarray:
+        """Unscale ``arr``, either the ground truth or the predictions of all the replicas."""
+        if arr.ndim < 3:
+            return super().inverse_transform(arr)
+        nsamples, nreplicas, nlabels = arr.shape
+        unscaled = super().inverse_transform(arr.reshape(nsamples * nreplicas, nlabels))
+        return unscaled.reshape(nsamples, nreplicas, nlabels)
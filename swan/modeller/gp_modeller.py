@@ -54,6 +54,13 @@ class GPModeller(TorchModeller):
         """Set the loss function for the training."""
         self.loss_func = gp.mlls.ExactMarginalLogLikelihood(self.network.likelihood, self.network)
 
+    def set_mixed_precision(self, dtype=None) -> None:
+        """Gaussian Processes are always computed in full precision."""
+        if dtype is not None:
+            msg = "Gaussian Processes do not support mixed precision"
+            raise RuntimeError(msg)
+        super().set_mixed_precision(None)
+
     def split_data(self, partition: SplitDataset) -> None:
         """Save the smiles used for training and validation."""
         self.features_trainset = partition.features_trainset
@@ -121,6 +128,7 @@ class GPModeller(TorchModeller):
 
         # Save the models
         self.save_model(epoch, loss)
+        self.checkpoints.flush()
 
         # Store the loss
         self.state.store_array("loss_train", self.train_losses)
@@ -1,11 +1,21 @@
 """Models API."""
+from typing import TYPE_CHECKING
 
-from .equivariant_models import InvariantPolynomial
-from .fingerprint_models import FingerprintFullyConnected
-from .gaussian_process import GaussianProcess
-from .graph_models import MPNN
-from .se3_transformer import TFN, SE3Transformer
+from ...utils.lazy_imports import lazy_imports
+
+if TYPE_CHECKING:
+    from .equivariant_models import InvariantPolynomial
+    from .fingerprint_models import FingerprintEnsemble, FingerprintFullyConnected
+    from .gaussian_process import GaussianProcess
+    from .graph_models import MPNN
+    from .se3_transformer import TFN, SE3Transformer
 
 __all__ = [
-    "FingerprintFullyConnected", "GaussianProcess", "InvariantPolynomial",
+    "FingerprintEnsemble", "FingerprintFullyConnected", "GaussianProcess", "InvariantPolynomial",
     "MPNN", "SE3Transformer", "TFN"]
+
+__getattr__, __dir__ = lazy_imports(__name__, {
+    "InvariantPolynomial": ".equivariant_models", "FingerprintEnsemble": ".fingerprint_models",
+    "FingerprintFullyConnected": ".fingerprint_models",
+    "GaussianProcess": ".gaussian_process", "MPNN": ".graph_models",
+    "SE3Transformer": ".se3_transformer", "TFN": ".se3_transformer"})
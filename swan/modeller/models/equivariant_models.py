@@ -1,3 +1,5 @@
+from typing import Tuple
+
 import torch
 import torch_geometric as tg
 from e3nn import o3
@@ -7,28 +9,88 @@ from torch_scatter import scatter_add, segment_add_coo
 from swan.dataset.features.featurizer import (NUMBER_ATOMIC_GRAPH_FEATURES,
                                               NUMBER_BOND_GRAPH_FEATURES)
 
+__all__ = ["EdgeEmbedding", "InvariantPolynomial"]
+
+
+def edge_tensor_product(lmax: int) -> Tuple[o3.Irreps, TensorProduct]:
+    """Create the harmonic basis of the bonds and the product of the edge attributes with it."""
+    irreps_sh = o3.Irreps.spherical_harmonics(lmax)
+
+    # Edges attributes are scalars
+    representation_bonds = [(1, "0e") for _ in range(NUMBER_BOND_GRAPH_FEATURES)]
+
+    # Tensor product the edge attributes with the harmonic basis
+    # mul_edges = FullTensorProduct(representation_bonds, irreps_sh)
+    mul_edges = TensorProduct(
+        representation_bonds,
+        irreps_sh,
+        [(1, ir) for _, ir in irreps_sh],
+        [(0, l, l, "uvu", False) for l in range(lmax + 1)]
+    )
+    return irreps_sh, mul_edges
+
+
+def embed_edges(irreps_sh: o3.Irreps, mul_edges: TensorProduct, data: tg.data.Data) -> torch.Tensor:
+    """Compute the edge attributes in the harmonic basis of the bond vectors."""
+    # Vector defining the edges
+    edge_src, edge_dst = data.edge_index
+    edge_vec = data.positions[edge_src] - data.positions[edge_dst]
+
+    # Spherical harmonics
+    edge_sh = o3.spherical_harmonics(
+        irreps_sh, edge_vec, normalize=False, normalization='component')
+
+    # Edge attributes in the harmonic basis
+    return mul_edges(data.edge_attr, edge_sh)
+
+
+class EdgeEmbedding:
+    """Transform storing in each graph the quantities of :class:`InvariantPolynomial` that do not change.
+
+    The edge attributes in the harmonic basis are stored as ``edge_embedding``, the square
+    root of the number of bonds of each atom as ``bond_norm`` and the square root of
+    the number of atoms as ``atom_norm``. Use it with ``InvariantPolynomial(precomputed=True)``.
+    """
+
+    def __init__(self, lmax: int = 2) -> None:
+        """Create the transform for a model with spherical harmonics up to ``lmax``."""
+        self.irreps_sh, self.mul_edges = edge_tensor_product(lmax)
+
+    def __call__(self, data: tg.data.Data) -> tg.data.Data:
+        """Store the precomputed quantities in ``data``."""
+        with torch.no_grad():
+            data.edge_embedding = embed_edges(self.irreps_sh, self.mul_edges, data)
+        num_nodes = data.num_nodes
+        data.bond_norm = tg.utils.degree(data.edge_index[1], num_nodes).unsqueeze(-1) ** 0.5
+        data.atom_norm = torch.tensor([[float(num_nodes)]]) ** 0.5
+        return data
+
 
 class InvariantPolynomial(torch.nn.Module):
-    def __init__(self, irreps_out: str = "0e", lmax: int = 2) -> None:
+    def __init__(self, irreps_out: str = "0e", lmax: int = 2, precomputed: bool = False) -> None:
+        """Create the model.
+
+        Parameters
+        ----------
+        irreps_out
+            Irreducible representation of the output
+        lmax
+            Maximum degree of the spherical harmonics of the bonds
+        precomputed
+            Read the edge embedding and the normalizations from the graphs,
+            which must be transformed with :class:`EdgeEmbedding` beforehand
+        """
         super().__init__()
 
         # Different bond features
         self.num_bond_features = NUMBER_BOND_GRAPH_FEATURES
-        # Irreducible representation of the bonds
-        self.irreps_sh = o3.Irreps.spherical_harmonics(lmax)
+        self.precomputed = precomputed
 
-        # Edges and node attributes are scalars
-        representation_bonds = [(1, "0e") for _ in range(NUMBER_BOND_GRAPH_FEATURES)]
-        representation_atoms = f"{NUMBER_ATOMIC_GRAPH_FEATURES}x0e"
+        # Irreducible representation of the bonds and their product with the edge attributes
+        self.irreps_sh, self.mul_edges = edge_tensor_product(lmax)
 
-        # Tensor product the edge attributes with the harmonic basis
-        # self.mul_edges = FullTensorProduct(representation_bonds, self.irreps_sh)
-        self.mul_edges = TensorProduct(
-            representation_bonds,
-            self.irreps_sh,
-            [(1, ir) for _, ir in self.irreps_sh],
-            [(0, l, l, "uvu", False) for l in range(lmax + 1)]
-        )
+        # Node attributes are scalars
+        representation_atoms = f"{NUMBER_ATOMIC_GRAPH_FEATURES}x0e"
 
         self.seq = torch.nn.Sequential(
             torch.nn.Linear(NUMBER_ATOMIC_GRAPH_FEATURES, NUMBER_ATOMIC_GRAPH_FEATURES),
@@ -64,19 +126,19 @@ class InvariantPolynomial(torch.nn.Module):
         )
 
     def forward(self, data: tg.data.Dataset) -> torch.Tensor:
-        # Vector defining the edges
         edge_src, edge_dst = data.edge_index
-        edge_vec = data.positions[edge_src] - data.positions[edge_dst]
-
-        # Spherical harmonics
-        edge_sh = o3.spherical_harmonics(
-            self.irreps_sh, edge_vec, normalize=False, normalization='component')
-
-        # Edge attributes in the harmonic basis
-        edge_attr = self.mul_edges(data.edge_attr, edge_sh)
-
-        # Count the number of neighbors for each atom
-        num_of_bonds_per_atom = tg.utils.degree(edge_dst).unsqueeze(-1)
+        if self.precomputed:
+            if "edge_embedding" not in data:
+                msg = "The graphs do not contain the precomputed edge embedding, transform them with EdgeEmbedding"
+                raise RuntimeError(msg)
+            edge_attr = data.edge_embedding
+            bonds_norm = data.bond_norm
+        else:
+            # Edge attributes in the harmonic basis
+            edge_attr = embed_edges(self.irreps_sh, self.mul_edges, data)
+
+            # Count the number of neighbors for each atom
+            bonds_norm = tg.utils.degree(edge_dst).unsqueeze(-1) ** 0.5
 
         # For each edge, tensor product the node attributes with the
         # edge features in the spherical harmonics
@@ -85,27 +147,30 @@ class InvariantPolynomial(torch.nn.Module):
         node_features = scatter_add(edge_features, edge_dst, dim=0)
 
         # Normalize by the number of bonds for each atom
-        node_features = node_features.div(num_of_bonds_per_atom ** 0.5)
+        node_features = node_features.div(bonds_norm)
 
         # communicate information to the neighbors
         edge_features = self.tp2(node_features[edge_src], edge_attr)
         node_features = scatter_add(edge_features, edge_dst, dim=0)
 
         # Normalize by the number of bonds for each atom
-        node_features = node_features.div(num_of_bonds_per_atom ** 0.5)
+        node_features = node_features.div(bonds_norm)
 
         # communicate information to the neighbors
         edge_features = self.tp3(node_features[edge_src], edge_attr)
         node_features = scatter_add(edge_features, edge_dst, dim=0)
 
         # Normalize by the number of bonds for each atom
-        node_features = node_features.div(num_of_bonds_per_atom ** 0.5)
+        node_features = node_features.div(bonds_norm)
 
         # Sum for each molecule
         acc = segment_add_coo(node_features, data.batch)
 
-        # Count how many bonds are in a given batch
-        atoms_per_molecule_in_batch = tg.utils.degree(data.batch).unsqueeze(-1)
+        # Count how many atoms are in each molecule of the batch
+        if self.precomputed:
+            atoms_norm = data.atom_norm
+        else:
+            atoms_norm = tg.utils.degree(data.batch).unsqueeze(-1) ** 0.5
 
         # Normalize by the number of atoms beloging to a given molecule
-        return acc.div(atoms_per_molecule_in_batch ** 0.5)
+        return acc.div(atoms_norm)
@@ -1,8 +1,10 @@
 """Statistical models."""
+from typing import Dict, Optional, Sequence
 
+import torch
 from torch import Tensor, nn
 
-__all__ = ["FingerprintFullyConnected"]
+__all__ = ["FingerprintEnsemble", "FingerprintFullyConnected"]
 
 
 class FingerprintFullyConnected(nn.Module):
@@ -22,3 +24,62 @@ class FingerprintFullyConnected(nn.Module):
     def forward(self, tensor: Tensor) -> Tensor:
         """Run the model."""
         return self.seq(tensor)
+
+
+class FingerprintEnsemble(nn.Module):
+    """Replicas of :class:`FingerprintFullyConnected` evaluated together on the same input.
+
+    The weights of the replicas are stacked along a first dimension, with the layout of
+    the ``nn.Linear`` layers, and all the replicas are run with batched matrix products.
+    """
+
+    def __init__(self, nreplicas: int, input_features: int = 2048, hidden_cells: int = 100,
+                 num_labels: int = 1, seeds: Optional[Sequence[int]] = None):
+        """Create the replicas.
+
+        Parameters
+        ----------
+        nreplicas
+            Number of replicas
+        input_features
+            Size of the fingerprints
+        hidden_cells
+            Number of cells of the hidden layers
+        num_labels
+            Number of predicted properties
+        seeds
+            Seed used to initialize each replica, as a :class:`FingerprintFullyConnected`
+            created after ``torch.manual_seed(seed)``. By default the replicas are
+            initialized from the current random state
+        """
+        super().__init__()
+        if seeds is not None and len(seeds) != nreplicas:
+            msg = f"Expected {nreplicas} seeds, got: {len(seeds)}"
+            raise RuntimeError(msg)
+
+        replicas = []
+        for i in range(nreplicas):
+            with torch.random.fork_rng(enabled=seeds is not None):
+                if seeds is not None:
+                    torch.manual_seed(seeds[i])
+                replicas.append(FingerprintFullyConnected(input_features, hidden_cells, num_labels))
+
+        self.nreplicas = nreplicas
+        self.names = list(replicas[0].state_dict())
+        self.weights = nn.ParameterList(
+            nn.Parameter(torch.stack([replica.state_dict()[name] for replica in replicas]))
+            for name in self.names)
+
+    def forward(self, tensor: Tensor) -> Tensor:
+        """Run the replicas, returning a ``[batch, nreplicas, num_labels]`` tensor."""
+        w1, b1, w2, b2, w3, b3 = self.weights
+        # The input is shared, so the first layer of all the replicas is a single product
+        hidden = (tensor @ w1.flatten(0, 1).T).view(len(tensor), self.nreplicas, -1).transpose(0, 1)
+        hidden = torch.relu(hidden + b1.unsqueeze(1))
+        hidden = torch.relu(torch.baddbmm(b2.unsqueeze(1), hidden, w2.transpose(1, 2)))
+        out = torch.baddbmm(b3.unsqueeze(1), hidden, w3.transpose(1, 2))
+        return out.transpose(0, 1)
+
+    def replica_state_dict(self, idx: int) -> Dict[str, Tensor]:
+        """Return the state of the ``idx`` replica, which can be loaded by a :class:`FingerprintFullyConnected`."""
+        return {name: weight[idx].detach().clone() for name, weight in zip(self.names, self.weights)}
@@ -1,6 +1,9 @@
     
 """See: https://github.com/FabianFuchsML/se3-transformer-public"""
 
+from typing import Dict, Sequence, Tuple
+
+import dgl
 import torch
 from equivariant_attention.fibers import Fiber
 from equivariant_attention.modules import (GAvgPooling, GConvSE3, GMaxPooling,
@@ -9,7 +12,51 @@ from equivariant_attention.modules import (GAvgPooling, GConvSE3, GMaxPooling,
 from swan.dataset.features.featurizer import (NUMBER_ATOMIC_GRAPH_FEATURES,
                                               NUMBER_BOND_GRAPH_FEATURES)
 
-__all__ = ["TFN", "SE3Transformer"]
+__all__ = ["TFN", "SE3Transformer", "precompute_basis"]
+
+
+def basis_keys(max_degree: int) -> Tuple[str, ...]:
+    """Return the keys of the basis tensors up to ``max_degree``, as used by ``get_basis_and_r``."""
+    return tuple(f"{d_in},{d_out}" for d_in in range(max_degree + 1) for d_out in range(max_degree + 1))
+
+
+def precompute_basis(graphs: Sequence[dgl.DGLGraph], num_degrees: int, chunksize: int = 256) -> None:
+    """Store the equivariant basis and the edge lengths of each graph in its edge data.
+
+    The basis only depends on the relative positions ``G.edata['d']``, so for fixed
+    geometries it can be computed once. The stored tensors are batched together with
+    the graphs, and the models use them instead of recomputing the basis.
+
+    Parameters
+    ----------
+    graphs
+        Graphs held in memory, e.g. ``DGLGraphData.molecular_graphs``
+    num_degrees
+        Number of irreps used by the model
+    chunksize
+        Number of graphs whose basis is computed at once
+    """
+    if not isinstance(graphs, list):
+        msg = f"The basis can only be stored in graphs held in memory, got: {type(graphs).__name__}"
+        raise RuntimeError(msg)
+
+    for start in range(0, len(graphs), chunksize):
+        chunk = graphs[start: start + chunksize]
+        basis, r = get_basis_and_r(dgl.batch(chunk), num_degrees - 1)
+        sections = [g.num_edges() for g in chunk]
+        basis["r"] = r
+        for key, tensor in basis.items():
+            name = key if key == "r" else f"basis_{key}"
+            for graph, arr in zip(chunk, torch.split(tensor.detach(), sections)):
+                graph.edata[name] = arr
+
+
+def get_basis(G: dgl.DGLGraph, num_degrees: int) -> Tuple[Dict[str, torch.Tensor], torch.Tensor]:
+    """Return the basis and edge lengths stored by :func:`precompute_basis`, or compute them."""
+    keys = basis_keys(num_degrees - 1)
+    if "r" in G.edata and all(f"basis_{key}" in G.edata for key in keys):
+        return {key: G.edata[f"basis_{key}"] for key in keys}, G.edata["r"]
+    return get_basis_and_r(G, num_degrees - 1)
 
 
 class TFN(torch.nn.Module):
@@ -74,8 +121,8 @@ class TFN(torch.nn.Module):
         return torch.nn.ModuleList(block0), torch.nn.ModuleList(block1), torch.nn.ModuleList(block2)
 
     def forward(self, G):
-        # Compute equivariant weight basis from relative positions
-        basis, r = get_basis_and_r(G, self.num_degrees - 1)
+        # Compute equivariant weight basis from relative positions, unless it is precomputed
+        basis, r = get_basis(G, self.num_degrees)
 
         # encoder (equivariant layers)
         h = {'0': G.ndata['f']}
@@ -162,8 +209,8 @@ class SE3Transformer(torch.nn.Module):
         return torch.nn.ModuleList(Gblock), torch.nn.ModuleList(FCblock)
 
     def forward(self, G):
-        # Compute equivariant weight basis from relative positions
-        basis, r = get_basis_and_r(G, self.num_degrees - 1)
+        # Compute equivariant weight basis from relative positions, unless it is precomputed
+        basis, r = get_basis(G, self.num_degrees)
 
         # encoder (equivariant layers)
         h = {'0': G.ndata['f']}
@@ -1,14 +1,17 @@
 """class to create models with Pytorch statistical model."""
 
+import contextlib
 import logging
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Callable, ContextManager, Dict, Iterable, List, Optional, Tuple, Union
 
 import torch
 from torch import Tensor, nn
+from torch.utils.data import BatchSampler, DataLoader, RandomSampler
 
 from ..dataset.swan_data_base import SwanDataBase
 from ..type_hints import PathLike
+from ..utils.checkpoints import CheckpointManager
 from ..utils.early_stopping import EarlyStopping
 from .base_modeller import BaseModeller
 import numpy as np
@@ -65,6 +68,7 @@ class TorchModeller(BaseModeller[torch.Tensor]):
         # I/O options
         self.workdir = Path('.')
         self.path_scales = self.workdir / "swan_scales.pkl"
+        self.set_checkpoints()
 
         # current number of epoch
         self.epoch = 0
@@ -73,6 +77,15 @@ class TorchModeller(BaseModeller[torch.Tensor]):
         self.train_losses = []
         self.validation_losses = []
 
+        # Reuse the collated minibatches between epochs
+        self.set_batch_cache(validation=False)
+
+        # Run the network in full precision
+        self.set_mixed_precision(None)
+
+        # Run the network eagerly
+        self.set_compile(False)
+
     def set_optimizer(self, name: str, *args, **kwargs) -> None:
         """Set an optimizer using the config file
 
@@ -111,6 +124,133 @@ class TorchModeller(BaseModeller[torch.Tensor]):
             self.scheduler = getattr(torch.optim.lr_scheduler,
                                      name)(self.optimizer, *args, **kwargs)
 
+    def set_checkpoints(self, keep_best: int = 0, keep_last: int = 0, asynchronous: bool = True) -> None:
+        """Set how the checkpoints are saved.
+
+        Each checkpoint is written to a temporary file that then replaces it,
+        by default in a background thread so the training does not wait for it.
+
+        Parameters
+        ----------
+        keep_best
+            Number of checkpoints of the epochs with the lowest validation loss that are kept
+        keep_last
+            Number of checkpoints of the last epochs that are kept
+        asynchronous
+            Write the checkpoints in a background thread
+        """
+        if hasattr(self, "checkpoints"):
+            self.checkpoints.flush()
+        self.checkpoints = CheckpointManager(keep_best=keep_best, keep_last=keep_last, asynchronous=asynchronous)
+
+    def set_batch_cache(self, validation: bool = True, training: bool = False) -> None:
+        """Collate the minibatches once and reuse them, on the device, in every epoch.
+
+        Parameters
+        ----------
+        validation
+            Cache the minibatches of the validation set
+        training
+            Cache the minibatches of the training set, only if the training
+            samples are not shuffled
+        """
+        self.cache_batches = {"valid": validation, "train": training}
+        self.cached_batches = {}  # type: Dict[str, List[Tuple[Any, Tensor]]]
+
+    def set_mixed_precision(self, dtype: Optional[Union[str, torch.dtype]] = torch.bfloat16) -> None:
+        """Run the forward and backward passes of the network with autocast in ``dtype``.
+
+        The weights, the optimizer and the loss are kept in ``float32``, only the
+        operations supported by autocast (e.g. matrix products) run in ``dtype``.
+
+        Parameters
+        ----------
+        dtype
+            Either ``bfloat16``, which most CPUs with AVX512-BF16/AMX and GPUs support,
+            ``float16`` on GPUs, or ``None`` to run in full precision
+        """
+        if isinstance(dtype, str):
+            dtype = getattr(torch, dtype)
+        if dtype not in (None, torch.bfloat16, torch.float16):
+            msg = f"Mixed precision is only available with bfloat16 or float16, not with: {dtype}"
+            raise RuntimeError(msg)
+        if dtype is not None and not hasattr(torch, "autocast"):
+            msg = f"Mixed precision requires torch >= 1.10, found: {torch.__version__}"
+            raise RuntimeError(msg)
+        self.autocast_dtype = dtype
+
+    def set_compile(self, enabled: bool = True, dynamic: Optional[bool] = True, **kwargs: Any) -> None:
+        """Compile the network with :func:`torch.compile` to train it and predict with it.
+
+        If the network cannot be compiled, a warning is logged and the network runs eagerly.
+
+        Parameters
+        ----------
+        enabled
+            Compile the network, otherwise run it eagerly
+        dynamic
+            Compile the network for any size of the minibatches, so the graphs with a different
+            number of atoms and bonds in each minibatch do not trigger a recompilation
+        kwargs
+            Other options of :func:`torch.compile`, e.g. ``mode`` or ``backend``
+        """
+        self.compiled_network = None  # type: Optional[Callable[[Any], Tensor]]
+        if not enabled:
+            return
+        try:
+            self.compiled_network = torch.compile(self.network, dynamic=dynamic, **kwargs)
+        except Exception as err:
+            LOGGER.warning(f"The network cannot be compiled, running it eagerly: {err}")
+
+    def autocast(self) -> ContextManager[None]:
+        """Context to run the network with the mixed precision set by :meth:`set_mixed_precision`."""
+        if self.autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(self.device.type, dtype=self.autocast_dtype)
+
+    def forward(self, inp_data: Any) -> Tensor:
+        """Compute the output of the network in ``float32``, using mixed precision if enabled."""
+        with self.autocast():
+            prediction = self.run_network(inp_data)
+        return prediction.float()
+
+    def run_network(self, inp_data: Any) -> Tensor:
+        """Run the compiled network, falling back to the eager one if it cannot be compiled."""
+        if self.compiled_network is None:
+            return self.network(inp_data)
+        try:
+            return self.compiled_network(inp_data)
+        except Exception as err:
+            # Only the first line, the errors of the compiler are verbose
+            reason = str(err).strip().splitlines()[0] if str(err).strip() else type(err).__name__
+            LOGGER.warning(f"The network cannot be compiled, running it eagerly: {reason}")
+            self.compiled_network = None
+            return self.network(inp_data)
+
+    def iter_batches(self, name: str, loader: DataLoader) -> Iterable[Tuple[Any, Tensor]]:
+        """Iterate over the features and labels of the minibatches in ``loader``, moved to the device.
+
+        Parameters
+        ----------
+        name
+            Either ``train`` or ``valid``
+        loader
+            Loader of the minibatches
+        """
+        if name in self.cached_batches:
+            return self.cached_batches[name]
+
+        batches = ((x.to(self.device), y.to(self.device))
+                   for x, y in (self.data.get_item(batch_data) for batch_data in loader))
+        if not self.cache_batches[name]:
+            return batches
+        if is_shuffled(loader):
+            LOGGER.warning(f"The {name} samples are shuffled, their minibatches are not cached")
+            return batches
+
+        self.cached_batches[name] = list(batches)
+        return self.cached_batches[name]
+
     def split_data(self, frac: Tuple[float, float], batch_size: int):
         """Split the data into a training and validation set.
 
@@ -121,6 +261,7 @@ class TorchModeller(BaseModeller[torch.Tensor]):
         """
         # create the dataloader
         indices_train, indices_validate = self.data.create_data_loader(frac=frac, batch_size=batch_size)
+        self.cached_batches = {}
         self.labels_trainset = self.data.labels[indices_train]
         self.labels_validset = self.data.labels[indices_validate]
         self.store_trainset_in_state(np.concatenate((indices_train, indices_validate)), len(indices_validate), store_features=False)
@@ -152,13 +293,12 @@ class TorchModeller(BaseModeller[torch.Tensor]):
             # set the model to train mode
             # and init loss
             self.network.train()
+            if hasattr(self.data.train_dataset, "set_epoch"):
+                self.data.train_dataset.set_epoch(epoch)
             loss_all = 0.
 
             # iterate over the data loader
-            for batch_data in self.data.train_loader:
-                x_batch, y_batch = self.data.get_item(batch_data)
-                x_batch = x_batch.to(self.device)
-                y_batch = y_batch.to(self.device)
+            for x_batch, y_batch in self.iter_batches("train", self.data.train_loader):
                 loss_batch, predicted = self.train_batch(x_batch, y_batch)
                 loss_all += loss_batch
                 results.append(predicted)
@@ -176,13 +316,13 @@ class TorchModeller(BaseModeller[torch.Tensor]):
             # Check for early stopping
             self.validate_model()
             self.validation_losses.append(self.validation_loss)
-            self.early_stopping(self.save_model, epoch, self.validation_loss)
-            if self.early_stopping.early_stop:
+            if self.update_early_stopping(epoch):
                 LOGGER.info("EARLY STOPPING")
                 break
 
         # Save the models
         self.save_model(epoch, loss_all)
+        self.checkpoints.flush()
 
         # Store the loss
         self.state.store_array("loss_train", self.train_losses)
@@ -205,7 +345,7 @@ class TorchModeller(BaseModeller[torch.Tensor]):
         float
             loss over the mini batch
         """
-        prediction = self.network(inp_data)
+        prediction = self.forward(inp_data)
         loss = self.loss_func(prediction, ground_truth)
         loss.backward()
         self.optimizer.step()
@@ -228,13 +368,9 @@ class TorchModeller(BaseModeller[torch.Tensor]):
         with torch.no_grad():
             self.network.eval()
             loss_all = 0
-            for batch_data in self.data.valid_loader:
-                x_val, y_val = self.data.get_item(batch_data)
-                x_val = x_val.to(self.device)
-                y_val = y_val.to(self.device)
-                predicted = self.network(x_val)
-                loss = self.loss_func(predicted, y_val)
-                loss_all += loss.item()
+            for x_val, y_val in self.iter_batches("valid", self.data.valid_loader):
+                predicted = self.forward(x_val)
+                loss_all += self.evaluate_loss(predicted, y_val)
                 results.append(predicted)
                 expected.append(y_val)
             self.validation_loss = loss_all / len(self.data.valid_dataset)
@@ -242,13 +378,24 @@ class TorchModeller(BaseModeller[torch.Tensor]):
 
         return tuple(self.inverse_transform(torch.cat(x)) for x in (results, expected))
 
-    def predict(self, inp_data: Tensor) -> Tensor:
+    def evaluate_loss(self, predicted: Tensor, expected: Tensor) -> Any:
+        """Compute the loss of a validation minibatch."""
+        return self.loss_func(predicted, expected).item()
+
+    def update_early_stopping(self, epoch: int) -> bool:
+        """Update the early stopping with the current validation loss and check whether to stop."""
+        self.early_stopping(self.save_model, epoch, self.validation_loss)
+        return self.early_stopping.early_stop
+
+    def predict(self, inp_data: Union[Any, DataLoader]) -> Tensor:
         """compute output of the model for a given input
 
         Parameters
         ----------
         inp_data
-            input data of the network
+            input data of the network, or a loader (see
+            :meth:`~swan.dataset.swan_data_base.SwanDataBase.create_prediction_loader`)
+            to predict the data in minibatches
 
         Returns
         -------
@@ -257,25 +404,33 @@ class TorchModeller(BaseModeller[torch.Tensor]):
         """
         with torch.no_grad():
             self.network.eval()  # Set model to evaluation mode
-            predicted = self.network(inp_data)
-        return predicted
+            if not isinstance(inp_data, DataLoader):
+                return self.forward(inp_data)
+
+            predicted = []
+            for batch_data in inp_data:
+                x_batch, _ = self.data.get_item(batch_data)
+                predicted.append(self.forward(x_batch.to(self.device)))
+        return torch.cat(predicted)
 
     def save_model(self,
                    epoch: int,
                    loss: float,
                    filename: str = 'swan_chk.pt') -> None:
         """Save the modle current status."""
-        path = self.workdir / filename
-        torch.save(
-            {
-                'epoch': epoch,
-                'model_state_dict': self.network.state_dict(),
-                'optimizer_state_dict': self.optimizer.state_dict(),
-                'loss': loss
-            }, path)
+        state = {
+            'epoch': epoch,
+            'model_state_dict': self.network.state_dict(),
+            'optimizer_state_dict': self.optimizer.state_dict(),
+            'loss': loss
+        }
+        # Rank the checkpoints by the (mean) validation loss of the epoch
+        score = float(np.mean(getattr(self, "validation_loss", loss)))
+        self.checkpoints.save(self.workdir / filename, state, epoch, score)
 
     def load_model(self, filename: PathLike) -> None:
         """Load the model from the state file."""
+        self.checkpoints.flush()
         checkpoint = torch.load(filename)
         self.network.load_state_dict(checkpoint['model_state_dict'])
         self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
@@ -295,3 +450,13 @@ class TorchModeller(BaseModeller[torch.Tensor]):
             return self.data.transformer.inverse_transform(_detach(arr))
         except sklearn.exceptions.NotFittedError:
             return _detach(arr)
+
+
+def is_shuffled(loader: DataLoader) -> bool:
+    """Check whether ``loader`` iterates over the samples in a different order in each epoch."""
+    sampler = loader.sampler
+    if isinstance(sampler, BatchSampler):
+        sampler = sampler.sampler
+    shuffled = isinstance(sampler, RandomSampler) or getattr(sampler, "shuffle", False)
+    # Iterable datasets shuffle the samples themselves
+    return shuffled or getattr(loader.dataset, "shuffle", False)
@@ -0,0 +1,169 @@
+"""Write the checkpoints of the training in a background thread.
+
+The state of the training is copied in memory and written to a temporary
+file, which then replaces the checkpoint, so a checkpoint is never left
+half written. A snapshot that is superseded by a newer one for the same
+file before being written is discarded.
+
+API
+---
+.. autoclass:: CheckpointManager
+
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import torch
+
+from ..type_hints import PathLike
+
+__all__ = ["CheckpointManager"]
+
+# Starting logger
+LOGGER = logging.getLogger(__name__)
+
+
+def snapshot_state(state: Any) -> Any:
+    """Copy the tensors in ``state`` to the CPU, so the training can keep updating them."""
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, dict):
+        return type(state)((key, snapshot_state(value)) for key, value in state.items())
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot_state(value) for value in state)
+    return state
+
+
+def write_atomic(path: Path, state: Optional[Any]) -> None:
+    """Write ``state`` to a temporary file and rename it to ``path``, or remove ``path`` if ``state`` is None."""
+    if state is None:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        return
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "wb") as handler:
+        torch.save(state, handler)
+        handler.flush()
+        os.fsync(handler.fileno())
+    os.replace(tmp, path)
+
+
+class CheckpointManager:
+    """Save the checkpoints of the training, by default in a background thread.
+
+    Besides the checkpoint itself, which is always the last saved state, the
+    checkpoints of the ``keep_best`` epochs with the lowest loss and of the
+    last ``keep_last`` epochs are kept in files named ``<name>_epoch<epoch>``.
+    """
+
+    def __init__(self, keep_best: int = 0, keep_last: int = 0, asynchronous: bool = True) -> None:
+        """Create the manager.
+
+        Parameters
+        ----------
+        keep_best
+            Number of checkpoints with the lowest loss kept for each file
+        keep_last
+            Number of checkpoints of the last epochs kept for each file
+        asynchronous
+            Write the checkpoints in a background thread, otherwise they are written
+            before :meth:`save` returns
+        """
+        self.keep_best = keep_best
+        self.keep_last = keep_last
+        self.asynchronous = asynchronous
+        # Snapshot to write to each file, or None to remove it
+        self.pending = OrderedDict()  # type: OrderedDict[Path, Optional[Any]]
+        # Loss of the epochs kept for each file
+        self.history = {}  # type: Dict[Path, Dict[int, float]]
+        self.error = None  # type: Optional[BaseException]
+        self.condition = threading.Condition()
+        self.thread = None  # type: Optional[threading.Thread]
+
+    def save(self, path: PathLike, state: Dict[str, Any], epoch: int, loss: float) -> None:
+        """Save a snapshot of ``state`` in ``path``.
+
+        Parameters
+        ----------
+        path
+            Checkpoint file
+        state
+            State of the training, its tensors are copied before returning
+        epoch
+            Current epoch
+        loss
+            Loss used to rank the checkpoints
+        """
+        path = Path(path)
+        snapshot = snapshot_state(state)
+        with self.condition:
+            self.raise_error()
+            self.pending[path] = snapshot
+            if self.keep_best > 0 or self.keep_last > 0:
+                self.pending[self.epoch_path(path, epoch)] = snapshot
+                self.update_history(path, epoch, loss)
+            if self.asynchronous and self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="swan-checkpoints", daemon=True)
+                self.thread.start()
+
+        if not self.asynchronous:
+            self.flush()
+
+    @staticmethod
+    def epoch_path(path: Path, epoch: int) -> Path:
+        """Return the file of the checkpoint of ``epoch`` kept besides ``path``."""
+        return path.with_name(f"{path.stem}_epoch{epoch:04d}{path.suffix}")
+
+    def update_history(self, path: Path, epoch: int, loss: float) -> None:
+        """Add the checkpoint of ``epoch`` and discard those that are neither among the best nor the last."""
+        history = self.history.setdefault(path, {})
+        history[epoch] = float(loss)
+        last = sorted(history)[-self.keep_last:] if self.keep_last > 0 else []
+        best = sorted(history, key=history.__getitem__)[:self.keep_best]
+        for old in set(history).difference(last, best):
+            del history[old]
+            old_path = self.epoch_path(path, old)
+            if self.pending.get(old_path) is not None:
+                # Not written yet
+                del self.pending[old_path]
+            else:
+                self.pending[old_path] = None
+
+    def run(self) -> None:
+        """Write the pending checkpoints in the order they were saved, until there are none left."""
+        while True:
+            with self.condition:
+                if not self.pending:
+                    self.thread = None
+                    self.condition.notify_all()
+                    return
+                path, snapshot = self.pending.popitem(last=False)
+            try:
+                write_atomic(path, snapshot)
+            except Exception as err:
+                LOGGER.error(f"The checkpoint {path} could not be written: {err}")
+                with self.condition:
+                    self.error = err
+
+    def flush(self) -> None:
+        """Wait until all the checkpoints are written."""
+        with self.condition:
+            if not self.asynchronous:
+                while self.pending:
+                    write_atomic(*self.pending.popitem(last=False))
+            while self.thread is not None:
+                self.condition.wait()
+            self.raise_error()
+
+    def raise_error(self) -> None:
+        """Raise the error of the last checkpoint that could not be written."""
+        if self.error is not None:
+            err, self.error = self.error, None
+            msg = f"A checkpoint could not be written: {err}"
+            raise RuntimeError(msg) from err
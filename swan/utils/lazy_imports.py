@@ -0,0 +1,43 @@
+"""Import the objects of a package only when they are first used.
+
+Heavy backends (DGL, PyTorch Geometric, e3nn, gpytorch, ...) are only
+loaded when an object that needs them is requested from the package.
+
+API
+---
+.. autofunction:: lazy_imports
+
+"""
+from importlib import import_module
+from typing import Any, Callable, List, Mapping, Tuple
+
+__all__ = ["lazy_imports"]
+
+
+def lazy_imports(package: str, imports: Mapping[str, str]) -> Tuple[Callable[[str], Any], Callable[[], List[str]]]:
+    """Create the module ``__getattr__`` and ``__dir__`` functions of ``package`` (see PEP 562).
+
+    Parameters
+    ----------
+    package
+        Name of the package exporting the objects
+    imports
+        Dictionary from the name of each object to the (relative) module where it is defined
+
+    Returns
+    -------
+    Tuple with the ``__getattr__`` and ``__dir__`` functions of the package
+
+    """
+    def __getattr__(name: str) -> Any:
+        if name not in imports:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(import_module(imports[name], package), name)
+        # Store the object in the package, so it is only imported once
+        setattr(import_module(package), name, value)
+        return value
+
+    def __dir__() -> List[str]:
+        return sorted({*vars(import_module(package)), *imports})
+
+    return __getattr__, __dir__
@@ -0,0 +1,26 @@
+"""Fixtures shared by the tests."""
+
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+import pytest
+
+from .utils_test import PATH_TEST
+
+
+@pytest.fixture
+def make_csv(tmp_path: Path) -> Callable[[int], Path]:
+    """Return a function writing the first ``nrows`` rows of ``thousand.csv`` to a temporary file."""
+    def write_rows(nrows: int) -> Path:
+        path_csv = tmp_path / "data.csv"
+        pd.read_csv(PATH_TEST / "thousand.csv")[:nrows].to_csv(path_csv)
+        return path_csv
+
+    return write_rows
+
+
+@pytest.fixture
+def path_csv(make_csv: Callable[[int], Path]) -> Path:
+    """Temporary file with the first 20 rows of ``thousand.csv``."""
+    return make_csv(20)
@@ -0,0 +1,96 @@
+"""Test the on-disk cache of the molecular features."""
+
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from swan.dataset import DGLGraphData, FingerprintsData
+from swan.dataset.cache import FeaturesCache
+from swan.dataset.sanitize_data import sanitize_data
+
+
+def test_cache_update(tmp_path: Path):
+    """Check that new features are appended to the cache."""
+    cache = FeaturesCache(tmp_path, {"features": "test"})
+    cache.update(["C", "CC"], {"x": [np.ones((1, 2)), np.zeros((3, 2))]})
+    first = cache.path / cache.segments[0] / "x.npy"
+    mtime = first.stat().st_mtime_ns
+    cache.update(["CCC"], {"x": [np.full((2, 2), 2.)]})
+
+    # The new features are appended without rewriting the old ones
+    cache = FeaturesCache(tmp_path, {"features": "test"})
+    assert len(cache.segments) == 2
+    assert first.stat().st_mtime_ns == mtime
+    indices = cache.lookup(["CCC", "CO", "C"])
+    assert indices.tolist() == [2, -1, 0]
+    x = cache.get("x", indices[[0, 2]])
+    assert np.array_equal(x[0], np.full((2, 2), 2.))
+    assert np.array_equal(x[1], np.ones((1, 2)))
+
+    # Another configuration has its own cache
+    assert FeaturesCache(tmp_path, {"features": "other"}).lookup(["C"]).tolist() == [-1]
+
+
+def test_cache_concurrent_updates(tmp_path: Path):
+    """Check that the caches opened by different processes keep the updates of each other."""
+    first = FeaturesCache(tmp_path, {"features": "test"})
+    second = FeaturesCache(tmp_path, {"features": "test"})
+    first.update(["C"], {"x": [np.ones((1, 2))]}, failed=["F"])
+    second.update(["CC"], {"x": [np.zeros((3, 2))]}, failed=["Cl"])
+    first.update([], {}, failed=["Br"])
+    assert first.lookup(["CC"]).tolist() == [1]
+
+    cache = FeaturesCache(tmp_path, {"features": "test"})
+    assert len(cache.segments) == 2
+    assert (cache.lookup(["C", "CC"]) >= 0).all()
+    assert cache.is_failed(["F", "Cl", "Br", "C"]).tolist() == [True, True, True, False]
+    assert np.array_equal(cache.get("x", cache.lookup(["CC"]))[0], np.zeros((3, 2)))
+
+
+def test_fingerprints_cache(tmp_path: Path, make_csv):
+    """Check that the cached fingerprints are equal to the computed ones."""
+    path_csv = make_csv(50)
+
+    expected = FingerprintsData(path_csv, properties=["Hardness (eta)"], sanitize=False)
+    first = FingerprintsData(path_csv, properties=["Hardness (eta)"], sanitize=False, cache_dir=tmp_path)
+
+    # Add new molecules to the data
+    make_csv(80)
+    second = FingerprintsData(path_csv, properties=["Hardness (eta)"], sanitize=False, cache_dir=tmp_path)
+
+    assert torch.equal(expected.fingerprints, first.fingerprints)
+    assert torch.equal(first.fingerprints, second.fingerprints[:50])
+    assert torch.equal(first.labels, second.labels[:50])
+    assert len(second.fingerprints) == 80
+
+
+def test_graph_cache(tmp_path: Path, path_csv: Path):
+    """Check that the graphs are recovered from the cache."""
+
+    first = DGLGraphData(path_csv, properties=["Hardness (eta)"], cache_dir=tmp_path)
+    second = DGLGraphData(path_csv, properties=["Hardness (eta)"], cache_dir=tmp_path)
+
+    assert len(first.molecular_graphs) == len(second.molecular_graphs)
+    assert torch.equal(first.labels, second.labels)
+    for g1, g2 in zip(first.molecular_graphs, second.molecular_graphs):
+        assert all(torch.equal(x, y) for x, y in zip(g1.edges(), g2.edges()))
+        assert all(torch.equal(g1.ndata[k], g2.ndata[k]) for k in ("x", "f"))
+        assert all(torch.equal(g1.edata[k], g2.edata[k]) for k in ("d", "w"))
+
+
+def test_cache_failed_molecules(tmp_path: Path, mocker, path_csv: Path):
+    """Check that the molecules that fail the sanitization are not sanitized again."""
+
+    def drop_first(data, **kwargs):
+        return sanitize_data(data, **kwargs).iloc[1:]
+
+    mocker.patch("swan.dataset.swan_data_base.sanitize_data", side_effect=drop_first)
+    first = FingerprintsData(path_csv, properties=["Hardness (eta)"], cache_dir=tmp_path)
+    assert len(first.dataframe) == 19
+
+    spy = mocker.patch("swan.dataset.swan_data_base.sanitize_data", side_effect=sanitize_data)
+    second = FingerprintsData(path_csv, properties=["Hardness (eta)"], cache_dir=tmp_path)
+    assert len(spy.call_args[0][0]) == 0
+    assert second.dataframe.smiles.to_list() == first.dataframe.smiles.to_list()
+    assert torch.equal(first.fingerprints, second.fingerprints)
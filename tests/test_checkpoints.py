@@ -0,0 +1,63 @@
+"""Test the writing of the checkpoints."""
+import threading
+from pathlib import Path
+from unittest import mock
+
+import pytest
+import torch
+
+from swan.utils import checkpoints
+from swan.utils.checkpoints import CheckpointManager
+
+
+@pytest.mark.parametrize("asynchronous", [True, False])
+def test_checkpoints_kept(tmp_path: Path, asynchronous: bool):
+    """Check that the best and last checkpoints are kept."""
+    manager = CheckpointManager(keep_best=1, keep_last=2, asynchronous=asynchronous)
+    weights = torch.zeros(3)
+    for epoch, loss in enumerate([3., 1., 2., 4., 5.]):
+        weights += 1
+        manager.save(tmp_path / "swan_chk.pt", {"epoch": epoch, "weights": weights}, epoch, loss)
+    weights += 1
+    manager.flush()
+
+    names = sorted(x.name for x in tmp_path.iterdir())
+    assert names == ["swan_chk.pt", "swan_chk_epoch0001.pt", "swan_chk_epoch0003.pt", "swan_chk_epoch0004.pt"]
+    state = torch.load(tmp_path / "swan_chk.pt")
+    assert state["epoch"] == 4
+    assert torch.equal(state["weights"], torch.full((3,), 5.))
+    assert torch.load(tmp_path / "swan_chk_epoch0001.pt")["epoch"] == 1
+
+
+def test_checkpoints_coalesced(tmp_path: Path):
+    """Check that the snapshots superseded before being written are discarded."""
+    started, release = threading.Event(), threading.Event()
+    written = []
+
+    def slow_write(path, state):
+        started.set()
+        release.wait()
+        written.append(state["epoch"])
+        torch.save(state, path)
+
+    manager = CheckpointManager()
+    with mock.patch.object(checkpoints, "write_atomic", side_effect=slow_write):
+        manager.save(tmp_path / "swan_chk.pt", {"epoch": 0}, 0, 1.)
+        started.wait()
+        # The first snapshot is being written, the next ones supersede each other
+        for epoch in range(1, 4):
+            manager.save(tmp_path / "swan_chk.pt", {"epoch": epoch}, epoch, 1.)
+        release.set()
+        manager.flush()
+
+    assert written == [0, 3]
+    assert torch.load(tmp_path / "swan_chk.pt")["epoch"] == 3
+
+
+def test_checkpoints_error(tmp_path: Path):
+    """Check that the errors of the background thread are raised."""
+    manager = CheckpointManager()
+    manager.save(tmp_path / "missing" / "swan_chk.pt", {"epoch": 0}, 0, 1.)
+    with pytest.raises(RuntimeError):
+        manager.flush()
+    assert not list(tmp_path.iterdir())
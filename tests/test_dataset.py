@@ -1,5 +1,19 @@
+import json
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+import torch_geometric as tg
+from rdkit import Chem
+from rdkit.Chem import AllChem
 
 from swan.dataset import FingerprintsData, TorchGeometricGraphData, DGLGraphData
+from swan.dataset.data_graph_base import SwanGraphData
+from swan.dataset.dgl_graph_data import collate_fn
+from swan.dataset.geometry import convert_json_geometries, read_geometries_from_files
 from .utils_test import PATH_TEST
 
 
@@ -12,6 +26,52 @@ def test_fingerprint_dataset():
     data.create_data_loader()
 
 
+def test_packed_fingerprint_dataset():
+    """Check that the bit-packed fingerprints expand to the dense ones."""
+    dense = FingerprintsData(PATH_CSV, properties=["Hardness (eta)"], sanitize=False)
+    packed = FingerprintsData(PATH_CSV, properties=["Hardness (eta)"], sanitize=False, packed=True)
+
+    assert packed.dataset.fingerprints.dtype == torch.uint8
+    assert packed.dataset.fingerprints.shape == (len(dense.fingerprints), 2048 // 8)
+    assert torch.equal(dense.fingerprints, packed.fingerprints)
+
+    features, _ = packed.dataset[[3, 1, 4]]
+    assert features.dtype == torch.float32
+    assert torch.equal(features, dense.fingerprints[[3, 1, 4]])
+
+
+def test_fingerprint_dataset_in_chunks(tmp_path):
+    """Check that a compressed file read in chunks gives the same fingerprints."""
+    path_gz = tmp_path / "thousand.csv.gz"
+    pd.read_csv(PATH_CSV).to_csv(path_gz)
+
+    expected = FingerprintsData(PATH_CSV, properties=["Hardness (eta)"], sanitize=False)
+    data = FingerprintsData(path_gz, properties=["Hardness (eta)"], sanitize=False, chunksize=300)
+
+    assert "molecules" not in data.dataframe
+    assert data.dataframe.smiles.tolist() == expected.dataframe.smiles.tolist()
+    assert torch.equal(expected.fingerprints, data.fingerprints)
+    assert torch.equal(expected.labels, data.labels)
+
+
+def test_fingerprint_store(tmp_path: Path, mocker, make_csv):
+    """Check that the processes training different properties share the stored fingerprints."""
+    path_csv = make_csv(50)
+    path_store = tmp_path / "fingerprints"
+
+    expected = FingerprintsData(path_csv, properties=["Hardness (eta)"], packed=True)
+    first = FingerprintsData(path_csv, properties=["Hardness (eta)"], packed=True, fingerprint_store=path_store)
+    spy = mocker.spy(FingerprintsData, "compute_fingerprints")
+    second = FingerprintsData(path_csv, properties=["Softness (S)"], packed=True, fingerprint_store=path_store)
+    spy.assert_not_called()
+
+    assert torch.equal(first.labels, expected.labels)
+    assert torch.equal(second.labels, expected.get_labels("Softness (S)"))
+    assert second.dataframe.smiles.to_list() == expected.dataframe.smiles.to_list()
+    for data in (first, second):
+        assert torch.equal(data.dataset.fingerprints, expected.dataset.fingerprints)
+
+
 def test_torch_geometric_dataset():
     """Check that the torch_geometric dataset is loaded correctly."""
     data = TorchGeometricGraphData(PATH_CSV, properties=["Hardness (eta)"])
@@ -30,6 +90,44 @@ def test_dgl_dataset():
     data.create_data_loader()
 
 
+def test_dgl_dataset_in_chunks():
+    """Check that the graphs can be computed in chunks."""
+    data = DGLGraphData(PATH_CSV, properties=["Hardness (eta)"], chunksize=400)
+    assert len(data.molecular_graphs) == len(data.labels) == len(data.dataframe)
+    data.create_data_loader()
+
+
+def test_dgl_dataset_sanitized_chunk(tmp_path: Path):
+    """Check the graphs if all the molecules of a chunk are removed by the sanitization."""
+    path_csv = tmp_path / "data.csv"
+    df = pd.read_csv(PATH_CSV, index_col=0)[:10]
+    df.loc[:1, "smiles"] = "not_a_smiles"
+    df.to_csv(path_csv)
+
+    data = DGLGraphData(path_csv, properties=["Hardness (eta)"], chunksize=2)
+    assert len(data.molecular_graphs) == len(data.labels) == len(data.dataframe) == 8
+    reference = DGLGraphData(path_csv, properties=["Hardness (eta)"])
+    assert [g.num_nodes() for g in data.molecular_graphs] == [g.num_nodes() for g in reference.molecular_graphs]
+    assert all(torch.equal(g.ndata["x"], h.ndata["x"])
+               for g, h in zip(data.molecular_graphs, reference.molecular_graphs))
+
+
+@pytest.mark.parametrize("chunksize", [None, 2])
+@pytest.mark.parametrize("data_type", [FingerprintsData, DGLGraphData])
+def test_dataset_without_molecules(tmp_path: Path, data_type: type, chunksize: int):
+    """Check the error raised if the data is empty or all its molecules are removed by the sanitization."""
+    path_csv = tmp_path / "data.csv"
+    df = pd.read_csv(PATH_CSV, index_col=0)[:4]
+    df[:0].to_csv(path_csv)
+    with pytest.raises(RuntimeError, match="no valid molecules"):
+        data_type(path_csv, properties=["Hardness (eta)"], chunksize=chunksize)
+
+    df["smiles"] = "not_a_smiles"
+    df.to_csv(path_csv)
+    with pytest.raises(RuntimeError, match="no valid molecules"):
+        data_type(path_csv, properties=["Hardness (eta)"], chunksize=chunksize)
+
+
 def test_dataset_with_geometries():
     """Provide a Path with molecular geometries."""
     path_csv = PATH_TEST / "cdft_properties.csv"
@@ -38,3 +136,134 @@ def test_dataset_with_geometries():
     data = TorchGeometricGraphData(
         path_csv, properties=["Electrophilicity index (w=omega)"], file_geometries=path_geometries, sanitize=False)
     data.create_data_loader()
+
+
+def test_dataset_with_binary_geometries(tmp_path: Path):
+    """Convert the JSON geometries to the binary format and use them in a dataset."""
+    path_csv = PATH_TEST / "smiles.csv"
+    molecules = [Chem.AddHs(Chem.MolFromSmiles(s)) for s in pd.read_csv(path_csv)["smiles"]]
+    for mol in molecules:
+        AllChem.EmbedMolecule(mol, randomSeed=42)
+    path_json = tmp_path / "geometries.json"
+    with open(path_json, 'w') as handler:
+        json.dump([Chem.MolToPDBBlock(mol) for mol in molecules], handler)
+
+    path_geometries = tmp_path / "geometries"
+    convert_json_geometries(path_json, path_geometries)
+    expected = read_geometries_from_files(path_json)
+    stored = read_geometries_from_files(path_geometries)
+    for xs, ys in zip(expected[1], stored[1]):
+        assert np.array_equal(xs, ys)
+
+    data = DGLGraphData(path_csv, file_geometries=path_geometries, sanitize=False)
+    assert len(data.molecular_graphs) == len(molecules)
+    for graph, xyz in zip(data.molecular_graphs, expected[1]):
+        assert np.allclose(graph.ndata["x"].numpy(), xyz)
+
+
+def test_graph_store(tmp_path: Path, mocker, path_csv: Path):
+    """Check that the graphs are read from the memory-mapped store."""
+    properties = ["Hardness (eta)"]
+    path_store = tmp_path / "graphs"
+
+    expected = DGLGraphData(path_csv, properties=properties)
+    first = DGLGraphData(path_csv, properties=properties, graph_store=path_store)
+    spy = mocker.spy(SwanGraphData, "process_graph_features")
+    second = DGLGraphData(path_csv, properties=properties, graph_store=path_store)
+    spy.assert_not_called()
+
+    assert second.dataframe.smiles.to_list() == expected.dataframe.smiles.to_list()
+    assert torch.equal(second.labels, expected.labels)
+    for stored in (first, second):
+        assert len(stored.dataset) == len(expected.dataset)
+        for (graph, label), (ref, ref_label) in zip(stored.dataset, expected.dataset):
+            assert torch.equal(label, ref_label)
+            assert torch.equal(graph.ndata["f"], ref.ndata["f"])
+            assert torch.equal(graph.edata["w"], ref.edata["w"])
+
+    # The same store can be read by the torch geometric dataset
+    graphs = TorchGeometricGraphData(path_csv, properties=properties, graph_store=path_store)
+    assert torch.equal(graphs.dataset[3].x, expected.dataset[3][0].ndata["f"].squeeze(-1))
+
+    # And by the processes training other properties
+    other = DGLGraphData(path_csv, properties=["Softness (S)"], graph_store=path_store)
+    spy.assert_not_called()
+    assert torch.equal(other.labels, expected.get_labels("Softness (S)"))
+
+
+def test_batch_retrieval(tmp_path: Path, path_csv: Path):
+    """Check that the minibatches retrieved at once match the collated samples."""
+    properties = ["Hardness (eta)"]
+    indices = [3, 7, 0, 12]
+
+    fingerprints = FingerprintsData(path_csv, properties=properties, sanitize=False, packed=True)
+    x, y = fingerprints.dataset[indices]
+    assert torch.equal(x, torch.stack([fingerprints.dataset[i][0] for i in indices]))
+    assert torch.equal(y, fingerprints.labels[indices])
+
+    for graph_store in (None, tmp_path / "graphs"):
+        data = DGLGraphData(path_csv, properties=properties, graph_store=graph_store)
+        graph, labels = data.dataset[indices]
+        expected, expected_labels = collate_fn([data.dataset[i] for i in indices])
+        assert torch.equal(labels, expected_labels)
+        assert torch.equal(graph.batch_num_nodes(), expected.batch_num_nodes())
+        for name in ("x", "f"):
+            assert torch.equal(graph.ndata[name], expected.ndata[name])
+        assert torch.equal(torch.stack(graph.edges()), torch.stack(expected.edges()))
+
+        data = TorchGeometricGraphData(path_csv, properties=properties, graph_store=graph_store)
+        batch = data.dataset[indices]
+        expected = tg.data.Batch.from_data_list([data.dataset[i] for i in indices])
+        for name in ("x", "edge_attr", "edge_index", "positions", "y", "batch", "ptr"):
+            assert torch.equal(batch[name], expected[name])
+
+        data.create_data_loader(batch_size=8)
+        assert sum(len(x.ptr) - 1 for x in data.train_loader) == len(data.train_dataset)
+
+
+def test_loader_workers(tmp_path: Path, path_csv: Path):
+    """Check that the minibatches loaded by worker processes match those of the main process."""
+    properties = ["Hardness (eta)"]
+
+    data = TorchGeometricGraphData(path_csv, properties=properties, graph_store=tmp_path / "graphs")
+    expected = [batch.x for batch in data.create_prediction_loader(batch_size=8)]
+
+    # The workers map the same store instead of receiving a copy of the arrays
+    store = pickle.loads(pickle.dumps(data.molecular_graphs.store))
+    assert store.data["atomic_features"].filename == data.molecular_graphs.store.data["atomic_features"].filename
+
+    data.set_loader_options(num_workers=2, prefetch_factor=2, persistent_workers=True)
+    loader = data.create_prediction_loader(batch_size=8)
+    assert loader.num_workers == 2 and loader.persistent_workers
+    for batch, ref in zip(loader, expected):
+        assert torch.equal(batch.x, ref)
+
+    with pytest.raises(RuntimeError):
+        data.create_data_loader(batch_size=8, persistent_workers=True)
+
+
+def test_lazy_graphs(path_csv: Path):
+    """Check that the graphs built on demand match the ones computed upfront."""
+    properties = ["Hardness (eta)"]
+
+    expected = DGLGraphData(path_csv, properties=properties)
+    data = DGLGraphData(path_csv, properties=properties, lazy=True, graph_cache_size=4)
+    graphs = data.molecular_graphs
+    assert len(graphs.cache) == 0
+    for key, sizes in expected.graph_sizes.items():
+        assert np.array_equal(data.graph_sizes[key], sizes)
+
+    for (graph, label), (ref, ref_label) in zip(data.dataset, expected.dataset):
+        assert torch.equal(label, ref_label)
+        for name in ("x", "f"):
+            assert torch.equal(graph.ndata[name], ref.ndata[name])
+        assert torch.equal(graph.edata["w"], ref.edata["w"])
+    assert list(graphs.cache) == [16, 17, 18, 19]
+
+    # The most recently used graphs are kept
+    assert graphs[17] is graphs[17]
+    graphs[0]
+    assert list(graphs.cache) == [18, 19, 17, 0]
+
+    data.create_data_loader(batch_size=8)
+    assert sum(len(y) for _, y in data.train_loader) == len(data.train_dataset)
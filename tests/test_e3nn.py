@@ -1,11 +1,13 @@
 """Test the interface to the e3nn library."""
 
 import numpy as np
+import pytest
 import torch
 
 from swan.dataset import TorchGeometricGraphData
 from swan.modeller import TorchModeller
 from swan.modeller.models import InvariantPolynomial
+from swan.modeller.models.equivariant_models import EdgeEmbedding
 
 from .utils_test import PATH_TEST, remove_files
 
@@ -23,3 +25,24 @@ def test_e3nn_equivariant():
     expected, predicted = modeller.validate_model()
     assert not all(np.isnan(x).all() for x in (expected, predicted))
     remove_files()
+
+
+def test_e3nn_precomputed():
+    """Check that the precomputed edge embedding gives the same predictions."""
+    path_data = PATH_TEST / "thousand.csv"
+    data = TorchGeometricGraphData(path_data, properties=["Hardness (eta)"])
+    batch = data.dataset[list(range(32))]
+
+    torch.manual_seed(42)
+    net = InvariantPolynomial()
+    expected = net(batch)
+
+    data.apply_transform(EdgeEmbedding())
+    net.precomputed = True
+    with pytest.raises(RuntimeError):
+        net(batch)
+    assert torch.allclose(net(data.dataset[list(range(32))]), expected, atol=1e-6)
+
+    modeller = TorchModeller(net, data, replace_state=True)
+    modeller.train_model(nepoch=1, batch_size=64)
+    remove_files()
@@ -0,0 +1,88 @@
+"""Test the training of several replicas at once."""
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from swan.dataset import FingerprintsData
+from swan.modeller import EnsembleModeller, TorchModeller
+from swan.modeller.models import FingerprintEnsemble, FingerprintFullyConnected
+
+from .utils_test import remove_files
+
+SEEDS = [3, 5, 7]
+
+
+def create_data(path_csv: Path) -> FingerprintsData:
+    """Read the test data and scale its labels."""
+    data = FingerprintsData(path_csv, properties=["Hardness (eta)"], sanitize=False)
+    data.scale_labels()
+    return data
+
+
+def train(modeller: TorchModeller) -> None:
+    """Train the model with the same split of the data."""
+    modeller.set_optimizer("Adam", lr=0.001)
+    modeller.set_scheduler(None)
+    modeller.workdir = modeller.data.workdir
+    np.random.seed(42)
+    modeller.train_model(nepoch=3, batch_size=32)
+
+
+def test_ensemble_replicas(tmp_path: Path, make_csv):
+    """Check that each replica is trained as the model trained on its own."""
+    data = create_data(make_csv(200))
+    data.workdir = tmp_path
+    ensemble = EnsembleModeller(FingerprintEnsemble(len(SEEDS), seeds=SEEDS), data, replace_state=True)
+    train(ensemble)
+    predicted, expected = ensemble.validate_model()
+    assert predicted.shape == (len(data.valid_dataset), len(SEEDS), 1)
+    assert expected.shape == (len(data.valid_dataset), 1)
+
+    for i, seed in enumerate(SEEDS):
+        torch.manual_seed(seed)
+        single = TorchModeller(FingerprintFullyConnected(), data, replace_state=True)
+        train(single)
+        for name, weight in single.network.state_dict().items():
+            assert torch.allclose(ensemble.network.replica_state_dict(i)[name], weight, atol=1e-5)
+
+        # The checkpoint of each replica can be loaded by a single model
+        model = TorchModeller(FingerprintFullyConnected(), data)
+        model.set_optimizer("Adam", lr=0.001)
+        model.load_model(tmp_path / f"swan_chk_{i}.pt")
+    remove_files()
+
+
+def test_ensemble_early_stopping(tmp_path: Path, make_csv):
+    """Check that the replicas that stop early are not updated anymore."""
+    data = create_data(make_csv(200))
+    data.workdir = tmp_path
+    ensemble = EnsembleModeller(FingerprintEnsemble(len(SEEDS), seeds=SEEDS), data, replace_state=True)
+    ensemble.stopped[1] = True
+    frozen = ensemble.network.replica_state_dict(1)
+    train(ensemble)
+    for name, weight in ensemble.network.replica_state_dict(1).items():
+        assert torch.equal(weight, frozen[name])
+        assert not torch.equal(ensemble.network.replica_state_dict(0)[name], weight)
+    remove_files()
+
+
+def test_ensemble_stopped_optimizer_state(make_csv):
+    """Check that the optimizer state of the replicas that stop early is not updated."""
+    data = create_data(make_csv(50))
+    ensemble = EnsembleModeller(FingerprintEnsemble(len(SEEDS), seeds=SEEDS), data, replace_state=True)
+    ensemble.set_optimizer("Adam", lr=0.001)
+    assert ensemble.optimizer.defaults.get("foreach", True)
+    inp_data, ground_truth = data.dataset[list(range(32))]
+    ensemble.train_batch(inp_data, ground_truth)
+
+    ensemble.stopped[1] = True
+    frozen = [x[1].clone() for x in ensemble.replica_tensors()]
+    for _ in range(2):
+        ensemble.train_batch(inp_data, ground_truth)
+    tensors = ensemble.replica_tensors()
+    assert len(tensors) == 3 * len(ensemble.network.weights)
+    for tensor, old in zip(tensors, frozen):
+        assert torch.equal(tensor[1], old)
+        assert not torch.equal(tensor[0], tensor[1])
+    remove_files()
@@ -1,11 +1,21 @@
 """Test the features generation functionality."""
 
+from pathlib import Path
+
 import numpy as np
+import pandas as pd
+import pytest
 from rdkit import Chem
 from rdkit.Chem import AllChem
 
 from swan.dataset.features.featurizer import (compute_molecular_graph_edges,
-                                              generate_molecular_features)
+                                              generate_fingerprints,
+                                              generate_molecular_features,
+                                              generate_molecular_features_batch)
+
+from swan.dataset.features.atomic_features import ELEMENT_TABLE, read_element_table, write_element_table
+
+from .utils_test import PATH_TEST
 
 MOL = Chem.MolFromSmiles("CC(=O)O")
 AllChem.EmbedMolecule(MOL)
@@ -34,3 +44,55 @@ def test_molecular_graph():
     expected = np.array([[0, 1, 1, 2, 1, 3], [1, 0, 2, 1, 3, 1]], dtype=int)
 
     assert np.all(graph == expected)
+
+
+def test_parallel_fingerprints():
+    """Check that the fingerprints computed in parallel match the serial ones."""
+    smiles = ["CC(=O)O", "OC(=O)c1cc(Cl)cs1", "OC(=O)Cc1cccc(Br)c1F", "CCCN", "c1ccccc1O"]
+    molecules = pd.Series([Chem.MolFromSmiles(s) for s in smiles])
+
+    serial = generate_fingerprints(molecules, "atompair", 2048)
+    parallel = generate_fingerprints(molecules, "atompair", 2048, nworkers=2, chunksize=2)
+
+    assert parallel.shape == (len(smiles), 2048)
+    assert np.array_equal(serial, parallel)
+
+
+def test_fingerprint_types_in_one_pass():
+    """Check the concatenation of several fingerprints and the count-based fingerprints."""
+    molecules = pd.Series([MOL, Chem.MolFromSmiles("OC(=O)c1cc(Cl)cs1")])
+    morgan = generate_fingerprints(molecules, "morgan", 1024)
+    torsion = generate_fingerprints(molecules, "torsion", 1024)
+    both = generate_fingerprints(molecules, ["morgan", "torsion"], 1024)
+    assert np.array_equal(both, np.hstack((morgan, torsion)))
+
+    counts = generate_fingerprints(molecules, "morgan", 1024, count=True)
+    assert np.array_equal(counts > 0, morgan > 0)
+    assert counts.max() > 1
+
+
+def test_batch_molecular_features():
+    """Check that the batched features are identical to the features of each molecule."""
+    smiles = pd.read_csv(PATH_TEST / "thousand.csv")["smiles"][:100]
+    molecules = [Chem.AddHs(Chem.MolFromSmiles(s)) for s in smiles]
+    for mol in molecules:
+        AllChem.EmbedMolecule(mol, randomSeed=42)
+
+    batch = generate_molecular_features_batch(molecules)
+    for k, mol in enumerate(molecules):
+        atomic, bond = generate_molecular_features(mol)
+        assert np.array_equal(batch["atomic_features"][k], atomic)
+        assert np.array_equal(batch["bond_features"][k], bond)
+        assert np.array_equal(batch["edges"][k], compute_molecular_graph_edges(mol).T)
+
+
+def test_element_table(tmp_path: Path):
+    """Check that the shipped element table matches the one generated with mendeleev."""
+    pytest.importorskip("mendeleev")
+    path = tmp_path / "elements.csv"
+    write_element_table(path)
+    expected = read_element_table(ELEMENT_TABLE)
+    table = read_element_table(path)
+    assert table.keys() == expected.keys()
+    for symbol, values in table.items():
+        assert np.array_equal(values, expected[symbol], equal_nan=True)
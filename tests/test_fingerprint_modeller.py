@@ -1,4 +1,5 @@
 import unittest
+import unittest.mock
 import numpy as np
 import torch
 from swan.modeller import TorchModeller
@@ -29,3 +30,54 @@ class TestFingerprintModeller(unittest.TestCase):
         predicted = self.modeller.data.transformer.inverse_transform(predicted.detach().numpy())
 
         assert len(predicted) == fingerprints.shape[0]
+
+    def test_mixed_precision(self):
+        """Check the training with bfloat16 autocast, keeping the weights in float32."""
+        with self.assertRaises(RuntimeError):
+            self.modeller.set_mixed_precision(torch.int8)
+        self.modeller.set_mixed_precision("bfloat16")
+        self.modeller.data.scale_labels()
+        self.modeller.train_model(nepoch=2, batch_size=64)
+        assert all(x.dtype == torch.float32 for x in self.net.parameters())
+
+        predicted = self.modeller.predict(self.modeller.data.fingerprints)
+        assert predicted.dtype == torch.float32
+        assert torch.isfinite(predicted).all()
+        remove_files()
+
+    def test_without_autocast(self):
+        """Check that the modeller does not need autocast unless mixed precision is enabled."""
+        autocast = torch.autocast
+        del torch.autocast
+        try:
+            with self.assertRaises(RuntimeError):
+                self.modeller.set_mixed_precision()
+            predicted = self.modeller.predict(self.modeller.data.fingerprints)
+        finally:
+            torch.autocast = autocast
+        assert torch.isfinite(predicted).all()
+
+    def test_compile(self):
+        """Check the training with the compiled network."""
+        self.modeller.set_compile(backend="eager")
+        self.modeller.data.scale_labels()
+        self.modeller.train_model(nepoch=2, batch_size=64)
+        assert self.modeller.compiled_network is not None
+
+        fingerprints = self.modeller.data.fingerprints
+        with torch.no_grad():
+            expected = self.net(fingerprints)
+        assert torch.allclose(self.modeller.predict(fingerprints), expected, atol=1e-6)
+        remove_files()
+
+    def test_compile_fallback(self):
+        """Check that the network runs eagerly if it cannot be compiled."""
+        def fail(inp_data):
+            raise RuntimeError("unsupported operator")
+
+        with unittest.mock.patch("torch.compile", return_value=fail):
+            self.modeller.set_compile()
+        with self.assertLogs("swan.modeller.torch_modeller", level="WARNING"):
+            predicted = self.modeller.predict(self.modeller.data.fingerprints)
+        assert self.modeller.compiled_network is None
+        assert torch.isfinite(predicted).all()
@@ -0,0 +1,36 @@
+"""Test the computation of the molecular geometries."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+from swan.dataset import geometry
+from swan.dataset.geometry import close_geometry_pool, guess_positions
+
+from .utils_test import PATH_TEST
+
+
+@pytest.mark.parametrize("shared", [True, False])
+def test_guess_positions(mocker, shared: bool):
+    """Check that the parallel optimization gives the same geometries as the serial one."""
+    if not shared:
+        # Exchange the coordinates through a memory-mapped file, as in Python 3.7
+        mocker.patch.object(geometry, "shared_memory", None)
+    smiles = pd.read_csv(PATH_TEST / "thousand.csv")["smiles"][:80]
+    molecules = [Chem.AddHs(Chem.MolFromSmiles(s)) for s in smiles]
+    for mol in molecules:
+        AllChem.EmbedMolecule(mol, randomSeed=42)
+
+    # The workers must be started after patching the module
+    close_geometry_pool()
+    try:
+        for force_field in ("uff", "mmff"):
+            serial = guess_positions(molecules, True, force_field=force_field, nworkers=1)
+            parallel = guess_positions(molecules, True, force_field=force_field, nworkers=2)
+            for mol, xs, ys in zip(molecules, serial, parallel):
+                assert xs.shape == (mol.GetNumAtoms(), 3)
+                assert np.allclose(xs, ys)
+    finally:
+        close_geometry_pool()
@@ -0,0 +1,23 @@
+"""Check that the backends are only imported when they are used."""
+
+import subprocess
+import sys
+
+import swan
+
+BACKENDS = ("dgl", "torch_geometric", "e3nn", "equivariant_attention", "gpytorch", "mendeleev")
+
+
+def test_fingerprints_import():
+    """Check that the fingerprints do not load the graph and GP backends."""
+    statement = ("import sys; import swan; from swan.dataset import FingerprintsData; "
+                 f"print(' '.join(m for m in {BACKENDS} if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", statement], stdout=subprocess.PIPE, check=True)
+    assert out.stdout.decode().strip() == ""
+
+
+def test_lazy_attributes():
+    """Check that the public API is imported on first use."""
+    assert "FingerprintsData" in dir(swan)
+    assert swan.DGLGraphData.__name__ == "DGLGraphData"
+    assert swan.dataset.DGLGraphData is swan.DGLGraphData
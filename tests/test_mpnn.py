@@ -1,4 +1,5 @@
 import unittest
+import unittest.mock
 
 import numpy as np
 import torch
@@ -35,3 +36,21 @@ class TestMPNN(unittest.TestCase):
 
         predicted = self.modeller.predict(item)
         assert len(graphs) == len(predicted)
+
+    def test_budget_batches(self):
+        """Train and predict using minibatches with a maximum number of atoms."""
+        self.data.set_batch_budget(800, bucket_size=128, shuffle=True)
+        self.modeller.train_model(nepoch=1)
+        predicted = self.modeller.predict(self.data.create_prediction_loader())
+        assert len(predicted) == len(self.data.dataset)
+        remove_files()
+
+    def test_cached_batches(self):
+        """Collate the minibatches of the first epoch and reuse them afterwards."""
+        self.modeller.set_batch_cache(validation=True, training=True)
+        with unittest.mock.patch.object(self.data, "get_item", wraps=self.data.get_item) as spy:
+            self.modeller.train_model(nepoch=3, batch_size=64)
+        nbatches = len(self.data.train_loader) + len(self.data.valid_loader)
+        assert spy.call_count == nbatches
+        assert set(self.modeller.cached_batches) == {"train", "valid"}
+        remove_files()
@@ -0,0 +1,22 @@
+"""Test the samplers grouping the molecules into minibatches."""
+
+import numpy as np
+
+from swan.dataset.samplers import BudgetBatchSampler
+
+
+def test_budget_batches():
+    """Check that the minibatches respect the budget and contain every sample once."""
+    sizes = np.random.default_rng(42).integers(5, 60, size=200)
+    sizes[7] = 150  # larger than the budget
+    for options in ({}, {"shuffle": True}, {"shuffle": True, "bucket_size": 50}):
+        sampler = BudgetBatchSampler(sizes, 100, seed=1, **options)
+        nbatches = len(sampler)
+        batches = list(sampler)
+        assert len(batches) == nbatches
+        assert sorted(np.concatenate(batches).tolist()) == list(range(len(sizes)))
+        assert all(sizes[b].sum() <= 100 or len(b) == 1 for b in batches)
+
+    # Without shuffling the samples keep their order
+    batches = list(BudgetBatchSampler(sizes, 100))
+    assert np.concatenate(batches).tolist() == list(range(len(sizes)))
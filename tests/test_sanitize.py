@@ -0,0 +1,47 @@
+"""Test the sanitization of the molecules."""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from rdkit.Chem import PandasTools
+
+from swan.dataset import DGLGraphData, FingerprintsData
+from swan.dataset.sanitize_data import sanitize_data
+
+from .utils_test import PATH_TEST
+
+
+def read_molecules() -> pd.DataFrame:
+    """Read some molecules together with an invalid entry."""
+    df = pd.read_csv(PATH_TEST / "smiles.csv")
+    df.loc[len(df)] = ["C1CC"]
+    PandasTools.AddMoleculeColumnToFrame(df, smilesCol="smiles", molCol="molecules")
+    return df
+
+
+def test_parallel_sanitize():
+    """Check that the conformers do not depend on the number of workers."""
+    serial = sanitize_data(read_molecules())
+    parallel = sanitize_data(read_molecules(), nworkers=2)
+
+    assert len(serial) == len(parallel) == 10
+    for mol1, mol2 in zip(serial["molecules"], parallel["molecules"]):
+        assert np.allclose(mol1.GetConformer().GetPositions(), mol2.GetConformer().GetPositions())
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_sanitize_options(tmp_path: Path, mocker, path_csv: Path, cache: bool):
+    """Check that the options of the sanitization are passed to it."""
+    spy = mocker.patch("swan.dataset.swan_data_base.sanitize_data", side_effect=sanitize_data)
+    cache_dir = tmp_path / "cache" if cache else None
+    options = {"max_iterations": 10, "timeout": 5, "random_seed": 7}
+    FingerprintsData(path_csv, properties=["Hardness (eta)"], sanitize_options=options, cache_dir=cache_dir)
+    DGLGraphData(path_csv, properties=["Hardness (eta)"], sanitize_options=options, cache_dir=cache_dir)
+    assert spy.call_count == 2
+    for call in spy.call_args_list:
+        assert call.kwargs == dict(options, nworkers=1)
+
+    with pytest.raises(TypeError):
+        FingerprintsData(path_csv, properties=["Hardness (eta)"], sanitize_options={"seed": 7})
@@ -1,3 +1,4 @@
+import dgl
 import numpy as np
 import torch
 
@@ -5,6 +6,7 @@ from swan.dataset import DGLGraphData
 from swan.dataset.dgl_graph_data import dgl_data_loader
 from swan.modeller import TorchModeller
 from swan.modeller.models import TFN, SE3Transformer
+from swan.modeller.models.se3_transformer import get_basis, get_basis_and_r, precompute_basis
 
 from .utils_test import PATH_TEST, remove_files
 
@@ -58,3 +60,23 @@ def test_se3Transformer_predict():
     predicted = DATA.transformer.inverse_transform(predicted.detach().numpy())
 
     assert len(graphs) == len(predicted)
+
+
+def test_precomputed_basis(path_csv):
+    """Check that the stored basis is batched with the graphs and used by the models."""
+    data = DGLGraphData(path_csv, properties=["Hardness (eta)"], optimize_molecule=True)
+    num_degrees = 3
+    precompute_basis(data.molecular_graphs, num_degrees, chunksize=8)
+
+    batch = dgl.batch(data.molecular_graphs[3:9])
+    basis, r = get_basis(batch, num_degrees)
+    expected_basis, expected_r = get_basis_and_r(batch, num_degrees - 1)
+    assert torch.allclose(r, expected_r)
+    assert set(basis) == set(expected_basis)
+    for key, tensor in expected_basis.items():
+        assert torch.allclose(basis[key], tensor, atol=1e-6)
+
+    net = TFN(NUM_LAYERS, NUM_CHANNELS, num_degrees=num_degrees)
+    modeller = TorchModeller(net, data, use_cuda=False, replace_state=True)
+    modeller.train_model(nepoch=1, batch_size=8)
+    remove_files()
@@ -0,0 +1,97 @@
+"""Test the training from sharded fingerprints."""
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+
+from swan.dataset import FingerprintsData, ShardedFingerprintsData, write_fingerprint_shards
+from swan.dataset.sharded_data import ShardedDataset
+from swan.modeller import TorchModeller
+from swan.modeller.models import FingerprintFullyConnected
+
+from .utils_test import remove_files
+
+PROPERTIES = ["Hardness (eta)"]
+
+
+@pytest.fixture
+def path_shards(tmp_path: Path, make_csv) -> Path:
+    """Write the fingerprints of the first 100 rows of the test data in shards of 30 rows."""
+    path_shards = tmp_path / "shards"
+    write_fingerprint_shards(make_csv(100), path_shards, PROPERTIES, shard_size=30, sanitize=False)
+    return path_shards
+
+
+def test_shards(tmp_path: Path, path_shards: Path):
+    """Check that the shards contain the same fingerprints as the in-memory dataset."""
+    expected = FingerprintsData(tmp_path / "data.csv", properties=PROPERTIES, sanitize=False)
+    data = ShardedFingerprintsData(path_shards)
+    assert len(data.shards) == 4
+    assert torch.equal(data.labels[:], expected.labels)
+    rows = [95, 3, 40, 3]
+    assert torch.equal(data.labels[rows], expected.labels[rows])
+    assert data.smiles[rows].tolist() == expected.dataframe.smiles[rows].tolist()
+
+    fingerprints, labels = map(torch.cat, zip(*data.create_prediction_loader(batch_size=16)))
+    assert torch.equal(fingerprints, expected.fingerprints)
+    assert torch.equal(labels, expected.labels)
+
+
+def test_shuffle_buffer(path_shards: Path):
+    """Check that every row is yielded once per epoch, in a different order for each epoch."""
+    data = ShardedFingerprintsData(path_shards)
+    dataset = ShardedDataset(data.shards, batch_size=8, shuffle=True, buffer_size=20, seed=3)
+
+    orders = []
+    for epoch in range(2):
+        dataset.set_epoch(epoch)
+        batches = list(dataset)
+        assert all(len(y) == 8 for _, y in batches[:-1])
+        labels = torch.cat([y for _, y in batches]).flatten()
+        assert torch.equal(labels.sort().values, data.labels[:].flatten().sort().values)
+        orders.append(labels)
+    assert not torch.equal(*orders)
+
+    # The same seed and epoch give the same order
+    assert torch.equal(torch.cat([y for _, y in dataset]).flatten(), orders[1])
+
+
+def test_worker_sharding(path_shards: Path):
+    """Check that the workers read disjoint shards covering the whole data."""
+    data = ShardedFingerprintsData(path_shards)
+    dataset = ShardedDataset(data.shards, batch_size=8, shuffle=True, buffer_size=20)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=None, num_workers=2)
+    labels = torch.cat([y for _, y in loader]).flatten()
+    assert torch.equal(labels.sort().values, data.labels[:].flatten().sort().values)
+
+
+def test_train_sharded(path_shards: Path):
+    """Train a model reading the fingerprints from the shards."""
+    data = ShardedFingerprintsData(path_shards)
+    data.scale_labels()
+    modeller = TorchModeller(FingerprintFullyConnected(), data, replace_state=True)
+    modeller.train_model(nepoch=2, batch_size=16)
+    expected, predicted = modeller.validate_model()
+    assert len(expected) == len(data.valid_dataset) < len(data.train_dataset)
+    assert not np.isnan(predicted).all()
+    remove_files()
+
+
+def test_scale_sharded(path_shards: Path):
+    """Check that the scaling of the labels fitted on a sample is applied when they are read."""
+    data = ShardedFingerprintsData(path_shards)
+    unscaled = data.labels[:]
+    data.scale_labels(sample_size=50)
+    assert data.transformer.center_.shape == (1,)
+    assert np.allclose(data.labels[:].numpy(), data.transformer.transform(unscaled.numpy()))
+    remove_files()
+
+
+def test_single_shard(tmp_path: Path, make_csv):
+    """Check that a single shard cannot be split into a training and a validation set."""
+    path_shards = tmp_path / "shards"
+    write_fingerprint_shards(make_csv(20), path_shards, PROPERTIES, sanitize=False)
+    data = ShardedFingerprintsData(path_shards)
+    with pytest.raises(RuntimeError):
+        data.create_data_loader()